@@ -0,0 +1,116 @@
+"""
+Envelope packing vs. one Pub/Sub message per event.
+
+Pushes ~200-byte events through EnvelopePacker at several pack sizes and
+reports the local CPU throughput (events/s packed, and unpacked on the
+subscriber side) together with the Pub/Sub messages and billed bytes
+needed per 10,000 events.
+
+Billed bytes follow Pub/Sub's pricing model: each message counts its
+data, attribute keys and values and 20 bytes of metadata, and each
+publish request counts at least 1000 bytes. The client library sends up
+to 100 messages (or 1 MB) per request, as in the default batch preset.
+
+Usage:
+    python benchmarks/bench_envelope.py [events]
+"""
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import Future
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'src', 'functions', 'data_validator'))
+
+from envelope import EnvelopePacker, unpack  # noqa: E402
+
+ATTRIBUTES = {'event_type': 'user', 'schema_version': '1', 'content_encoding': 'identity'}
+MESSAGE_OVERHEAD = 20
+MIN_REQUEST_BYTES = 1000
+REQUEST_MAX_MESSAGES = 100
+REQUEST_MAX_BYTES = 1000 * 1000
+
+
+class CountingPublisher:
+    """Completes every publish at once and records message sizes."""
+
+    def __init__(self):
+        self.sizes = []
+        self.messages = []
+
+    def publish(self, topic, data, **attributes):
+        attribute_bytes = sum(len(k) + len(v) for k, v in attributes.items())
+        self.sizes.append(len(data) + MESSAGE_OVERHEAD + attribute_bytes)
+        self.messages.append(data)
+        future = Future()
+        future.set_result('message-id')
+        return future
+
+
+def billed_bytes(sizes):
+    """Bytes billed for messages sent in client-library-sized requests."""
+    total = request_bytes = request_messages = 0
+    for size in sizes:
+        if request_messages == REQUEST_MAX_MESSAGES or request_bytes + size > REQUEST_MAX_BYTES:
+            total += max(request_bytes, MIN_REQUEST_BYTES)
+            request_bytes = request_messages = 0
+        request_bytes += size
+        request_messages += 1
+    return total + (max(request_bytes, MIN_REQUEST_BYTES) if request_messages else 0)
+
+
+def make_events(count):
+    rng = random.Random(3)
+    return [json.dumps({
+        'name': f'User {i}', 'email': f'user{i}@example.com', 'age': rng.randint(18, 90),
+        'address': {'street': f'{rng.randint(1, 999)} Main St', 'city': 'Springfield',
+                    'state': 'IL', 'zip': f'{rng.randint(10000, 99999)}'},
+        'event_type': 'user'
+    }, separators=(',', ':')).encode() for i in range(count)]
+
+
+def run(events, max_events):
+    publisher = CountingPublisher()
+    started = time.perf_counter()
+    if max_events == 1:
+        for data in events:
+            publisher.publish('topic', data, **ATTRIBUTES)
+    else:
+        packer = EnvelopePacker(publisher.publish, max_events=max_events, max_latency=60)
+        for data in events:
+            packer.add('topic', data, ATTRIBUTES)
+        packer.flush()
+    pack_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    unpacked = 0
+    for data in publisher.messages:
+        if max_events == 1:
+            unpacked += 1
+        else:
+            unpacked += sum(1 for _ in unpack(data))
+    unpack_seconds = time.perf_counter() - started
+    assert unpacked == len(events)
+    return publisher.sizes, pack_seconds, unpack_seconds
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    events = make_events(count)
+    average = sum(map(len, events)) / count
+    per = 10000 / count
+    print(f"{count:,} events, {average:.0f} bytes each on average\n")
+    print(f"{'events/message':<16}{'messages':>10}{'billed KB':>11}"
+          f"{'pack ev/s':>13}{'unpack ev/s':>14}   (messages and KB per 10k events)")
+    for max_events in (1, 10, 50, 100, 500):
+        sizes, pack_seconds, unpack_seconds = run(events, max_events)
+        unpack_rate = f'{count / unpack_seconds:>14,.0f}' if max_events > 1 else f"{'-':>14}"
+        billed_kb = billed_bytes(sizes) * per / 1000
+        print(f"{max_events:<16}{len(sizes) * per:>10,.0f}{billed_kb:>11,.0f}"
+              f"{count / pack_seconds:>13,.0f}{unpack_rate}")
+
+
+if __name__ == '__main__':
+    main()
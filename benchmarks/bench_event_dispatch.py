@@ -0,0 +1,136 @@
+"""
+Mixed event-type traffic: schema dispatch table vs. an if/elif chain.
+
+Registers synthetic event types alongside any from EVENT_SCHEMAS_FILE, then times
+check_event from main.py (dict lookup to a compiled validator, ISO 8601
+fast path) against the usual hand-rolled version: an if/elif chain on
+event_type that walks the schema dict for every request and parses the
+timestamp with strptime. Traffic is spread evenly over all types, so the
+chain's average depth grows with the number of types.
+
+Usage:
+    python benchmarks/bench_event_dispatch.py [event types] [events]
+"""
+import os
+import random
+import re
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import main  # noqa: E402
+from schema import compile_schema  # noqa: E402
+
+TIMESTAMP_FORMATS = ('%Y-%m-%dT%H:%M:%S.%f%z', '%Y-%m-%dT%H:%M:%S%z', '%Y-%m-%dT%H:%M:%S')
+TYPE_CHECKS = {'string': str, 'integer': int, 'number': (int, float)}
+
+
+def synthetic_schemas(count):
+    schemas = dict(main.EVENT_DATA_SCHEMAS)
+    for i in range(count - len(schemas)):
+        schemas[f'synthetic.event_{i:03d}'] = {
+            'type': 'object',
+            'required': ['id', 'value'],
+            'properties': {
+                'id': {'type': 'string', 'minLength': 1},
+                'value': {'type': 'number', 'minimum': 0},
+                'code': {'type': 'string', 'pattern': r'^[A-Z]{2}-\d+$'}
+            }
+        }
+    return schemas
+
+
+def sample_data(event_type):
+    return {'id': 'x1', 'value': 4.5, 'code': 'AB-12'}
+
+
+def make_events(event_types, count):
+    rng = random.Random(42)
+    stamps = ['2024-05-01T12:30:45Z', '2024-05-01T12:30:45.123456+00:00',
+              '2024-05-01T12:30:45']
+    return [{
+        'event_id': f'evt-{i}',
+        'timestamp': rng.choice(stamps),
+        'event_type': event_type,
+        'data': sample_data(event_type)
+    } for i, event_type in enumerate(rng.choice(event_types) for _ in range(count))]
+
+
+def interpret(schema, data):  # noqa: C901
+    """Walk the schema dict on every call, as an uncompiled validator does."""
+    if not isinstance(data, dict):
+        return 'Expected a JSON object'
+    for field in schema['required']:
+        if field not in data:
+            return f'{field} is required'
+    for field, spec in schema['properties'].items():
+        if field not in data:
+            continue
+        value = data[field]
+        if not isinstance(value, TYPE_CHECKS[spec['type']]):
+            return f'{field} has the wrong type'
+        if 'minLength' in spec and len(value) < spec['minLength']:
+            return f'{field} is too short'
+        if 'pattern' in spec and not re.search(spec['pattern'], value):
+            return f'{field} format is invalid'
+        if 'minimum' in spec and value < spec['minimum']:
+            return f'{field} is too small'
+        if 'exclusiveMinimum' in spec and value <= spec['exclusiveMinimum']:
+            return f'{field} is too small'
+    return None
+
+
+def strptime_timestamp(value):
+    value = value.replace('Z', '+0000')
+    for fmt in TIMESTAMP_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+    return None
+
+
+def build_chain(schemas):
+    """Generate the if/elif chain a hand-written validator would contain."""
+    lines = ['def check_chain(event):',
+             "    if strptime_timestamp(event['timestamp']) is None:",
+             "        return 'timestamp must be an ISO 8601 date-time'",
+             "    event_type = event['event_type']"]
+    for i, event_type in enumerate(schemas):
+        keyword = 'if' if i == 0 else 'elif'
+        lines += [f'    {keyword} event_type == {event_type!r}:',
+                  f'        return interpret(SCHEMAS[{event_type!r}], event["data"])']
+    lines.append('    return None')
+    namespace = {'strptime_timestamp': strptime_timestamp, 'interpret': interpret,
+                 'SCHEMAS': schemas}
+    exec('\n'.join(lines), namespace)
+    return namespace['check_chain']
+
+
+def run(check, events):
+    started = time.perf_counter()
+    errors = sum(1 for event in events if check(event) is not None)
+    return (time.perf_counter() - started) / len(events), errors
+
+
+def run_benchmark():
+    type_count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    event_count = int(sys.argv[2]) if len(sys.argv) > 2 else 200000
+    schemas = synthetic_schemas(type_count)
+    main.EVENT_VALIDATORS.update(
+        {event_type: compile_schema(schema) for event_type, schema in schemas.items()})
+    events = make_events(list(schemas), event_count)
+    paths = [('if/elif + strptime', build_chain(schemas)),
+             ('dispatch table', main.check_event)]
+
+    print(f"{len(schemas)} event types, {event_count:,} events\n")
+    print(f"{'path':<22}{'us/event':>10}{'events/s':>12}  errors")
+    for name, check in paths:
+        best = min(run(check, events) for _ in range(3))
+        print(f"{name:<22}{best[0] * 1e6:>10.2f}{1 / best[0]:>12,.0f}  {best[1]}")
+
+
+if __name__ == '__main__':
+    run_benchmark()
@@ -0,0 +1,151 @@
+"""
+Frontend concurrency: gunicorn gthread (the default) vs. the async server.
+
+Starts the frontend both ways, as the Dockerfile does, against a local
+stand-in validator that answers every call after a fixed delay standing
+in for the Cloud Function. For each concurrency level, that many clients
+submit at once, each sending its requests back to back. With gthread, GUNICORN_THREADS
+submissions wait on the validator at once and the rest queue; the async
+server waits on all of them together. Everything shares one machine, so
+keep the delay well above the per-request CPU cost or the comparison
+measures CPU instead of waiting.
+
+Needs gunicorn, uvicorn, aiohttp and asgiref (src/frontend/requirements.txt).
+
+Usage:
+    python benchmarks/bench_frontend_async.py [validator delay ms] [requests per client]
+"""
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import aiohttp
+
+FRONTEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'frontend')
+EVENT = {'name': 'Jane Doe', 'email': 'jane@example.com', 'age': 34}
+THREADS = 8
+
+
+async def handle_validator(reader, writer, delay):
+    """Keep-alive HTTP/1.1 stand-in for the Cloud Function."""
+    try:
+        while True:
+            head = await reader.readuntil(b'\r\n\r\n')
+            length = 0
+            for line in head.split(b'\r\n'):
+                name, _, value = line.partition(b':')
+                if name.strip().lower() == b'content-length':
+                    length = int(value)
+            data = json.loads(await reader.readexactly(length))
+            await asyncio.sleep(delay)
+            body = json.dumps({'message': 'Data validated and published successfully',
+                               'code': 'SUCCESS', 'data': data}).encode()
+            writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n'
+                         b'Content-Length: %d\r\n\r\n%s' % (len(body), body))
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        writer.close()
+
+
+def start_validator(delay):
+    ready = threading.Event()
+    state = {}
+
+    async def serve():
+        server = await asyncio.start_server(
+            lambda r, w: handle_validator(r, w, delay), '127.0.0.1', 0, backlog=4096)
+        state['port'] = server.sockets[0].getsockname()[1]
+        ready.set()
+        await server.serve_forever()
+    threading.Thread(target=lambda: asyncio.run(serve()), daemon=True).start()
+    ready.wait()
+    return f"http://127.0.0.1:{state['port']}/"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_frontend(mode, validator_url):
+    port = free_port()
+    if mode == 'gthread':
+        command = ['gunicorn', '--bind', f'127.0.0.1:{port}', '--workers', '1',
+                   '--threads', str(THREADS), '--timeout', '0', '--backlog', '4096', 'app:app']
+    else:
+        command = ['uvicorn', 'asgi:app', '--host', '127.0.0.1', '--port', str(port),
+                   '--backlog', '4096', '--no-access-log']
+    env = dict(os.environ, VALIDATOR_URL=validator_url, GUNICORN_THREADS=str(THREADS))
+    process = subprocess.Popen(command, cwd=FRONTEND, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f'http://127.0.0.1:{port}'
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(f'{url}/health')
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.1)
+            continue
+        # Warm up: the first submission creates the validator client
+        urllib.request.urlopen(urllib.request.Request(
+            f'{url}/api/validate', json.dumps(EVENT).encode(),
+            {'Content-Type': 'application/json'}), timeout=30)
+        return process, url
+    process.kill()
+    raise RuntimeError(f'{mode} frontend did not start')
+
+
+async def run(url, clients, per_client):
+    latencies = []
+    errors = 0
+
+    async def client(session):
+        nonlocal errors
+        for _ in range(per_client):
+            started = time.perf_counter()
+            try:
+                async with session.post(f'{url}/api/validate', json=EVENT) as response:
+                    await response.read()
+            except (aiohttp.ClientError, asyncio.TimeoutError):  # Dropped or timed out
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+            errors += response.status != 200
+
+    connector = aiohttp.TCPConnector(limit=clients)
+    async with aiohttp.ClientSession(connector=connector,
+                                     timeout=aiohttp.ClientTimeout(total=120)) as session:
+        started = time.perf_counter()
+        await asyncio.gather(*(client(session) for _ in range(clients)))
+        elapsed = time.perf_counter() - started
+    latencies.sort()
+    return (len(latencies) / elapsed, latencies[len(latencies) // 2] * 1000,
+            latencies[int(len(latencies) * 0.99)] * 1000, errors)
+
+
+def run_benchmark():
+    delay_ms = float(sys.argv[1]) if len(sys.argv) > 1 else 500.0
+    per_client = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    validator_url = start_validator(delay_ms / 1000)
+    print(f"validator answers after {delay_ms} ms; gthread has {THREADS} threads\n")
+    print(f"{'clients':<9}{'server':<10}{'req/s':>9}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for mode in ('gthread', 'async'):
+        process, url = start_frontend(mode, validator_url)
+        try:
+            for clients in (8, 64, 512, 2000):
+                rate, p50, p99, errors = asyncio.run(run(url, clients, per_client))
+                print(f"{clients:<9}{mode:<10}{rate:>9,.0f}{p50:>10.1f}{p99:>10.1f}{errors:>8}")
+        finally:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == '__main__':
+    run_benchmark()
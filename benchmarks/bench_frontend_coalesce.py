@@ -0,0 +1,135 @@
+"""
+Frontend -> validator calls with and without the coalescer.
+
+Runs the real data-validator function in a local HTTP server with a fake
+publisher that completes each publish after a fixed delay, and has N
+client threads submit through /api/validate, as gunicorn's threads
+would. Reports validator calls made, throughput and latency, and, with
+coalescing, the batch-size distribution and queueing delay from the
+frontend's metrics.
+
+Usage:
+    python benchmarks/bench_frontend_coalesce.py [requests per client] [window ms]
+"""
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path[:0] = [os.path.join(ROOT, 'src', 'frontend'),
+                os.path.join(ROOT, 'src', 'functions', 'data_validator')]
+
+from flask import Flask, request  # noqa: E402
+from requests.adapters import HTTPAdapter  # noqa: E402
+from werkzeug.serving import WSGIRequestHandler, make_server  # noqa: E402
+
+import app  # noqa: E402
+import main as function  # noqa: E402
+from coalescer import BATCH_SIZE_BUCKETS, Coalescer  # noqa: E402
+from metrics import metrics  # noqa: E402
+
+EVENT = {'name': 'Jane Doe', 'email': 'jane@example.com', 'age': 34}
+CLIENTS = 32
+
+
+class KeepAliveHandler(WSGIRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+
+class FakePublisher:
+    """Completes every publish after a fixed delay, like a batching client."""
+
+    def __init__(self, delay):
+        self.delay = delay
+
+    def publish(self, topic, data, ordering_key='', **attributes):
+        future = Future()
+        threading.Timer(self.delay, future.set_result, ('1',)).start()
+        return future
+
+
+def start_function():
+    server_app = Flask('data-validator')
+    server_app.calls = 0
+
+    def handle(path=''):
+        server_app.calls += 1
+        return function.data_validator(request)
+    server_app.add_url_rule('/', 'root', handle, methods=['POST'])
+    server_app.add_url_rule('/<path:path>', 'path', handle, methods=['POST'])
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, server_app, threaded=True,
+                         request_handler=KeepAliveHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, server_app
+
+
+def run(per_client):
+    latencies = []
+    lock = threading.Lock()
+
+    def client(_):
+        test_client = app.app.test_client()
+        mine = []
+        for _ in range(per_client):
+            started = time.perf_counter()
+            response = test_client.post('/api/validate', json=EVENT)
+            mine.append(time.perf_counter() - started)
+            assert response.status_code == 200, response.data
+        with lock:
+            latencies.extend(mine)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=CLIENTS) as pool:
+        list(pool.map(client, range(CLIENTS)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return (len(latencies) / elapsed, latencies[len(latencies) // 2] * 1000,
+            latencies[int(len(latencies) * 0.95)] * 1000)
+
+
+def histogram(name, buckets, scale=1, unit=''):
+    counts = [metrics.get(f'{name}_le_{bound}') for bound in buckets]
+    total = metrics.get(f'{name}_count')
+    below = 0
+    for bound, count in zip(buckets, counts):
+        if count > below:
+            print(f"    <= {bound * scale:g}{unit}: {count - below}")
+        below = count
+    if total > below:
+        print(f"    >  {buckets[-1] * scale:g}{unit}: {total - below}")
+
+
+def run_benchmark():
+    per_client = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    window_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 2.0
+    function.publisher = FakePublisher(0.005)
+    server, server_app = start_function()
+    app.FUNCTION_URL = f'http://127.0.0.1:{server.server_port}'
+    app.http_adapter = HTTPAdapter(pool_connections=1, pool_maxsize=CLIENTS)
+    print(f"{CLIENTS} clients x {per_client} requests, publish takes 5 ms\n")
+    print(f"{'mode':<22}{'calls':>7}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}")
+    for max_items in (None, 8, 32):
+        metrics.reset()
+        server_app.calls = 0
+        app.coalescer = max_items and Coalescer(
+            app.validate_batch, app.validate_data, window=window_ms / 1000,
+            max_items=max_items, max_batches=8)
+        name = f'coalesce {window_ms:g} ms/{max_items}' if max_items else 'one call each'
+        rate, p50, p95 = run(per_client)
+        print(f"{name:<22}{server_app.calls:>7}{rate:>8,.0f}{p50:>9.2f}{p95:>9.2f}")
+        if max_items:
+            batches = metrics.get('coalesce_batch_size_count')
+            waited = metrics.get('coalesce_queue_seconds_sum')
+            queued = waited / metrics.get('coalesce_queue_seconds_count')
+            print(f"  mean batch {metrics.get('coalesce_batch_size_sum') / batches:.1f}, "
+                  f"mean queueing {queued * 1000:.2f} ms; batch sizes:")
+            histogram('coalesce_batch_size', BATCH_SIZE_BUCKETS)
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    run_benchmark()
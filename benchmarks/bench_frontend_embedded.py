@@ -0,0 +1,112 @@
+"""
+Frontend /api/validate end to end: remote function call vs. embedded mode.
+
+Remote mode runs the real data-validator function in a local HTTP server
+and has the frontend call it through its pooled session, as in
+production. Embedded mode validates and publishes in the frontend
+process. Both publish to the same fake publisher, which completes each
+publish after a fixed delay standing in for Pub/Sub. The stand-in
+function is plain HTTP on loopback, so remote mode here leaves out the
+TLS and network time a real Cloud Function call adds.
+
+Usage:
+    python benchmarks/bench_frontend_embedded.py [requests per client] [publish ms]
+"""
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path[:0] = [os.path.join(ROOT, 'src', 'frontend'),
+                os.path.join(ROOT, 'src', 'functions', 'data_validator')]
+
+from flask import Flask, request  # noqa: E402
+from requests.adapters import HTTPAdapter  # noqa: E402
+from werkzeug.serving import WSGIRequestHandler, make_server  # noqa: E402
+
+import app  # noqa: E402
+import embedded_validator  # noqa: E402
+import main as function  # noqa: E402
+
+EVENT = {'name': 'Jane Doe', 'email': 'jane@example.com', 'age': 34}
+
+
+class KeepAliveHandler(WSGIRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+
+class FakePublisher:
+    """Completes every publish after a fixed delay, like a batching client."""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.published = 0
+        self._lock = threading.Lock()
+
+    def publish(self, topic, data, ordering_key='', **attributes):
+        future = Future()
+        with self._lock:
+            self.published += 1
+            message_id = str(self.published)
+        threading.Timer(self.delay, future.set_result, (message_id,)).start()
+        return future
+
+
+def start_function():
+    server_app = Flask('data-validator')
+    server_app.add_url_rule('/', 'data_validator', lambda: function.data_validator(request),
+                            methods=['POST'])
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, server_app, threaded=True,
+                         request_handler=KeepAliveHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}/'
+
+
+def run(clients, per_client):
+    latencies = []
+    lock = threading.Lock()
+
+    def client(_):
+        test_client = app.app.test_client()
+        mine = []
+        for _ in range(per_client):
+            started = time.perf_counter()
+            response = test_client.post('/api/validate', json=EVENT)
+            mine.append(time.perf_counter() - started)
+            assert response.status_code == 200, response.data
+        with lock:
+            latencies.extend(mine)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(client, range(clients)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return (len(latencies) / elapsed, latencies[len(latencies) // 2] * 1000,
+            latencies[int(len(latencies) * 0.95)] * 1000)
+
+
+def run_benchmark():
+    per_client = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    publish_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 2.0
+    publisher = FakePublisher(publish_ms / 1000)
+    function.publisher = publisher
+    embedded_validator.publisher = publisher
+    server, app.FUNCTION_URL = start_function()
+    print(f"{per_client} requests per client, publish takes {publish_ms} ms\n")
+    print(f"{'clients':<9}{'mode':<10}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}")
+    for clients in (1, 8):
+        app.http_adapter = HTTPAdapter(pool_connections=1, pool_maxsize=clients)
+        for mode in ('remote', 'embedded'):
+            app.VALIDATOR_MODE = mode
+            rate, p50, p95 = run(clients, per_client)
+            print(f"{clients:<9}{mode:<10}{rate:>9,.0f}{p50:>9.2f}{p95:>9.2f}")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    run_benchmark()
@@ -0,0 +1,123 @@
+"""
+Frontend -> validator calls: a new connection per call vs. the pooled session.
+
+Starts a local HTTPS stand-in for the data-validator function (a
+self-signed certificate made with the openssl CLI; plain HTTP if openssl
+is missing) and has N client threads submit events through
+app.validate_data. The baseline is the previous code, a bare
+requests.post per call, which opens a TCP connection and does a TLS
+handshake every time. The pool is sized to the client count, as it is
+to the gunicorn thread count in production.
+
+Usage:
+    python benchmarks/bench_frontend_session.py [requests per client]
+"""
+import json
+import os
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'src', 'frontend'))
+
+import requests  # noqa: E402
+from requests.adapters import HTTPAdapter  # noqa: E402
+
+import app  # noqa: E402
+
+EVENT = {'name': 'Jane Doe', 'email': 'jane@example.com', 'age': 34}
+
+
+class StandInValidator(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        data = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        body = json.dumps({'message': 'Data validated and published successfully',
+                           'code': 'SUCCESS', 'data': data}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server(directory):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInValidator)
+    server.daemon_threads = True
+    server.request_queue_size = 256
+    scheme = 'http'
+    cert, key = os.path.join(directory, 'cert.pem'), os.path.join(directory, 'key.pem')
+    try:
+        subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                        '-subj', '/CN=127.0.0.1', '-addext', 'subjectAltName=IP:127.0.0.1',
+                        '-keyout', key, '-out', cert], check=True, capture_output=True)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert, key)
+        # Handshake in the handler thread, not in the accept loop
+        server.socket = context.wrap_socket(server.socket, server_side=True,
+                                            do_handshake_on_connect=False)
+        os.environ['REQUESTS_CA_BUNDLE'] = cert
+        scheme = 'https'
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'{scheme}://127.0.0.1:{server.server_address[1]}/'
+
+
+def unpooled(data):
+    """The previous implementation: no session, one connection per call."""
+    response = requests.post(app.FUNCTION_URL, json=data,
+                             headers={'Content-Type': 'application/json'}, timeout=10)
+    return response.json(), response.status_code
+
+
+def run(call, clients, per_client):
+    latencies = []
+    lock = threading.Lock()
+
+    def client(_):
+        mine = []
+        for _ in range(per_client):
+            started = time.perf_counter()
+            _, status_code = call(EVENT)
+            mine.append(time.perf_counter() - started)
+            assert status_code == 200
+        with lock:
+            latencies.extend(mine)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(client, range(clients)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return (len(latencies) / elapsed, latencies[len(latencies) // 2] * 1000,
+            latencies[int(len(latencies) * 0.95)] * 1000)
+
+
+def main():
+    per_client = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    with tempfile.TemporaryDirectory() as directory:
+        server, url = start_server(directory)
+        app.FUNCTION_URL = url
+        print(f"stand-in validator at {url}, {per_client} requests per client\n")
+        print(f"{'clients':<9}{'mode':<12}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}")
+        for clients in (8, 64):
+            app.http_adapter = HTTPAdapter(pool_connections=1, pool_maxsize=clients)
+            for name, call in (('new conn', unpooled), ('pooled', app.validate_data)):
+                rate, p50, p95 = run(call, clients, per_client)
+                print(f"{clients:<9}{name:<12}{rate:>9,.0f}{p50:>9.2f}{p95:>9.2f}")
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+Microbenchmark: stdlib json vs. the pluggable codec in data_validator.
+
+Measures request decode and the publish-plus-echo encode for small,
+medium and large events. The original path serializes the event twice
+(once for Pub/Sub, once inside the response); the codec path encodes it
+once and splices the bytes into the response.
+
+Usage:
+    python benchmarks/bench_json_codec.py [seconds per case]
+"""
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'src', 'functions', 'data_validator'))
+
+from jsoncodec import CODECS, get_codec  # noqa: E402
+
+BASE = {'name': 'Jane Doe', 'email': 'jane.doe@example.com', 'age': 34}
+ADDRESS = {'street': '500 Market Street', 'city': 'San Francisco', 'state': 'CA', 'zip': '94105'}
+
+
+def make_payloads():
+    medium = dict(BASE, address=ADDRESS, preferences={
+        'newsletter': True, 'language': 'en-US', 'timezone': 'America/Los_Angeles',
+        'tags': [f'segment-{i}' for i in range(20)],
+    }, notes='Müller & Søn, café account. ' * 10)
+    large = dict(medium, history=[
+        {'order_id': f'ORD-{i:06d}', 'amount': round(19.99 + i * 0.37, 2),
+         'items': i % 7 + 1, 'shipped': i % 3 == 0, 'sku': f'SKU-{i * 31 % 9973}'}
+        for i in range(500)
+    ])
+    return {'small': BASE, 'medium': medium, 'large': large}
+
+
+def publish_and_echo_legacy(data):
+    """The original validate_data: one dumps for Pub/Sub, one for the response."""
+    payload = json.dumps(data).encode('utf-8')
+    body = json.dumps({
+        'message': 'Data validated and published successfully',
+        'code': 'SUCCESS',
+        'data': data
+    })
+    return payload, body
+
+
+def make_publish_and_echo(codec):
+    prefix = codec.dumps({
+        'message': 'Data validated and published successfully',
+        'code': 'SUCCESS'
+    })[:-1] + b',"data":'
+
+    def publish_and_echo(data):
+        payload = codec.dumps(data)
+        return payload, (prefix + payload + b'}').decode('utf-8')
+    return publish_and_echo
+
+
+def rate(func, arg, seconds):
+    """Calls per second, best of three runs of about `seconds` each."""
+    per_call = timeit.timeit(lambda: func(arg), number=20) / 20
+    number = max(1, int(seconds / per_call))
+    return number / min(timeit.repeat(lambda: func(arg), number=number, repeat=3))
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 0.3
+    payloads = make_payloads()
+    codecs = {}
+    for name in CODECS:
+        try:
+            codecs[name] = get_codec(name)
+        except ImportError:
+            print(f"({name} is not installed; skipped)")
+
+    print(f"{'payload':<8}{'bytes':>8}  {'operation':<18}{'implementation':<22}{'ops/sec':>12}")
+    for label, data in payloads.items():
+        body = json.dumps(data).encode('utf-8')
+        rows = [('decode', 'json.loads', json.loads, body)]
+        rows += [('decode', f'{name} codec', codec.loads, body) for name, codec in codecs.items()]
+        rows.append(('publish + echo', 'json.dumps x2', publish_and_echo_legacy, data))
+        rows += [('publish + echo', f'{name} encode once', make_publish_and_echo(codec), data)
+                 for name, codec in codecs.items()]
+        for operation, implementation, func, arg in rows:
+            print(f"{label:<8}{len(body):>8}  {operation:<18}{implementation:<22}"
+                  f"{rate(func, arg, seconds):>12,.0f}")
+
+
+if __name__ == '__main__':
+    main()
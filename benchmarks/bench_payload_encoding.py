@@ -0,0 +1,96 @@
+"""
+Published bytes and CPU per payload encoding.
+
+Encodes events of several sizes with each encoding the data_validator
+function supports, and reports the message size and the encode and
+decode time per event. Compression runs with a zero threshold here so
+every size shows its effect; the function itself only compresses
+payloads of at least PAYLOAD_COMPRESS_MIN_BYTES.
+
+zstd is skipped when the zstandard package is not installed. protobuf
+timings depend heavily on the protobuf backend (upb, C++ or pure
+Python), which is printed.
+
+Usage:
+    python benchmarks/bench_payload_encoding.py [seconds per case]
+"""
+import os
+import random
+import string
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'src', 'functions', 'data_validator'))
+
+from main import EVENT_SCHEMA  # noqa: E402
+from jsoncodec import codec  # noqa: E402
+from payload_encoding import PayloadDecoder, PayloadEncoder  # noqa: E402
+
+# The event schema plus a free-text field to make events of any size
+SCHEMA = dict(EVENT_SCHEMA, properties=dict(EVENT_SCHEMA['properties'],
+                                            notes={'type': 'string'}))
+ENCODINGS = [('json', 'identity'), ('json', 'gzip'), ('json', 'zstd'),
+             ('protobuf', 'identity'), ('protobuf', 'gzip'), ('protobuf', 'zstd')]
+
+
+def make_event(notes_bytes, rng):
+    words = [''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(2, 9)))
+             for _ in range(300)]
+    notes = ''
+    while len(notes) < notes_bytes:
+        notes += rng.choice(words) + ' '
+    event = {
+        'name': 'Jane Doe', 'email': 'jane.doe@example.com', 'age': 34,
+        'address': {'street': '1 Main St', 'city': 'Springfield', 'state': 'IL',
+                    'zip': '62701'},
+        'event_type': 'user.created', 'priority': 'normal'
+    }
+    if notes_bytes:
+        event['notes'] = notes[:notes_bytes]
+    return event
+
+
+def seconds_per_call(func, seconds):
+    """Best of three runs of about `seconds` each."""
+    per_call = timeit.timeit(func, number=1)
+    number = max(1, int(seconds / max(per_call, 1e-7)))
+    return min(timeit.repeat(func, number=number, repeat=3)) / number
+
+
+def protobuf_backend():
+    try:
+        from google.protobuf.internal import api_implementation
+        return api_implementation.Type()
+    except ImportError:
+        return 'not installed'
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 0.2
+    rng = random.Random(7)
+    events = {label: make_event(size, rng) for label, size in
+              (('small', 0), ('1 KB', 1000), ('10 KB', 10000), ('100 KB', 100000))}
+    decoder = PayloadDecoder(schema=SCHEMA, loads=codec.loads)
+    print(f"JSON codec {codec.name}, protobuf backend {protobuf_backend()}\n")
+    print(f"{'event':<8}{'encoding':<20}{'bytes':>9}{'ratio':>8}{'encode us':>11}{'decode us':>11}")
+    for label, event in events.items():
+        payload = codec.dumps(event)
+        for content_type, compression in ENCODINGS:
+            name = content_type if compression == 'identity' else f'{content_type}+{compression}'
+            try:
+                encoder = PayloadEncoder(content_type, compression, min_bytes=0, schema=SCHEMA)
+            except (ValueError, ImportError) as e:
+                print(f"{label:<8}{name:<20}  skipped: {str(e)}")
+                continue
+            data, attributes = encoder.encode(payload, event)
+            assert decoder.decode(data, attributes) == event
+            encode_us = seconds_per_call(lambda: encoder.encode(payload, event), seconds) * 1e6
+            decode_us = seconds_per_call(lambda: decoder.decode(data, attributes), seconds) * 1e6
+            print(f"{label:<8}{name:<20}{len(data):>9,}{len(data) / len(payload):>8.2f}"
+                  f"{encode_us:>11.1f}{decode_us:>11.1f}")
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Adversarial bodies: decoding first vs. the pre-parse guards in data_validator.
+
+For each body, times the old path (decode the whole body, then run the
+schema) against read_json, which checks Content-Length, nesting depth,
+key count and the required top-level fields before decoding anything.
+
+Usage:
+    python benchmarks/bench_prescan.py [seconds per case]
+"""
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'src', 'functions', 'data_validator'))
+
+from bench_json_codec import BASE  # noqa: E402
+from main import MAX_BODY_BYTES, read_json, validate_event  # noqa: E402
+from jsoncodec import codec  # noqa: E402
+
+
+class Request:
+    """Just enough of a Flask request for read_json."""
+
+    def __init__(self, body, send_length=True):
+        self.body = body
+        self.headers = {'Content-Length': str(len(body))} if send_length else {}
+
+    def get_data(self):
+        return self.body
+
+
+def make_bodies():
+    event = json.dumps(BASE)[:-1]
+    return {
+        'valid event': json.dumps(BASE).encode(),
+        'nested 100k deep': (event + ', "x": ' + '[' * 100000 + ']' * 100000 + '}').encode(),
+        'nested 1k deep': (event + ', "x": ' + '[' * 1000 + ']' * 1000 + '}').encode(),
+        '50k keys': json.dumps(dict(BASE, extra={f'k{i}': i for i in range(50000)})).encode(),
+        # Under the size cap, but without an email field
+        'missing field 900 KB': json.dumps({
+            'name': 'Jane Doe', 'age': 34,
+            'history': [[f'ORD-{i:06d}', 19.99, i % 7 + 1] for i in range(30000)]
+        }).encode(),
+        # The same, with every field present: the guards' overhead on a large valid event
+        'valid 900 KB': json.dumps(dict(BASE, history=[
+            [f'ORD-{i:06d}', 19.99, i % 7 + 1] for i in range(30000)])).encode(),
+        '50 MB body': json.dumps(dict(BASE, blob='x' * (50 * 1024 * 1024))).encode(),
+    }
+
+
+def decode_first(loads):
+    def run(body):
+        try:
+            return validate_event(loads(body))
+        except (ValueError, RecursionError) as e:
+            return e
+    return run
+
+
+def guarded(body):
+    return read_json(Request(body))
+
+
+def seconds_per_call(func, arg, seconds):
+    """Best of three runs of about `seconds` each."""
+    per_call = timeit.timeit(lambda: func(arg), number=1)
+    number = max(1, int(seconds / max(per_call, 1e-7)))
+    return min(timeit.repeat(lambda: func(arg), number=number, repeat=3)) / number
+
+
+def outcome(func, body):
+    result = func(body)
+    if isinstance(result, tuple):
+        error = result[1]
+        return 'decoded' if error is None else f"{error[1]} {json.loads(error[0])['code']}"
+    if isinstance(result, Exception):
+        return type(result).__name__
+    return 'decoded' if not result else result[0].keyword
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 0.3
+    paths = [
+        ('json.loads + schema', decode_first(json.loads)),
+        (f'{codec.name} + schema', decode_first(codec.loads)),
+        ('guards + decode', guarded),
+    ]
+    print(f"size cap {MAX_BODY_BYTES:,} bytes\n")
+    print(f"{'body':<22}{'bytes':>12}  {'path':<22}{'ms/call':>10}  outcome")
+    for label, body in make_bodies().items():
+        for name, func in paths:
+            ms = seconds_per_call(func, body, seconds) * 1000
+            print(f"{label:<22}{len(body):>12,}  {name:<22}{ms:>10.3f}  {outcome(func, body)}")
+        print()
+
+
+if __name__ == '__main__':
+    main()
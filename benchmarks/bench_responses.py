@@ -0,0 +1,62 @@
+"""
+Response egress and encode time in data_validator.
+
+Compares the full success response (which echoes the event) with the
+minimal one, and encoding the fixed error bodies per request with
+json.dumps against the bodies main.py encodes once at import.
+
+Usage:
+    python benchmarks/bench_responses.py [iterations]
+"""
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'src', 'functions', 'data_validator'))
+
+from bench_json_codec import make_payloads  # noqa: E402
+from jsoncodec import codec  # noqa: E402
+from main import (FIELD_ERRORS, INVALID_JSON_BODY, MISSING_FIELDS_BODIES,  # noqa: E402
+                  FIELD_ERROR_BODIES, minimal_success_body, success_body)
+
+MESSAGE_ID = '12345678901234567'
+
+ERRORS = {
+    'INVALID_JSON': ({
+        'error': 'Invalid JSON payload',
+        'code': 'INVALID_JSON',
+        'message': 'The request body must be a valid JSON object'
+    }, lambda: INVALID_JSON_BODY),
+    'MISSING_FIELDS': ({
+        'error': 'Missing required fields',
+        'code': 'MISSING_FIELDS',
+        'message': 'Required fields missing: name, email',
+        'missing_fields': ['name', 'email']
+    }, lambda: MISSING_FIELDS_BODIES[('name', 'email')]),
+    'INVALID_EMAIL': (FIELD_ERRORS[('email', 'pattern')],
+                      lambda: FIELD_ERROR_BODIES[('email', 'pattern')]),
+}
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    print(f"{'payload':<8}{'full bytes':>12}{'minimal bytes':>15}{'saved':>8}")
+    for label, data in make_payloads().items():
+        payload = codec.dumps(data)
+        full = len(success_body(payload).encode('utf-8'))
+        minimal = len(minimal_success_body(codec.dumps(MESSAGE_ID)).encode('utf-8'))
+        print(f"{label:<8}{full:>12,}{minimal:>15,}{1 - minimal / full:>8.0%}")
+
+    print(f"\n{'error body':<16}{'json.dumps us':>15}{'pre-encoded us':>16}")
+    for code, (body, cached) in ERRORS.items():
+        assert json.loads(cached()) == body
+        dynamic = min(timeit.repeat(lambda: json.dumps(body), number=iterations, repeat=3))
+        static = min(timeit.repeat(cached, number=iterations, repeat=3))
+        print(f"{code:<16}{dynamic / iterations * 1e6:>15.2f}{static / iterations * 1e6:>16.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,44 +1,146 @@
 import functions_framework
 import json
 import os
-from google.cloud import pubsub_v1
+import re
+from datetime import datetime, timedelta, timezone
+
+from publisher_config import LazyClient, create_publisher, open_channel
+from schema import compile_schema
+
+# Pub/Sub client, created on first use to keep it out of cold-start import time
+publisher = LazyClient(create_publisher)
+# Same value as publisher.topic_path(), without creating the client
+topic_path = f"projects/{os.environ.get('PROJECT_ID')}/topics/events-topic"
+WARMUP_TIMEOUT = float(os.getenv('WARMUP_TIMEOUT_SECONDS', '10'))
+
+# Shape of `data` for each known event_type, read from the JSON file named
+# by EVENT_SCHEMAS_FILE as {"<event_type>": <JSON schema>, ...}. Types with
+# no schema, all of them by default, are published with envelope checks
+# only, unless UNKNOWN_EVENT_TYPES=reject.
+def load_event_schemas(path):
+    """Read an EVENT_SCHEMAS_FILE; returns {} if path is empty."""
+    if not path:
+        return {}
+    with open(path, encoding='utf-8') as schema_file:
+        schemas = json.load(schema_file)
+    if not isinstance(schemas, dict) or not all(isinstance(s, dict) for s in schemas.values()):
+        raise ValueError(f"EVENT_SCHEMAS_FILE {path!r} must map each event_type to a schema")
+    return schemas
+
+EVENT_DATA_SCHEMAS = load_event_schemas(os.getenv('EVENT_SCHEMAS_FILE', ''))
+
+# Dispatch table: event_type -> compiled validator for its data
+EVENT_VALIDATORS = {
+    event_type: compile_schema(schema) for event_type, schema in EVENT_DATA_SCHEMAS.items()
+}
+REJECT_UNKNOWN_TYPES = os.getenv('UNKNOWN_EVENT_TYPES', 'accept') == 'reject'
+
+# Fallback for ISO 8601 forms datetime.fromisoformat does not accept on
+# older Pythons: a trailing Z, and fractions other than 3 or 6 digits
+_ISO_8601 = re.compile(
+    r'(\d{4})-(\d{2})-(\d{2})[Tt ](\d{2}):(\d{2}):(\d{2})(?:[.,](\d{1,9}))?'
+    r'(?:(Z)|([+-])(\d{2}):?(\d{2}))?'
+)
+# UTC offset at the end of a timestamp fromisoformat accepted, which may
+# have minutes of 60 or more
+_UTC_OFFSET = re.compile(r'[+-](\d{2}):?(\d{2})(?::?\d{2}(?:[.,]\d+)?)?$')
+
+def _offset_in_range(hours, minutes):
+    return int(hours) <= 23 and int(minutes) <= 59
+
+def parse_timestamp(value):
+    """Parse an ISO 8601 date-time; returns None if it is not one."""
+    # fromisoformat also takes dates alone, week dates and basic format on
+    # newer Pythons; require the extended YYYY-MM-DDTHH:MM:SS layout first
+    if len(value) < 19 or value[4] != '-' or value[7] != '-' or value[10] not in 'Tt ':
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)  # Fast path, implemented in C
+    except ValueError:
+        parsed = None
+    if parsed is not None:
+        offset = parsed.tzinfo and _UTC_OFFSET.search(value)
+        if offset and not _offset_in_range(*offset.groups()):
+            return None
+        return parsed
+    return _parse_fallback(value)
+
+def _parse_fallback(value):
+    """parse_timestamp for values fromisoformat rejected."""
+    match = _ISO_8601.fullmatch(value)
+    if match is None:
+        return None
+    year, month, day, hour, minute, second, fraction, zulu, sign, tz_hours, tz_minutes = \
+        match.groups()
+    try:
+        tzinfo = None
+        if zulu:
+            tzinfo = timezone.utc
+        elif sign:
+            if not _offset_in_range(tz_hours, tz_minutes):
+                return None
+            offset = timedelta(hours=int(tz_hours), minutes=int(tz_minutes))
+            tzinfo = timezone(-offset if sign == '-' else offset)
+        return datetime(int(year), int(month), int(day), int(hour), int(minute), int(second),
+                        int((fraction or '0').ljust(6, '0')[:6]), tzinfo)
+    except ValueError:
+        return None  # Out-of-range field, e.g. month 13
+
+def check_event(request_json):
+    """Validate the envelope and the data for its event_type; returns an error or None."""
+    required_fields = ['event_id', 'timestamp', 'event_type', 'data']
+    missing_fields = [field for field in required_fields if field not in request_json]
+    if missing_fields:
+        return f'Missing required fields: {", ".join(missing_fields)}'
+
+    # Validate data types
+    if not isinstance(request_json['event_id'], str):
+        return 'event_id must be a string'
+    if not isinstance(request_json['timestamp'], str):
+        return 'timestamp must be a string'
+    if not isinstance(request_json['event_type'], str):
+        return 'event_type must be a string'
+    if parse_timestamp(request_json['timestamp']) is None:
+        return 'timestamp must be an ISO 8601 date-time'
+
+    validate_payload = EVENT_VALIDATORS.get(request_json['event_type'])
+    if validate_payload is None:
+        if REJECT_UNKNOWN_TYPES:
+            return f'Unknown event_type: {request_json["event_type"]}'
+        return None
+    errors = validate_payload(request_json['data'])
+    if errors:
+        return f'Invalid data for {request_json["event_type"]}: {errors[0].message}'
+    return None
 
 @functions_framework.http
 def validate_data(request):
     """HTTP Cloud Function that validates incoming data.
-    
+
     Args:
         request (flask.Request): The request object.
     Returns:
         The response text, or any set of values that can be turned into a
         Response object using `make_response`
     """
+    if request.method == 'GET' and request.path == '/warmup':
+        try:
+            open_channel(publisher.get(), WARMUP_TIMEOUT)
+        except Exception as e:
+            return f'Warmup failed: {str(e)}', 503
+        return 'Warm', 200
+
     try:
         # Get request data
         request_json = request.get_json(silent=True)
         if not request_json:
             return 'No data provided', 400
 
-        # Validate required fields
-        required_fields = ['event_id', 'timestamp', 'event_type', 'data']
-        missing_fields = [field for field in required_fields if field not in request_json]
-        if missing_fields:
-            return f'Missing required fields: {", ".join(missing_fields)}', 400
-
-        # Validate data types
-        if not isinstance(request_json['event_id'], str):
-            return 'event_id must be a string', 400
-        if not isinstance(request_json['timestamp'], str):
-            return 'timestamp must be a string', 400
-        if not isinstance(request_json['event_type'], str):
-            return 'event_type must be a string', 400
+        error = check_event(request_json)
+        if error:
+            return error, 400
 
         # Publish validated data to Pub/Sub
-        project_id = os.environ.get('PROJECT_ID')
-        topic_name = 'events-topic'
-        publisher = pubsub_v1.PublisherClient()
-        topic_path = publisher.topic_path(project_id, topic_name)
-
         data = json.dumps(request_json).encode('utf-8')
         future = publisher.publish(topic_path, data)
         message_id = future.result()
@@ -49,4 +151,4 @@ def validate_data(request):
         }, 200
 
     except Exception as e:
-        return str(e), 500 
\ No newline at end of file
+        return str(e), 500
@@ -0,0 +1,93 @@
+"""
+Benchmark publisher batching presets against a local fake publisher.
+
+Two workloads are measured for each preset in publisher_config.PRESETS:
+  sync   - concurrent request threads each wait for their publish result,
+           as data_validator does by default
+  async  - one producer hands messages over without waiting, as batch
+           and asynchronous-acknowledgement requests do
+
+Usage:
+    python benchmarks/bench_publisher.py [messages] [threads]
+"""
+import os
+import sys
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'src', 'functions', 'data_validator'))
+
+from fake_publisher import FakeBatchingPublisher  # noqa: E402
+from publisher_config import PRESETS  # noqa: E402
+
+PAYLOAD = b'x' * 200
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run_sync(publisher, messages, threads):
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(count):
+        local = []
+        for _ in range(count):
+            started = time.perf_counter()
+            publisher.publish('events-topic', PAYLOAD).result()
+            local.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(local)
+
+    workers = [threading.Thread(target=worker, args=(messages // threads,)) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return latencies
+
+
+def run_async(publisher, messages, threads):
+    started = {}
+    latencies = []
+    lock = threading.Lock()
+
+    def on_done(future):
+        elapsed = time.perf_counter() - started[future]
+        with lock:
+            latencies.append(elapsed)
+
+    futures = []
+    for _ in range(messages):
+        future = publisher.publish('events-topic', PAYLOAD)
+        started[future] = time.perf_counter()
+        futures.append(future)
+    for future in futures:
+        future.add_done_callback(on_done)
+    for future in futures:
+        future.result()
+    return latencies
+
+
+def main():
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    print(f"{messages} messages of {len(PAYLOAD)} bytes, {threads} request threads for sync")
+    print(f"{'preset':<13}{'mode':<7}{'msgs/sec':>11}{'p50 ms':>9}{'p99 ms':>9}{'rpcs':>7}")
+    for name, settings in PRESETS.items():
+        for mode, run in (('sync', run_sync), ('async', run_async)):
+            publisher = FakeBatchingPublisher(settings)
+            started = time.perf_counter()
+            latencies = run(publisher, messages, threads)
+            elapsed = time.perf_counter() - started
+            publisher.close()
+            print(f"{name:<13}{mode:<7}{len(latencies) / elapsed:>11,.0f}"
+                  f"{percentile(latencies, 0.50) * 1000:>9.2f}"
+                  f"{percentile(latencies, 0.99) * 1000:>9.2f}{publisher.rpc_count:>7}")
+
+
+if __name__ == '__main__':
+    main()
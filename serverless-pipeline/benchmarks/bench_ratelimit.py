@@ -0,0 +1,80 @@
+"""
+Benchmark the rate limiters against the original timestamp-list limiter.
+
+Each implementation sees one request from each of N distinct IPs (the
+worst case for memory), then N requests spread over 1,000 hot IPs.
+Memory is what the limiter still holds afterwards.
+
+Usage:
+    python benchmarks/bench_ratelimit.py [distinct_ips]
+"""
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'src', 'functions', 'data_validator'))
+
+from ratelimit import SlidingWindowLimiter, TokenBucketLimiter  # noqa: E402
+
+RATE_LIMIT = 100
+
+
+class ListLimiter:
+    """The original rate_limit() with its global dict of timestamp lists."""
+
+    def __init__(self):
+        self.rate_limit_dict = {}
+
+    def acquire(self, ip):
+        current_time = time.time()
+        minute_window = current_time - 60
+        if ip in self.rate_limit_dict:
+            self.rate_limit_dict[ip] = [t for t in self.rate_limit_dict[ip] if t > minute_window]
+        if len(self.rate_limit_dict.get(ip, [])) >= RATE_LIMIT:
+            return True
+        if ip not in self.rate_limit_dict:
+            self.rate_limit_dict[ip] = []
+        self.rate_limit_dict[ip].append(current_time)
+        return False
+
+    def __len__(self):
+        return len(self.rate_limit_dict)
+
+
+IMPLEMENTATIONS = (
+    ('timestamp lists', ListLimiter),
+    ('sliding window', lambda: SlidingWindowLimiter(RATE_LIMIT, 60)),
+    ('token bucket', lambda: TokenBucketLimiter(RATE_LIMIT, 60)),
+)
+
+
+def run(factory, keys):
+    limiter = factory()
+    started = time.perf_counter()
+    for key in keys:
+        limiter.acquire(key)
+    return limiter, time.perf_counter() - started
+
+
+def main():
+    distinct = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    distinct_keys = [f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}" for i in range(distinct)]
+    hot_keys = [distinct_keys[i % 1000] for i in range(distinct)]
+
+    print(f"{'limiter':<17}{'workload':<10}{'calls/sec':>12}{'keys kept':>11}{'memory MB':>11}")
+    for name, factory in IMPLEMENTATIONS:
+        for workload, keys in (('distinct', distinct_keys), ('hot', hot_keys)):
+            _, seconds = run(factory, keys)
+            tracemalloc.start()
+            limiter, _ = run(factory, keys)
+            memory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            print(f"{name:<17}{workload:<10}{len(keys) / seconds:>12,.0f}{len(limiter):>11,}"
+                  f"{memory / 1e6:>11.1f}")
+            del limiter
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Microbenchmark: per-request rules dict vs. the compiled schema validator.
+
+Usage:
+    python benchmarks/bench_schema.py [iterations]
+"""
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'src', 'functions', 'data_validator'))
+
+from schema import compile_schema  # noqa: E402
+
+EMAIL_PATTERN = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
+
+VALID = {'name': 'John Doe', 'email': 'john@example.com', 'age': 30}
+INVALID = {'name': '', 'email': 'not-an-email', 'age': -5}
+
+
+def validate_field(field_name, value, rules):
+    """Copy of the original main.validate_field."""
+    field_rules = rules.get(field_name, {})
+    if field_rules.get('required', False) and value is None:
+        return f"{field_name} is required"
+    if value is None:
+        return None
+    expected_type = field_rules.get('type')
+    if expected_type == 'str' and not isinstance(value, str):
+        return f"{field_name} must be a string"
+    elif expected_type == 'int' and not isinstance(value, int):
+        return f"{field_name} must be an integer"
+    if isinstance(value, str):
+        min_length = field_rules.get('min_length', 0)
+        if len(value) < min_length:
+            return f"{field_name} must be at least {min_length} characters long"
+    if isinstance(value, (int, float)):
+        min_val = field_rules.get('min')
+        max_val = field_rules.get('max')
+        if min_val is not None and value < min_val:
+            return f"{field_name} must be greater than or equal to {min_val}"
+        if max_val is not None and value > max_val:
+            return f"{field_name} must be less than or equal to {max_val}"
+    return None
+
+
+def validate_legacy(data):
+    """The original per-request validation loop from data_validator."""
+    rules = {
+        'name': {'required': True, 'type': 'str', 'min_length': 1},
+        'email': {'required': True, 'type': 'str', 'pattern': EMAIL_PATTERN},
+        'age': {'required': True, 'type': 'int', 'min': 0}
+    }
+    errors = []
+    for field, field_rules in rules.items():
+        if field_rules.get('required', False) and field not in data:
+            errors.append(f"{field} is required")
+            continue
+        if field in data:
+            value = data[field]
+            error = validate_field(field, value, rules)
+            if error:
+                errors.append(error)
+                continue
+            if isinstance(value, str) and 'pattern' in field_rules:
+                if not re.match(field_rules['pattern'], value):
+                    errors.append(f"{field} format is invalid")
+    return errors
+
+
+validate_compiled = compile_schema({
+    'type': 'object',
+    'required': ['name', 'email', 'age'],
+    'properties': {
+        'name': {'type': 'string', 'minLength': 1},
+        'email': {'type': 'string', 'pattern': EMAIL_PATTERN},
+        'age': {'type': 'integer', 'minimum': 0}
+    }
+})
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    assert validate_legacy(VALID) == [] and validate_compiled(VALID) == []
+    assert validate_legacy(INVALID) == [e.message for e in validate_compiled(INVALID)]
+
+    print(f"{'payload':<10}{'implementation':<16}{'validations/sec':>18}")
+    for label, payload in (('valid', VALID), ('invalid', INVALID)):
+        for name, func in (('rules dict', validate_legacy), ('compiled', validate_compiled)):
+            seconds = min(timeit.repeat(lambda: func(payload), number=iterations, repeat=3))
+            print(f"{label:<10}{name:<16}{iterations / seconds:>18,.0f}")
+
+
+if __name__ == '__main__':
+    main()
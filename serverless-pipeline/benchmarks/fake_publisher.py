@@ -0,0 +1,101 @@
+"""
+Local stand-in for google.cloud.pubsub_v1.PublisherClient.
+
+Reproduces the client's batching (max messages, bytes and latency) and
+publish flow control, and simulates each publish RPC with a fixed
+round-trip time plus a per-byte cost. Used by the benchmarks so they run
+without network access or credentials.
+"""
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class FlowControlLimitError(Exception):
+    """Raised when flow control limits are exceeded with the 'error' behavior."""
+
+
+class FakeBatchingPublisher:
+    """Batching publisher whose RPCs are simulated with sleeps."""
+
+    def __init__(self, settings, rpc_latency=0.002, seconds_per_byte=2e-9, rpc_workers=10):
+        self.settings = settings
+        self.rpc_latency = rpc_latency
+        self.seconds_per_byte = seconds_per_byte
+        self.rpc_count = 0
+        self.message_count = 0
+        self.byte_count = 0
+        self._lock = threading.Condition()
+        self._batches = {}  # topic -> (messages, size, started)
+        self._pending_messages = 0
+        self._pending_bytes = 0
+        self._next_id = 0
+        self._closed = False
+        self._executor = ThreadPoolExecutor(max_workers=rpc_workers)
+        self._timer = threading.Thread(target=self._flush_expired, daemon=True)
+        self._timer.start()
+
+    def topic_path(self, project, topic):
+        return f"projects/{project}/topics/{topic}"
+
+    def publish(self, topic, data, ordering_key='', **attributes):
+        future = Future()
+        with self._lock:
+            self._wait_for_capacity(len(data))
+            self._pending_messages += 1
+            self._pending_bytes += len(data)
+            messages, size, started = self._batches.get(topic, ([], 0, time.monotonic()))
+            messages.append((data, attributes, future))
+            size += len(data)
+            if len(messages) >= self.settings.max_messages or size >= self.settings.max_bytes:
+                self._batches.pop(topic, None)
+                self._commit(topic, messages)
+            else:
+                self._batches[topic] = (messages, size, started)
+        return future
+
+    def _wait_for_capacity(self, size):
+        behavior = self.settings.limit_behavior
+        if behavior == 'ignore':
+            return
+        while (self._pending_messages + 1 > self.settings.flow_max_messages
+               or self._pending_bytes + size > self.settings.flow_max_bytes):
+            if behavior == 'error':
+                raise FlowControlLimitError("Flow control limits exceeded")
+            self._lock.wait()
+
+    def _flush_expired(self):
+        while not self._closed:
+            time.sleep(min(self.settings.max_latency, 0.001) or 0.0005)
+            now = time.monotonic()
+            with self._lock:
+                for topic, (messages, _, started) in list(self._batches.items()):
+                    if now - started >= self.settings.max_latency:
+                        del self._batches[topic]
+                        self._commit(topic, messages)
+
+    def _commit(self, topic, messages):
+        self._executor.submit(self._send, messages)
+
+    def _send(self, messages):
+        size = sum(len(data) for data, _, _ in messages)
+        time.sleep(self.rpc_latency + size * self.seconds_per_byte)
+        with self._lock:
+            self.rpc_count += 1
+            self.message_count += len(messages)
+            self.byte_count += size
+            self._pending_messages -= len(messages)
+            self._pending_bytes -= size
+            first_id = self._next_id
+            self._next_id += len(messages)
+            self._lock.notify_all()
+        for offset, (_, _, future) in enumerate(messages):
+            future.set_result(str(first_id + offset))
+
+    def close(self):
+        with self._lock:
+            for topic, (messages, _, _) in list(self._batches.items()):
+                self._commit(topic, messages)
+            self._batches.clear()
+        self._closed = True
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,119 @@
+"""
+Import-time report for the function entry points, from `python -X importtime`.
+
+Each entry point is imported in a fresh interpreter several times and the
+fastest run is reported: total time, time spent in the function's own
+modules, the heaviest dependencies, and whether any client library that
+should be created lazily was imported.
+
+Usage:
+    python benchmarks/import_time.py [runs]
+"""
+import glob
+import os
+import subprocess
+import sys
+from typing import Dict, List, NamedTuple, Optional
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+ENTRY_POINTS = {
+    'data_validator': os.path.join(ROOT, 'src', 'functions', 'data_validator'),
+    'backup_verifier': os.path.join(ROOT, 'src', 'functions', 'backup_verifier'),
+    # Variants in the repository root tree, which are not vendored
+    'root data_validator': os.path.join(ROOT, '..', 'src', 'functions', 'data_validator'),
+    'root event validator': os.path.join(ROOT, '..'),
+}
+
+# Modules that belong behind a lazy client, not in module import
+LAZY_MODULES = ('google.cloud.pubsub_v1', 'google.cloud.storage', 'grpc')
+
+
+class ImportRecord(NamedTuple):
+    """One line of -X importtime output; times in microseconds."""
+    name: str
+    self_us: int
+    cumulative_us: int
+    depth: int  # 0 for a module imported directly by the -c statement
+
+
+def parse_importtime(output: str) -> List[ImportRecord]:
+    """Parse the stderr of `python -X importtime`, skipping other lines."""
+    records = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        parts = line[len('import time:'):].split('|')
+        self_us, cumulative_us, name = int(parts[0]), int(parts[1]), parts[2].rstrip()
+        stripped = name.lstrip()
+        # One space follows the separator, then two per nesting level
+        records.append(ImportRecord(stripped, self_us, cumulative_us,
+                                    (len(name) - len(stripped) - 1) // 2))
+    return records
+
+
+def measure(directory: str, module: str = 'main', runs: int = 5) -> List[ImportRecord]:
+    """Import module from directory in fresh interpreters; return the fastest run."""
+    best = None
+    for _ in range(runs):
+        completed = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+            cwd=directory, capture_output=True, text=True,
+            env=dict(os.environ, PYTHONDONTWRITEBYTECODE=''),
+        )
+        if completed.returncode != 0:
+            raise RuntimeError(completed.stderr.strip().splitlines()[-1])
+        records = parse_importtime(completed.stderr)
+        if best is None or total_us(records, module) < total_us(best, module):
+            best = records
+    return best
+
+
+def total_us(records: List[ImportRecord], module: str = 'main') -> int:
+    """Cumulative import time of the top-level module."""
+    return next(r.cumulative_us for r in records if r.name == module and r.depth == 0)
+
+
+def own_modules(records: List[ImportRecord], directory: str) -> Dict[str, int]:
+    """Self time of the function's own single-file modules (vendored ones excluded)."""
+    own = {}
+    for record in records:
+        if '.' in record.name or not os.path.isfile(os.path.join(directory, record.name + '.py')):
+            continue
+        if glob.glob(os.path.join(directory, record.name + '-*.dist-info')):
+            continue
+        own[record.name] = record.self_us
+    return own
+
+
+def imported_lazy_modules(records: List[ImportRecord]) -> List[str]:
+    """Lazily created client modules that were imported anyway."""
+    names = {record.name for record in records}
+    return [name for name in LAZY_MODULES if name in names]
+
+
+def report(name: str, directory: str, runs: int, top: int = 8) -> Optional[int]:
+    try:
+        records = measure(directory, runs=runs)
+    except RuntimeError as e:
+        print(f"{name}: import failed: {e}\n")
+        return None
+    total = total_us(records)
+    own = own_modules(records, directory)
+    print(f"{name}: {total / 1000:.1f} ms total, {sum(own.values()) / 1000:.1f} ms in own modules")
+    heaviest = sorted((r for r in records if r.depth == 1), key=lambda r: -r.cumulative_us)
+    for record in heaviest[:top]:
+        print(f"    {record.name:<32}{record.cumulative_us / 1000:>10.1f} ms")
+    lazy = imported_lazy_modules(records)
+    print(f"    lazily created clients imported at startup: {', '.join(lazy) or 'none'}\n")
+    return total
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    for name, directory in ENTRY_POINTS.items():
+        report(name, directory, runs)
+
+
+if __name__ == '__main__':
+    main()
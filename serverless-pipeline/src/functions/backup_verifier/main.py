@@ -2,8 +2,17 @@ import base64
 import json
 import os
 from datetime import datetime
-from google.cloud import pubsub_v1
-from google.cloud import storage
+
+from publisher_config import LazyClient, create_publisher
+
+def create_storage_client():
+    """Create the Cloud Storage client; imported here to keep it out of cold starts."""
+    from google.cloud import storage
+    return storage.Client()
+
+# Clients are created on the first invocation and reused by later ones
+storage_client = LazyClient(create_storage_client)
+publisher = LazyClient(create_publisher)
 
 def verify_backup(event, context):
     """Cloud Function triggered by Cloud Storage when a backup is completed.
@@ -22,7 +31,6 @@ def verify_backup(event, context):
     topic_name = os.environ.get('TOPIC_NAME')
     
     # Verify backup files
-    storage_client = storage.Client()
     bucket = storage_client.bucket(bucket_name)
     
     # Check backup completion by verifying metadata files
@@ -40,7 +48,6 @@ def verify_backup(event, context):
     }
     
     # Publish notification
-    publisher = pubsub_v1.PublisherClient()
     topic_path = publisher.topic_path(project_id, topic_name)
     
     try:
@@ -0,0 +1,141 @@
+"""
+Duplicate suppression for retried publishes.
+
+Every event gets an idempotency key: the client's Idempotency-Key header
+if it sent one, else the event's own event_id, else a hash of its
+canonical JSON. Once an event is published, its key maps to the Pub/Sub
+message id for a while, and a retry of the same event is answered from
+the cache instead of being published again.
+
+InMemoryDedupCache keeps entries per instance in TTL+LRU order.
+RedisDedupCache keeps them in a Redis-protocol server shared by all
+instances.
+"""
+import collections
+import hashlib
+import json
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from metrics import metrics
+from ratelimit_backends import BackendError, RedisBackend
+
+logger = logging.getLogger(__name__)
+
+
+def idempotency_key(topic_path: str, data: Dict[str, Any], header: Optional[str] = None) -> str:
+    """Derive the key for publishing an event to a topic."""
+    if header:
+        key = f"key:{header}"
+    elif data.get('event_id') is not None:
+        key = f"event:{data['event_id']}"
+    else:
+        canonical = json.dumps(data, sort_keys=True, separators=(',', ':'),
+                               ensure_ascii=False, default=str)
+        key = f"sha256:{hashlib.sha256(canonical.encode('utf-8')).hexdigest()}"
+    return f"{topic_path}|{key}"
+
+
+class DedupCache:
+    """Interface for a store of idempotency key -> published message id."""
+
+    def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def put(self, key: str, message_id: str) -> None:
+        raise NotImplementedError
+
+    def lookup(self, key: str) -> Optional[str]:
+        """Get a key, counting the hit or miss."""
+        message_id = self.get(key)
+        metrics.increment('idempotency_hits' if message_id is not None else 'idempotency_misses')
+        return message_id
+
+
+class InMemoryDedupCache(DedupCache):
+    """Bounded per-instance cache; entries expire after ttl seconds."""
+
+    def __init__(self, ttl: float, max_entries: int = 100000,
+                 clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()  # key -> (expires, message id)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key):
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= now:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, message_id):
+        now = self._clock()
+        with self._lock:
+            entries = self._entries
+            entries[key] = (now + self.ttl, message_id)
+            entries.move_to_end(key)
+            # Drop expired entries from the LRU end, then entries over capacity
+            while entries:
+                expires = next(iter(entries.values()))[0]
+                if expires > now and len(entries) <= self.max_entries:
+                    break
+                entries.popitem(last=False)
+                metrics.increment('idempotency_evictions')
+
+    def clear(self) -> None:
+        """Forget all keys."""
+        with self._lock:
+            self._entries.clear()
+
+
+class RedisDedupCache(DedupCache):
+    """
+    Cache shared by all instances through a Redis-protocol server.
+    Backend errors are logged and treated as misses.
+    """
+
+    def __init__(self, client: RedisBackend, ttl: int):
+        self.client = client
+        self.ttl = max(1, int(ttl))
+
+    @classmethod
+    def from_url(cls, url: str, ttl: int) -> 'RedisDedupCache':
+        return cls(RedisBackend.from_url(url, prefix='idempotency'), ttl)
+
+    def get(self, key):
+        try:
+            value = self.client.execute(('GET', f"{self.client.prefix}:{key}"))[0]
+        except BackendError as e:
+            logger.warning(str(e))
+            metrics.increment('idempotency_backend_errors')
+            return None
+        return value.decode('utf-8') if value is not None else None
+
+    def put(self, key, message_id):
+        try:
+            self.client.execute(('SET', f"{self.client.prefix}:{key}", message_id, 'EX', self.ttl))
+        except BackendError as e:
+            logger.warning(str(e))
+            metrics.increment('idempotency_backend_errors')
+
+
+def create_dedup_cache(ttl: float, max_entries: int = 100000,
+                       redis_url: Optional[str] = None) -> Optional[DedupCache]:
+    """Create the configured cache; a ttl of 0 disables deduplication."""
+    if ttl <= 0:
+        return None
+    if redis_url:
+        return RedisDedupCache.from_url(redis_url, int(ttl))
+    return InMemoryDedupCache(ttl, max_entries)
@@ -1,97 +1,155 @@
 import json
-import re
+import math
 import time
+import uuid
 from datetime import datetime
-from typing import Dict, Any, Tuple, Optional, List
-from google.cloud import pubsub_v1
+from typing import Dict, Any, Iterator, Tuple, Optional, List, Set
 import functions_framework
-from flask import Request
+from flask import Request, Response, after_this_request, has_request_context
 import os
 
-# Initialize Pub/Sub client
-publisher = pubsub_v1.PublisherClient()
+from idempotency import create_dedup_cache, idempotency_key
+from metrics import metrics
+from publisher_config import LazyClient, create_publisher, open_channel
+from publishing import InFlightWindow
+from ratelimit import RateLimitResult, create_rate_limiter
+from ratelimit_backends import RedisBackend
+from schema import compile_schema
+
+# Pub/Sub client with the configured batching and flow control, created
+# on first use to keep it out of cold-start import time
+publisher = LazyClient(create_publisher)
+WARMUP_TIMEOUT = float(os.getenv('WARMUP_TIMEOUT_SECONDS', '10'))
+
+# Event schema, compiled once at import
+EVENT_SCHEMA = {
+    'type': 'object',
+    'required': ['name', 'email', 'age'],
+    'properties': {
+        'name': {'type': 'string', 'minLength': 1},
+        'email': {'type': 'string', 'pattern': r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'},
+        'age': {'type': 'integer', 'minimum': 0},
+        'address': {
+            'type': 'object',
+            'properties': {
+                'street': {'type': 'string', 'minLength': 1},
+                'city': {'type': 'string', 'minLength': 1},
+                'state': {'type': 'string', 'minLength': 1},
+                'zip': {'type': 'string', 'pattern': r'^\d{5}(-\d{4})?$'}
+            }
+        }
+    }
+}
+validate_event = compile_schema(EVENT_SCHEMA)
+
+# Batch configuration
+NDJSON_CONTENT_TYPE = 'application/x-ndjson'
+BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', '500'))
+BATCH_MAX_BYTES = int(os.getenv('BATCH_MAX_BYTES', str(5 * 1024 * 1024)))
+MALFORMED = object()  # Placeholder for an NDJSON line that is not valid JSON
+
+# Streaming NDJSON configuration (POST /stream)
+STREAM_READ_BYTES = int(os.getenv('STREAM_READ_BYTES', str(64 * 1024)))
+STREAM_CHUNK_ITEMS = int(os.getenv('STREAM_CHUNK_ITEMS', '500'))
+STREAM_MAX_LINE_BYTES = int(os.getenv('STREAM_MAX_LINE_BYTES', str(1024 * 1024)))
+TOO_LONG = object()  # Placeholder for a streamed line over STREAM_MAX_LINE_BYTES
+
+# Asynchronous acknowledgement configuration
+ASYNC_ACK = os.getenv('ASYNC_ACK', 'false').lower() == 'true'
+MAX_IN_FLIGHT = int(os.getenv('MAX_IN_FLIGHT', '1000'))
+RETRY_AFTER_SECONDS = os.getenv('RETRY_AFTER_SECONDS', '1')
+in_flight_window = InFlightWindow(MAX_IN_FLIGHT, int(os.getenv('RETRY_BUFFER_SIZE', '1000')),
+                                  int(os.getenv('PUBLISH_MAX_ATTEMPTS', '5')))
 
 # Rate limiting configuration
 RATE_LIMIT = 100  # requests per minute
-rate_limit_dict = {}
+RATE_LIMIT_WINDOW = 60  # seconds
+# Set to share the limit across instances, e.g. redis://10.0.0.3:6379/0
+RATE_LIMIT_REDIS_URL = os.getenv('RATE_LIMIT_REDIS_URL')
+rate_limiter = create_rate_limiter(
+    os.getenv('RATE_LIMIT_ALGORITHM', 'sliding_window'),
+    RATE_LIMIT,
+    RATE_LIMIT_WINDOW,
+    max_keys=int(os.getenv('RATE_LIMIT_MAX_KEYS', '100000')),
+    backend=RedisBackend.from_url(RATE_LIMIT_REDIS_URL) if RATE_LIMIT_REDIS_URL else None,
+    lease_size=int(os.getenv('RATE_LIMIT_LEASE_SIZE', '10')),
+    backend_cooldown=float(os.getenv('RATE_LIMIT_BACKEND_COOLDOWN_SECONDS', '5'))
+)
+rate_limit_dict = rate_limiter  # Former name, still used to reset limiter state
 
-def rate_limit(ip: str) -> bool:
+# Idempotency configuration; a TTL of 0 turns duplicate suppression off
+IDEMPOTENCY_TTL = float(os.getenv('IDEMPOTENCY_TTL_SECONDS', '600'))
+idempotency_cache = create_dedup_cache(
+    IDEMPOTENCY_TTL,
+    int(os.getenv('IDEMPOTENCY_MAX_KEYS', '100000')),
+    os.getenv('IDEMPOTENCY_REDIS_URL')
+)
+
+def check_rate_limit(ip: str) -> Optional[RateLimitResult]:
     """
-    Implement rate limiting based on IP address.
-    Returns True if rate limit is exceeded, False otherwise.
+    Count a request against the IP address's rate limit.
+    Returns None when rate limiting is skipped.
     """
     # Skip rate limiting in test environment unless explicitly testing rate limiting
     if os.getenv('PYTEST_CURRENT_TEST') and not os.getenv('TEST_RATE_LIMIT'):
-        return False
-        
-    current_time = time.time()
-    minute_window = current_time - 60
-    
-    # Clean up old entries
-    if ip in rate_limit_dict:
-        rate_limit_dict[ip] = [t for t in rate_limit_dict[ip] if t > minute_window]
-    
-    # Get request count for this IP
-    requests = len(rate_limit_dict.get(ip, []))
-    
-    if requests >= RATE_LIMIT:
-        return True
-        
-    # Add new request timestamp
-    if ip not in rate_limit_dict:
-        rate_limit_dict[ip] = []
-    rate_limit_dict[ip].append(current_time)
-    
-    return False
+        return None
+    return rate_limiter.acquire(ip)
 
-def validate_field(field_name: str, value: Any, rules: Dict) -> Optional[str]:
+def rate_limit(ip: str) -> bool:
     """
-    Validate a single field according to the provided rules.
-    Returns error message if validation fails, None otherwise.
+    Implement rate limiting based on IP address.
+    Returns True if rate limit is exceeded, False otherwise.
     """
-    field_rules = rules.get(field_name, {})
-    
-    # Check required
-    if field_rules.get('required', False) and value is None:
-        return f"{field_name} is required"
-        
-    if value is None:
-        return None
-        
-    # Check type
-    expected_type = field_rules.get('type')
-    if expected_type == 'str' and not isinstance(value, str):
-        return f"{field_name} must be a string"
-    elif expected_type == 'int' and not isinstance(value, int):
-        return f"{field_name} must be an integer"
-        
-    # Check string length
-    if isinstance(value, str):
-        min_length = field_rules.get('min_length', 0)
-        if len(value) < min_length:
-            return f"{field_name} must be at least {min_length} characters long"
-            
-    # Check number range
-    if isinstance(value, (int, float)):
-        min_val = field_rules.get('min')
-        max_val = field_rules.get('max')
-        if min_val is not None and value < min_val:
-            return f"{field_name} must be greater than or equal to {min_val}"
-        if max_val is not None and value > max_val:
-            return f"{field_name} must be less than or equal to {max_val}"
-            
-    return None
+    result = check_rate_limit(ip)
+    return result is not None and not result.allowed
+
+def add_response_headers(headers: Dict[str, str]) -> None:
+    """Attach headers to the response of the current Flask request, if any."""
+    if not has_request_context():
+        return
+
+    @after_this_request
+    def apply_headers(response):
+        response.headers.update(headers)
+        return response
+
+def add_rate_limit_headers(result: RateLimitResult) -> None:
+    """Attach X-RateLimit-* headers (and Retry-After when limited) to the response."""
+    headers = {
+        'X-RateLimit-Limit': str(result.limit),
+        'X-RateLimit-Remaining': str(result.remaining),
+        'X-RateLimit-Reset': str(math.ceil(result.reset))
+    }
+    if not result.allowed:
+        headers['Retry-After'] = headers['X-RateLimit-Reset']
+    add_response_headers(headers)
+
+def warm_up() -> Tuple[Dict, int]:
+    """Create the publisher and connect its gRPC channel ahead of traffic."""
+    start = time.monotonic()
+    try:
+        open_channel(publisher.get(), WARMUP_TIMEOUT)
+    except Exception as e:
+        return {"status": "error", "error": f"Warmup failed: {str(e)}"}, 503
+    return {"status": "warm", "seconds": round(time.monotonic() - start, 3)}, 200
+
+def get_topic_path(request: Request) -> str:
+    """Return the events topic path for the request's project."""
+    return publisher.topic_path(
+        request.environ.get("PROJECT_ID", "servless-pipeline"),
+        "events-topic"
+    )
 
 def transform_data(data: Dict) -> Dict:
     """Transform and normalize data fields."""
     transformed = data.copy()
     
     # Transform email: strip whitespace and convert to lowercase
-    if 'email' in transformed:
+    if isinstance(transformed.get('email'), str):
         transformed['email'] = transformed['email'].strip().lower()
     
     # Transform phone: remove all non-digit characters
-    if 'phone' in transformed:
+    if isinstance(transformed.get('phone'), str):
         transformed['phone'] = ''.join(filter(str.isdigit, transformed['phone']))
     
     # Keep timestamp as is if it's already in ISO format
@@ -99,94 +157,401 @@ def transform_data(data: Dict) -> Dict:
     
     return transformed
 
-@functions_framework.http
-def data_validator(request: Request) -> Tuple[Dict, int]:
+def check_event(data: Any) -> Tuple[Optional[Dict], List[str]]:
     """
-    Validate incoming event data and publish to Pub/Sub if valid.
+    Transform and validate a single event.
+    Returns the transformed event and a list of error messages.
     """
-    # Handle health check endpoint
-    if request.method == 'GET' and getattr(request, 'path', '') == '/health':
-        return {'status': 'healthy'}, 200
-    
-    # Get client IP for rate limiting
-    client_ip = request.headers.get('X-Forwarded-For', request.remote_addr)
-    
-    # Check rate limit
-    if rate_limit(client_ip):
-        return {"error": "Rate limit exceeded"}, 429
-        
-    # Parse request data
-    try:
-        data = request.get_json()
-        if not data:
-            return {"error": "Invalid request: no data provided"}, 400
-    except Exception:
-        return {"error": "Invalid request: malformed JSON"}, 400
-        
-    # Validation rules
-    rules = {
-        'name': {'required': True, 'type': 'str', 'min_length': 1},
-        'email': {'required': True, 'type': 'str', 'pattern': r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'},
-        'age': {'required': True, 'type': 'int', 'min': 0}
-    }
-    
-    # Transform data
+    if not isinstance(data, dict):
+        return None, ["Expected a JSON object"]
     try:
         transformed_data = transform_data(data)
     except ValueError as e:
-        return {"error": str(e)}, 400
-    
-    # Validate fields
-    errors = []
-    for field, field_rules in rules.items():
-        if field_rules.get('required', False) and field not in transformed_data:
-            errors.append(f"{field} is required")
+        return None, [str(e)]
+    return transformed_data, [error.message for error in validate_event(transformed_data)]
+
+def build_message(transformed_data: Dict, client_ip: str, user_agent: Optional[str]) -> bytes:
+    """Encode a validated event with request metadata for Pub/Sub."""
+    message_data = {
+        "data": transformed_data,
+        "metadata": {
+            "ip": client_ip,
+            "user_agent": user_agent,
+            "timestamp": datetime.utcnow().isoformat()
+        }
+    }
+    return json.dumps(message_data).encode('utf-8')
+
+def wants_async_ack(request: Request) -> bool:
+    """Return True if the publish should be acknowledged without waiting."""
+    return ASYNC_ACK or 'respond-async' in request.headers.get('Prefer', '')
+
+def retry_failed_publishes() -> None:
+    """Republish asynchronously acknowledged events whose publish failed."""
+    if in_flight_window.retry_pending:
+        in_flight_window.replay(publisher.publish)
+
+def publish_async(topic_path: str, data: bytes) -> Tuple:
+    """
+    Hand a message to the publisher client and return 202 without waiting.
+    Returns 503 when too many publishes are already in flight.
+    """
+    retry_failed_publishes()
+    if not in_flight_window.try_acquire():
+        metrics.increment('publish_async_rejected')
+        return {"error": "Too many publishes in flight, retry later"}, 503, {
+            'Retry-After': RETRY_AFTER_SECONDS
+        }
+    request_id = str(uuid.uuid4())
+    try:
+        future = publisher.publish(topic_path, data)
+    except Exception as e:
+        in_flight_window.release()
+        return {"error": f"Error publishing event: {str(e)}"}, 500
+    in_flight_window.track(future, request_id, data, topic_path)
+    return {
+        "message": "Event validated and accepted for publishing",
+        "request_id": request_id
+    }, 202
+
+def read_body(request: Request) -> Optional[bytes]:
+    """
+    Read the request body, at most BATCH_MAX_BYTES of it.
+    Returns None if it is larger, whether or not it has a Content-Length.
+    """
+    if (request.content_length or 0) > BATCH_MAX_BYTES:
+        return None
+    chunks = []
+    size = 0
+    while size <= BATCH_MAX_BYTES:
+        chunk = request.stream.read(BATCH_MAX_BYTES + 1 - size)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        size += len(chunk)
+    return None if size > BATCH_MAX_BYTES else b''.join(chunks)
+
+def parse_json(body: bytes) -> Any:
+    """Parse a JSON body; returns MALFORMED if it is not valid JSON."""
+    try:
+        return json.loads(body)
+    except ValueError:
+        return MALFORMED
+
+def parse_ndjson(body: bytes) -> List[Any]:
+    """
+    Parse a newline-delimited JSON body.
+    Blank lines are skipped; malformed lines are returned as MALFORMED.
+    """
+    items = []
+    for line in body.splitlines():
+        if not line.strip():
             continue
-        
-        if field in transformed_data:
-            value = transformed_data[field]
-            # Basic field validation
-            error = validate_field(field, value, rules)
-            if error:
-                errors.append(error)
+        try:
+            items.append(json.loads(line))
+        except ValueError:
+            items.append(MALFORMED)
+    return items
+
+def prepare_item(index: int, item: Any, topic_path: str,
+                 seen_keys: Set[str]) -> Tuple[Dict, Optional[Dict], Optional[str]]:
+    """
+    Validate one batch item and check whether it was already published.
+    Returns its result with the data to publish and its dedup key; the
+    data is None when there is nothing to publish.
+    """
+    if item is MALFORMED:
+        return {"index": index, "status": "invalid", "errors": ["malformed JSON"]}, None, None
+    if item is TOO_LONG:
+        return {"index": index, "status": "invalid",
+                "errors": [f"line longer than {STREAM_MAX_LINE_BYTES} bytes"]}, None, None
+    transformed_data, errors = check_event(item)
+    if errors:
+        return {"index": index, "status": "invalid", "errors": errors}, None, None
+
+    result = {"index": index, "status": "published"}
+    dedup_key = None
+    if idempotency_cache is not None:
+        dedup_key = idempotency_key(topic_path, transformed_data)
+        # Repeats within this batch are published again, as before
+        event_id = None if dedup_key in seen_keys else idempotency_cache.lookup(dedup_key)
+        seen_keys.add(dedup_key)
+        if event_id is not None:
+            result.update(event_id=event_id, duplicate=True)
+            return result, None, None
+    return result, transformed_data, dedup_key
+
+def publish_items(items: List[Any], topic_path: str, client_ip: str,
+                  user_agent: Optional[str]) -> List[Dict]:
+    """
+    Validate events and publish the valid ones together.
+    Returns per-item results in order, with "index" counted from 0.
+    """
+    results = []
+    pending = []
+    seen_keys = set()
+    for index, item in enumerate(items):
+        result, transformed_data, dedup_key = prepare_item(index, item, topic_path, seen_keys)
+        results.append(result)
+        if transformed_data is None:
+            continue
+
+        # Hand every valid item to the client before waiting on any of them,
+        # so they go out in as few publish requests as the batch settings allow
+        try:
+            future = publisher.publish(
+                topic_path,
+                build_message(transformed_data, client_ip, user_agent)
+            )
+            pending.append((result, future, dedup_key))
+        except Exception as e:
+            result.update(status="failed", error=f"Error publishing event: {str(e)}")
+
+    for result, future, dedup_key in pending:
+        try:
+            result["event_id"] = future.result()
+        except Exception as e:
+            result.update(status="failed", error=f"Error publishing event: {str(e)}")
+            continue
+        if dedup_key is not None:
+            idempotency_cache.put(dedup_key, result["event_id"])
+    return results
+
+def validate_batch(items: List[Any], topic_path: str, client_ip: str,
+                   user_agent: Optional[str]) -> Tuple[Dict, int]:
+    """
+    Validate a batch of events and publish the valid ones together.
+    Returns per-item results in request order.
+    """
+    if len(items) > BATCH_MAX_ITEMS:
+        return {"error": f"Batch too large: at most {BATCH_MAX_ITEMS} items allowed"}, 413
+
+    results = publish_items(items, topic_path, client_ip, user_agent)
+    counts = {"published": 0, "invalid": 0, "failed": 0}
+    for result in results:
+        counts[result["status"]] += 1
+    status_code = 500 if counts["failed"] and not counts["published"] else 200
+    return {"results": results, **counts}, status_code
+
+def validate_coalesced(items: Any, topic_path: str, client_ip: str,
+                       user_agent: Optional[str]) -> Tuple[Dict, int]:
+    """
+    Answer the frontend's POST /batch: each event gets the status and body
+    a call of its own would have, as {"results": [{"status", "body",
+    "headers"?}, ...]} in request order.
+    """
+    if not isinstance(items, list) or not items:
+        return {"error": "Invalid request: expected a JSON array of events"}, 400
+    if len(items) > BATCH_MAX_ITEMS:
+        return {"error": f"Batch too large: at most {BATCH_MAX_ITEMS} items allowed"}, 413
+    results = []
+    for result in publish_items(items, topic_path, client_ip, user_agent):
+        if result["status"] == "invalid":
+            results.append({"status": 400, "body": {"errors": result["errors"]}})
+        elif result["status"] == "failed":
+            results.append({"status": 500, "body": {"error": result["error"]}})
+        else:
+            answer = {"status": 200, "body": {
+                "message": "Event validated and published successfully",
+                "event_id": result["event_id"]
+            }}
+            if result.get("duplicate"):
+                answer["headers"] = {'Idempotent-Replayed': 'true'}
+            results.append(answer)
+    return {"results": results}, 200
+
+def iter_lines(stream, chunk_size: int, max_line_bytes: int) -> Iterator[Tuple[int, Any]]:
+    """
+    Read a byte stream in chunks and yield (line number, line) pairs.
+    Lines longer than max_line_bytes are discarded as they arrive and
+    yielded as TOO_LONG, so memory use does not depend on the input.
+    """
+    number = 0
+    pending = b''
+    too_long = False
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        *lines, pending = (pending + chunk).split(b'\n')
+        for line in lines:
+            number += 1
+            yield number, TOO_LONG if too_long else line
+            too_long = False
+        if len(pending) > max_line_bytes:
+            too_long = True
+            pending = b''
+    if pending or too_long:
+        yield number + 1, TOO_LONG if too_long else pending
+
+def stream_ndjson(stream, topic_path: str, client_ip: str, user_agent: Optional[str],
+                  all_results: bool = False) -> Iterator[bytes]:
+    """
+    Validate and publish an NDJSON stream STREAM_CHUNK_ITEMS lines at a time.
+    Yields an NDJSON result line per input line that was not published
+    (every line if all_results), then a summary line.
+    """
+    counts = {"lines": 0, "published": 0, "invalid": 0, "failed": 0}
+    numbers = []
+    items = []
+
+    def flush():
+        for result in publish_items(items, topic_path, client_ip, user_agent):
+            result = {"line": numbers[result.pop("index")], **result}
+            counts[result["status"]] += 1
+            if all_results or result["status"] != "published":
+                yield (json.dumps(result) + '\n').encode('utf-8')
+        numbers.clear()
+        items.clear()
+
+    for number, line in iter_lines(stream, STREAM_READ_BYTES, STREAM_MAX_LINE_BYTES):
+        counts["lines"] = number
+        if line is not TOO_LONG:
+            if not line.strip():
                 continue
-            # Pattern validation for strings
-            if isinstance(value, str) and 'pattern' in field_rules:
-                pattern = field_rules['pattern']
-                if not re.match(pattern, value):
-                    errors.append(f"{field} format is invalid")
-    
+            try:
+                line = json.loads(line)
+            except ValueError:
+                line = MALFORMED
+        numbers.append(number)
+        items.append(line)
+        if len(items) >= STREAM_CHUNK_ITEMS:
+            yield from flush()
+    yield from flush()
+    yield (json.dumps({"summary": counts}) + '\n').encode('utf-8')
+
+def too_large() -> Tuple[Dict, int]:
+    """Response to a body over BATCH_MAX_BYTES."""
+    return {"error": f"Request too large: at most {BATCH_MAX_BYTES} bytes allowed"}, 413
+
+def handle_stream(request: Request, client_ip: str, user_agent: Optional[str]) -> Response:
+    """Large NDJSON uploads are read, validated and answered incrementally."""
+    return Response(
+        stream_ndjson(request.stream, get_topic_path(request), client_ip, user_agent,
+                      request.args.get('results') == 'all'),
+        mimetype=NDJSON_CONTENT_TYPE
+    )
+
+def handle_coalesced(request: Request, client_ip: str, user_agent: Optional[str]) -> Tuple:
+    """Submissions coalesced by the frontend, one result per event."""
+    body = read_body(request)
+    if body is None:
+        return too_large()
+    items = parse_json(body) if request.is_json else MALFORMED
+    return validate_coalesced(items, get_topic_path(request), client_ip, user_agent)
+
+def handle_body(request: Request, client_ip: str,
+                user_agent: Optional[str]) -> Tuple[Optional[Tuple], Any]:
+    """
+    Read and parse a request body, up to BATCH_MAX_BYTES. JSON arrays and
+    NDJSON bodies are validated as batches. Returns (response, None) if
+    the request is answered here, or (None, event) for a single event.
+    """
+    body = read_body(request)
+    if body is None:
+        return too_large(), None
+    if request.headers.get('Content-Type', '').startswith(NDJSON_CONTENT_TYPE):
+        data = parse_ndjson(body)
+    else:
+        data = parse_json(body) if request.is_json else MALFORMED
+    if data is MALFORMED:
+        return ({"error": "Invalid request: malformed JSON"}, 400), None
+    if not data:
+        return ({"error": "Invalid request: no data provided"}, 400), None
+    if isinstance(data, list):
+        return validate_batch(data, get_topic_path(request), client_ip, user_agent), None
+    return None, data
+
+def publish_one(request: Request, data: Any, client_ip: str,
+                user_agent: Optional[str]) -> Tuple[Dict, int]:
+    """Validate and publish a single event."""
+    # Transform and validate fields
+    transformed_data, errors = check_event(data)
+
     if errors:
         return {"errors": errors}, 400
-        
+
+    topic_path = get_topic_path(request)
+
+    # A retry of an event that was already published gets the original result
+    dedup_key = None
+    if idempotency_cache is not None:
+        dedup_key = idempotency_key(topic_path, transformed_data,
+                                    request.headers.get('Idempotency-Key'))
+        event_id = idempotency_cache.lookup(dedup_key)
+        if event_id is not None:
+            add_response_headers({'Idempotent-Replayed': 'true'})
+            return {
+                "message": "Event validated and published successfully",
+                "event_id": event_id
+            }, 200
+
+    # Asynchronous acknowledgements are not cached: the outcome is not known yet
+    if wants_async_ack(request):
+        return publish_async(
+            topic_path,
+            build_message(transformed_data, client_ip, user_agent)
+        )
+
     # Publish to Pub/Sub
+    retry_failed_publishes()
     try:
-        topic_path = publisher.topic_path(
-            request.environ.get("PROJECT_ID", "servless-pipeline"),
-            "events-topic"
-        )
-        
-        # Prepare message data
-        message_data = {
-            "data": transformed_data,
-            "metadata": {
-                "ip": client_ip,
-                "user_agent": request.headers.get('User-Agent'),
-                "timestamp": datetime.utcnow().isoformat()
-            }
-        }
-        
-        # Publish message
         future = publisher.publish(
             topic_path,
-            json.dumps(message_data).encode('utf-8')
+            build_message(transformed_data, client_ip, user_agent)
         )
         event_id = future.result()
-        
+        if dedup_key is not None:
+            idempotency_cache.put(dedup_key, event_id)
+
         return {
             "message": "Event validated and published successfully",
             "event_id": event_id
         }, 200
-        
+
     except Exception as e:
-        return {"error": f"Error publishing event: {str(e)}"}, 500
\ No newline at end of file
+        return {"error": f"Error publishing event: {str(e)}"}, 500
+
+# Handlers for paths answered before rate limiting, and for POSTs to
+# paths with a contract of their own; other requests carry events
+GET_HANDLERS = {
+    '/health': lambda: ({'status': 'healthy'}, 200),
+    '/metrics': lambda: (metrics.snapshot(), 200),
+    '/warmup': warm_up,
+}
+POST_HANDLERS = {
+    '/stream': handle_stream,
+    '/batch': handle_coalesced,
+}
+
+@functions_framework.http
+def data_validator(request: Request) -> Tuple[Dict, int]:
+    """
+    Validate incoming event data and publish to Pub/Sub if valid.
+    A JSON array or an application/x-ndjson body is validated as a batch;
+    NDJSON posted to /stream is processed and answered as it is read, and
+    a JSON array posted to /batch gets one single-event answer per item.
+    """
+    path = getattr(request, 'path', '')
+    # Handle health check, metrics and warm-up endpoints
+    if request.method == 'GET' and path in GET_HANDLERS:
+        return GET_HANDLERS[path]()
+
+    # Get client IP for rate limiting
+    client_ip = request.headers.get('X-Forwarded-For', request.remote_addr)
+
+    # Check rate limit
+    limit_result = check_rate_limit(client_ip)
+    if limit_result is not None:
+        add_rate_limit_headers(limit_result)
+        if not limit_result.allowed:
+            return {"error": "Rate limit exceeded"}, 429
+
+    user_agent = request.headers.get('User-Agent')
+    if request.method == 'POST' and path in POST_HANDLERS:
+        return POST_HANDLERS[path](request, client_ip, user_agent)
+
+    response, data = handle_body(request, client_ip, user_agent)
+    if response is not None:
+        return response
+    return publish_one(request, data, client_ip, user_agent)
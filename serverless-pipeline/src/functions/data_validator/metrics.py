@@ -0,0 +1,64 @@
+"""
+In-process counters and gauges for the data validator.
+
+Values live for the lifetime of the function instance and are exposed
+through the /metrics path of data_validator. The frontend keeps a copy
+for its own /metrics path; keep the copies in sync.
+"""
+import threading
+from typing import Dict, Sequence, Union
+
+Number = Union[int, float]
+
+
+class Metrics:
+    """Thread-safe registry of named counters and gauges."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Number] = {}
+        self._gauges: Dict[str, Number] = {}
+
+    def increment(self, name: str, value: Number = 1) -> None:
+        """Add value to a counter."""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def set_gauge(self, name: str, value: Number) -> None:
+        """Set a gauge to its current value."""
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name: str, value: Number, buckets: Sequence[Number]) -> None:
+        """
+        Record a value in a histogram kept as counters: name_count,
+        name_sum and, for each bucket bound, a cumulative name_le_<bound>.
+        """
+        with self._lock:
+            counters = self._counters
+            counters[f'{name}_count'] = counters.get(f'{name}_count', 0) + 1
+            counters[f'{name}_sum'] = counters.get(f'{name}_sum', 0) + value
+            for bound in buckets:
+                key = f'{name}_le_{bound}'
+                counters[key] = counters.get(key, 0) + (value <= bound)
+
+    def get(self, name: str) -> Number:
+        """Return a counter or gauge value, 0 if it was never recorded."""
+        with self._lock:
+            if name in self._gauges:
+                return self._gauges[name]
+            return self._counters.get(name, 0)
+
+    def snapshot(self) -> Dict[str, Dict[str, Number]]:
+        """Return a copy of all current values."""
+        with self._lock:
+            return {'counters': dict(self._counters), 'gauges': dict(self._gauges)}
+
+    def reset(self) -> None:
+        """Clear all values."""
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+
+
+metrics = Metrics()
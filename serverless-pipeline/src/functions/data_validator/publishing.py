@@ -0,0 +1,123 @@
+"""
+Non-blocking publish support for the data validator.
+
+InFlightWindow bounds how many publish futures may be outstanding at
+once. Requests that do not wait for the publish result hand their future
+to the window. A done-callback frees the slot, counts the outcome and
+keeps failed messages in a bounded retry buffer. The client was already
+told 202 for those, so replay() republishes them on a later request, up
+to max_attempts publishes each.
+
+Metrics: publish_async_failures, publish_async_retried,
+publish_async_dropped (given up on, or pushed out of a full buffer) and
+the publish_retry_buffered gauge.
+"""
+import collections
+import logging
+import threading
+from typing import Any, Callable, NamedTuple
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class FailedPublish(NamedTuple):
+    request_id: str
+    topic_path: str
+    data: bytes
+    attempts: int  # Publishes tried so far
+
+
+class InFlightWindow:
+    """Bounded set of outstanding publish futures."""
+
+    def __init__(self, max_in_flight: int, retry_buffer_size: int = 1000,
+                 max_attempts: int = 5):
+        self.max_in_flight = max_in_flight
+        self.retry_buffer_size = retry_buffer_size
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._retry_buffer = collections.deque()
+
+    @property
+    def in_flight(self) -> int:
+        """Number of publishes that have not completed yet."""
+        return self._in_flight
+
+    def try_acquire(self) -> bool:
+        """Reserve a slot; returns False when the window is full."""
+        with self._lock:
+            if self._in_flight >= self.max_in_flight:
+                return False
+            self._in_flight += 1
+            metrics.set_gauge('publish_in_flight', self._in_flight)
+            return True
+
+    def release(self) -> None:
+        """Free a slot reserved by try_acquire."""
+        with self._lock:
+            self._in_flight -= 1
+            metrics.set_gauge('publish_in_flight', self._in_flight)
+
+    @property
+    def retry_pending(self) -> int:
+        """Number of failed publishes waiting to be republished."""
+        return len(self._retry_buffer)
+
+    def track(self, future: Any, request_id: str, data: bytes, topic_path: str = '',
+              attempts: int = 1) -> None:
+        """Release the slot and record the outcome once the future completes."""
+        def on_done(done_future):
+            self.release()
+            try:
+                done_future.result()
+            except Exception as e:
+                logger.error(f"Async publish failed for request {request_id}: {str(e)}")
+                metrics.increment('publish_async_failures')
+                self._buffer(FailedPublish(request_id, topic_path, data, attempts))
+            else:
+                metrics.increment('publish_async_succeeded')
+        future.add_done_callback(on_done)
+
+    def replay(self, publish: Callable[[str, bytes], Any]) -> int:
+        """
+        Republish buffered failures while the window has room, with
+        publish(topic_path, data) returning a future. Returns how many
+        were handed to the client.
+        """
+        replayed = 0
+        while self._retry_buffer and self.try_acquire():
+            try:
+                failed = self._retry_buffer.popleft()
+            except IndexError:
+                self.release()
+                break
+            try:
+                future = publish(failed.topic_path, failed.data)
+            except Exception as e:
+                self.release()
+                logger.error(f"Retry failed for request {failed.request_id}: {str(e)}")
+                self._buffer(failed._replace(attempts=failed.attempts + 1))
+                break
+            self.track(future, failed.request_id, failed.data, failed.topic_path,
+                       failed.attempts + 1)
+            metrics.increment('publish_async_retried')
+            replayed += 1
+        metrics.set_gauge('publish_retry_buffered', len(self._retry_buffer))
+        return replayed
+
+    def _buffer(self, failed: FailedPublish) -> None:
+        with self._lock:
+            if failed.attempts >= self.max_attempts:
+                logger.error(f"Giving up on request {failed.request_id} after "
+                             f"{failed.attempts} publish attempts")
+                metrics.increment('publish_async_dropped')
+            else:
+                if len(self._retry_buffer) >= self.retry_buffer_size:
+                    dropped = self._retry_buffer.popleft()
+                    logger.error(f"Retry buffer full, dropping request {dropped.request_id}")
+                    metrics.increment('publish_async_dropped')
+                self._retry_buffer.append(failed)
+            metrics.set_gauge('publish_retry_buffered', len(self._retry_buffer))
@@ -0,0 +1,260 @@
+"""
+Per-key rate limiters with constant work per call and bounded memory.
+
+Keys are spread over lock stripes so threaded servers do not contend on
+a single lock. Each stripe keeps its keys in LRU order and evicts keys
+that have been idle longer than the limiter's TTL, or the least recently
+seen keys once the stripe is over capacity. The TTL is chosen so an
+evicted key would have come back with a fresh state anyway.
+"""
+import collections
+import logging
+import math
+import threading
+import time
+from typing import Any, Callable, List, NamedTuple, Optional
+
+from metrics import metrics
+from ratelimit_backends import BackendError
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitResult(NamedTuple):
+    """Outcome of a rate limit check, with values for the X-RateLimit-* headers."""
+    allowed: bool
+    limit: int
+    remaining: int
+    reset: float  # Seconds until the limit resets
+
+
+class _Stripe:
+    """One lock and the LRU-ordered states of the keys hashed to it."""
+    __slots__ = ('lock', 'states')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.states = collections.OrderedDict()
+
+
+class RateLimiter:
+    """
+    Base class for striped, LRU/TTL-evicting per-key limiters.
+    Subclasses implement _new_state and _update; a state is a list whose
+    last element is the time the key was last seen, which _update sets.
+    """
+
+    def __init__(self, limit: int, window: float, idle_ttl: float,
+                 max_keys: int = 100000, stripes: int = 64,
+                 clock: Callable[[], float] = time.monotonic):
+        self.limit = limit
+        self.window = window
+        self.idle_ttl = idle_ttl
+        self.stripe_capacity = max(1, max_keys // stripes)
+        self._stripes = [_Stripe() for _ in range(stripes)]
+        self._clock = clock
+
+    def __len__(self) -> int:
+        return sum(len(stripe.states) for stripe in self._stripes)
+
+    def acquire(self, key: str) -> RateLimitResult:
+        """Count one request for key and report whether it is allowed."""
+        now = self._clock()
+        stripe = self._stripes[hash(key) % len(self._stripes)]
+        with stripe.lock:
+            states = stripe.states
+            state = states.get(key)
+            if state is None:
+                state = self._new_state(key, now)
+                states[key] = state
+                self._evict(states, now)
+            else:
+                states.move_to_end(key)
+            return self._update(state, now)
+
+    def _evict(self, states: collections.OrderedDict, now: float) -> None:
+        """Drop idle keys from the LRU end, then keys over capacity."""
+        expired = now - self.idle_ttl
+        while states:
+            oldest = next(iter(states.values()))
+            if oldest[-1] >= expired and len(states) <= self.stripe_capacity:
+                break
+            states.popitem(last=False)
+
+    def clear(self) -> None:
+        """Forget all keys."""
+        for stripe in self._stripes:
+            with stripe.lock:
+                stripe.states.clear()
+
+    def _new_state(self, key: str, now: float) -> List[Any]:
+        raise NotImplementedError
+
+    def _update(self, state: List[Any], now: float) -> RateLimitResult:
+        raise NotImplementedError
+
+
+class TokenBucketLimiter(RateLimiter):
+    """
+    Token bucket holding up to `limit` tokens, refilled at limit/window per second.
+    Allows bursts up to the full limit.
+    """
+
+    def __init__(self, limit: int, window: float, **kwargs):
+        # A bucket idle for one full window is full again, same as a new one
+        super().__init__(limit, window, idle_ttl=window, **kwargs)
+        self.rate = limit / window
+
+    def _new_state(self, key, now):
+        return [float(self.limit), now]  # tokens, last seen
+
+    def _update(self, state, now):
+        tokens = min(float(self.limit), state[0] + (now - state[1]) * self.rate)
+        state[1] = now
+        if tokens >= 1:
+            tokens -= 1
+            state[0] = tokens
+            return RateLimitResult(True, self.limit, int(tokens),
+                                   (self.limit - tokens) / self.rate)
+        state[0] = tokens
+        return RateLimitResult(False, self.limit, 0, (1 - tokens) / self.rate)
+
+
+class SlidingWindowLimiter(RateLimiter):
+    """
+    Sliding window counter: the current fixed window's count plus the
+    previous window's count weighted by how much of it still overlaps
+    the sliding window. Approximates a true sliding log in O(1) memory.
+    """
+
+    def __init__(self, limit: int, window: float, **kwargs):
+        # After two idle windows both counters would be zero anyway
+        super().__init__(limit, window, idle_ttl=2 * window, **kwargs)
+
+    def _new_state(self, key, now):
+        # window index, count, previous count, last seen
+        return [int(now // self.window), 0, 0, now]
+
+    def _update(self, state, now):
+        index = int(now // self.window)
+        if index != state[0]:
+            state[2] = state[1] if index - state[0] == 1 else 0
+            state[1] = 0
+            state[0] = index
+        state[3] = now
+        elapsed = now - index * self.window
+        estimate = state[2] * (1 - elapsed / self.window) + state[1]
+        reset = self.window - elapsed
+        if estimate + 1 > self.limit:
+            return RateLimitResult(False, self.limit, 0, reset)
+        state[1] += 1
+        return RateLimitResult(True, self.limit, int(self.limit - estimate - 1), reset)
+
+
+class LeasedRateLimiter(RateLimiter):
+    """
+    Fixed window limit shared by all instances through a CounterBackend.
+
+    Instead of a backend round trip per request, an instance leases up to
+    `lease_size` requests at a time and spends them locally. The backend
+    never grants more than `limit` per window in total, so the global
+    limit holds; tokens leased but not spent before the window ends are
+    lost, which can only make the limit stricter. Leases are reserved
+    outside the stripe lock, so a slow backend only delays the requests
+    that need a lease. If the backend fails, the instance enforces the
+    limit on its own with a sliding window for `backend_cooldown` seconds
+    before trying the backend again, so an outage neither takes the
+    validator down nor stalls every request on the backend's timeout.
+    """
+
+    def __init__(self, limit: int, window: float, backend, lease_size: int = 10,
+                 backend_cooldown: float = 5.0, clock: Callable[[], float] = time.time,
+                 **kwargs):
+        # Windows must line up across instances, hence wall-clock time
+        super().__init__(limit, window, idle_ttl=window, clock=clock, **kwargs)
+        self.backend = backend
+        self.lease_size = max(1, lease_size)
+        self.ttl = max(1, math.ceil(window))
+        self.backend_cooldown = backend_cooldown
+        self.local_limiter = SlidingWindowLimiter(limit, window, clock=clock, **kwargs)
+        self._backend_retry_at = 0.0
+
+    def acquire(self, key: str) -> RateLimitResult:
+        now = self._clock()
+        stripe = self._stripes[hash(key) % len(self._stripes)]
+        with stripe.lock:
+            states = stripe.states
+            state = states.get(key)
+            if state is None:
+                state = self._new_state(key, now)
+                states[key] = state
+                self._evict(states, now)
+            else:
+                states.move_to_end(key)
+            result = self._update(state, now)
+            if result is not None:
+                return result
+            index = state[1]
+        if now < self._backend_retry_at:
+            return self.local_limiter.acquire(key)
+        try:
+            granted, used = self.backend.reserve(key, index, self.lease_size,
+                                                 self.limit, self.ttl)
+        except BackendError as e:
+            logger.warning(f"Rate limit backend failed, limiting locally for "
+                           f"{self.backend_cooldown}s: {e}")
+            metrics.increment('rate_limit_backend_errors')
+            self._backend_retry_at = now + self.backend_cooldown
+            return self.local_limiter.acquire(key)
+        with stripe.lock:
+            if state[1] == index:
+                # Other requests for the key may have leased meanwhile
+                state[2] += granted
+                state[3] = max(state[3], used)
+            result = self._update(state, now)
+        if result is None:
+            # The window rolled over during the round trip
+            return self.acquire(key)
+        return result
+
+    def _new_state(self, key, now):
+        # key, window index, leased, backend used, last seen
+        return [key, int(now // self.window), 0, 0, now]
+
+    def _update(self, state, now):
+        """Spend a leased request; None if a lease must be reserved first."""
+        index = int(now // self.window)
+        if index != state[1]:
+            state[1], state[2], state[3] = index, 0, 0
+        state[4] = now
+        reset = self.window - (now - index * self.window)
+        if state[2] > 0:
+            state[2] -= 1
+            return RateLimitResult(True, self.limit, state[2] + self.limit - state[3], reset)
+        if state[3] >= self.limit:
+            return RateLimitResult(False, self.limit, 0, reset)
+        return None
+
+
+ALGORITHMS = {
+    'sliding_window': SlidingWindowLimiter,
+    'token_bucket': TokenBucketLimiter,
+}
+
+
+def create_rate_limiter(algorithm: str, limit: int, window: float,
+                        max_keys: Optional[int] = None, backend=None,
+                        lease_size: int = 10, backend_cooldown: float = 5.0) -> RateLimiter:
+    """
+    Create a limiter by algorithm name ('sliding_window' or 'token_bucket').
+    With a shared backend the limit is enforced across instances using a
+    leased fixed window, whatever the algorithm.
+    """
+    if algorithm not in ALGORITHMS:
+        raise ValueError(f"Unknown rate limit algorithm {algorithm!r}; "
+                         f"expected one of {sorted(ALGORITHMS)}")
+    kwargs = {'max_keys': max_keys} if max_keys else {}
+    if backend is not None:
+        return LeasedRateLimiter(limit, window, backend, lease_size=lease_size,
+                                 backend_cooldown=backend_cooldown, **kwargs)
+    return ALGORITHMS[algorithm](limit, window, **kwargs)
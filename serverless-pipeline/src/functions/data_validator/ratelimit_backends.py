@@ -0,0 +1,170 @@
+"""
+Shared counter stores for rate limiting across function instances.
+
+A backend hands out allowance for a key's fixed window in leases:
+reserve() atomically takes up to `amount` requests from what is left of
+the window's limit. InMemoryBackend keeps the counters in this process.
+RedisBackend keeps them in any server that speaks the Redis protocol
+(Redis, Memorystore, Valkey), using INCRBY and EXPIRE.
+"""
+import socket
+import threading
+from typing import List, Optional, Tuple
+from urllib.parse import urlparse
+
+
+class BackendError(Exception):
+    """The shared store could not be reached or returned an error."""
+
+
+class CounterBackend:
+    """Interface for a shared store of per-window request counters."""
+
+    def reserve(self, key: str, window_index: int, amount: int, limit: int,
+                ttl: int) -> Tuple[int, int]:
+        """
+        Take up to `amount` requests from the key's allowance for a window.
+        Returns (granted, used), where used is how much of the limit is
+        now taken across all instances.
+        """
+        raise NotImplementedError
+
+
+def _grant(total: int, amount: int, limit: int) -> Tuple[int, int]:
+    """Work out a lease from the counter value after adding `amount`."""
+    granted = max(0, min(amount, limit - (total - amount)))
+    return granted, min(total, limit)
+
+
+class InMemoryBackend(CounterBackend):
+    """Counters in this process; shared by limiters within one instance."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}  # key -> [window index, total]
+
+    def reserve(self, key, window_index, amount, limit, ttl):
+        with self._lock:
+            counter = self._counters.get(key)
+            if counter is None or counter[0] != window_index:
+                # Only the current window is ever reserved against
+                counter = [window_index, 0]
+                self._counters[key] = counter
+            counter[1] += amount
+            total = counter[1]
+        return _grant(total, amount, limit)
+
+
+class RedisBackend(CounterBackend):
+    """
+    Counters in a Redis-protocol server.
+    Each thread keeps its own connection; commands are pipelined.
+    """
+
+    def __init__(self, host: str = 'localhost', port: int = 6379,
+                 password: Optional[str] = None, db: int = 0,
+                 timeout: float = 0.5, prefix: str = 'ratelimit'):
+        self.host = host
+        self.port = port
+        self.password = password
+        self.db = db
+        self.timeout = timeout
+        self.prefix = prefix
+        self._local = threading.local()
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs) -> 'RedisBackend':
+        """Create a backend from a redis://[:password@]host[:port][/db] URL."""
+        parsed = urlparse(url)
+        if parsed.scheme != 'redis':
+            raise ValueError(f"Unsupported rate limit backend URL: {url}")
+        db = int(parsed.path.lstrip('/') or 0)
+        return cls(parsed.hostname or 'localhost', parsed.port or 6379,
+                   password=parsed.password, db=db, **kwargs)
+
+    def reserve(self, key, window_index, amount, limit, ttl):
+        counter_key = f"{self.prefix}:{key}:{window_index}"
+        total, _ = self.execute(('INCRBY', counter_key, amount), ('EXPIRE', counter_key, ttl))
+        return _grant(total, amount, limit)
+
+    def execute(self, *commands) -> List:
+        """Send commands in one round trip and return their replies."""
+        connection, reader = self._connect()
+        replies = self._send(connection, reader, commands)
+        for reply in replies:
+            if isinstance(reply, BackendError):
+                raise reply
+        return replies
+
+    def _send(self, connection, reader, commands) -> List:
+        try:
+            connection.sendall(b''.join(_encode(command) for command in commands))
+            return [_read_reply(reader) for _ in commands]
+        except (OSError, ValueError) as e:
+            self._disconnect()
+            raise BackendError(f"Rate limit backend unavailable: {str(e)}") from e
+
+    def _connect(self):
+        """Return this thread's (socket, reader), connecting if needed."""
+        pair = getattr(self._local, 'connection', None)
+        if pair is not None:
+            return pair
+        try:
+            connection = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        except OSError as e:
+            raise BackendError(f"Rate limit backend unavailable: {str(e)}") from e
+        connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        pair = self._local.connection = (connection, connection.makefile('rb'))
+        setup = []
+        if self.password:
+            setup.append(('AUTH', self.password))
+        if self.db:
+            setup.append(('SELECT', self.db))
+        if setup:
+            for reply in self._send(connection, pair[1], setup):
+                if isinstance(reply, BackendError):
+                    self._disconnect()
+                    raise reply
+        return pair
+
+    def _disconnect(self):
+        pair = getattr(self._local, 'connection', None)
+        self._local.connection = None
+        if pair is not None:
+            pair[1].close()
+            pair[0].close()
+
+
+def _encode(command) -> bytes:
+    """Encode a command as a RESP array of bulk strings."""
+    parts = [b'*%d\r\n' % len(command)]
+    for arg in command:
+        data = arg if isinstance(arg, bytes) else str(arg).encode('utf-8')
+        parts.append(b'$%d\r\n%s\r\n' % (len(data), data))
+    return b''.join(parts)
+
+
+def _read_reply(reader):
+    """Read one RESP reply; error replies are returned as BackendError."""
+    line = reader.readline()
+    if not line.endswith(b'\r\n'):
+        raise ValueError("connection closed")
+    kind, payload = line[:1], line[1:-2]
+    if kind == b'+':
+        return payload.decode('utf-8')
+    if kind == b'-':
+        return BackendError(payload.decode('utf-8'))
+    if kind == b':':
+        return int(payload)
+    if kind == b'$':
+        length = int(payload)
+        if length < 0:
+            return None
+        data = reader.read(length + 2)
+        return data[:-2]
+    if kind == b'*':
+        count = int(payload)
+        if count < 0:
+            return None
+        return [_read_reply(reader) for _ in range(count)]
+    raise ValueError(f"unexpected reply {line!r}")
@@ -0,0 +1,200 @@
+"""
+Compile-once validation for a JSON Schema subset.
+
+A schema is compiled into a tree of closures at import time so that
+request handling does no dict lookups on rule definitions and no regex
+cache lookups. Supported keywords: type, required, properties, minimum,
+maximum, exclusiveMinimum, exclusiveMaximum, minLength, maxLength and
+pattern. Nested objects are validated recursively and report dotted
+field paths (e.g. ``address.zip``).
+"""
+import re
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+
+class FieldError(NamedTuple):
+    """A single validation failure."""
+    field: str
+    keyword: str
+    message: str
+
+
+Validator = Callable[[Any], List[FieldError]]
+
+_TYPES = {
+    'string': (str,),
+    'integer': (int,),
+    'number': (int, float),
+    'boolean': (bool,),
+    'object': (dict,),
+    'array': (list,),
+}
+
+_TYPE_NAMES = {
+    'string': 'a string',
+    'integer': 'an integer',
+    'number': 'a number',
+    'boolean': 'a boolean',
+    'object': 'an object',
+    'array': 'an array',
+}
+
+
+def _type_check(path: str, type_name: str) -> Callable[[Any], Optional[FieldError]]:
+    """Build a type check; booleans are never accepted as numbers."""
+    if type_name not in _TYPES:
+        raise ValueError(f"Unsupported schema type: {type_name}")
+    python_types = _TYPES[type_name]
+    error = FieldError(path, 'type', f"{path} must be {_TYPE_NAMES[type_name]}")
+
+    if type_name in ('integer', 'number'):
+        def check(value):
+            if value.__class__ is bool or not isinstance(value, python_types):
+                return error
+            return None
+    else:
+        def check(value):
+            if not isinstance(value, python_types):
+                return error
+            return None
+    return check
+
+
+def _string_checks(path: str, spec: Dict) -> List[Callable[[Any], Optional[FieldError]]]:
+    """Build minLength/maxLength/pattern checks, applied to strings only."""
+    checks = []
+
+    if 'minLength' in spec:
+        min_length = spec['minLength']
+        min_length_error = FieldError(path, 'minLength',
+                                      f"{path} must be at least {min_length} characters long")
+
+        def check_min_length(value):
+            if isinstance(value, str) and len(value) < min_length:
+                return min_length_error
+            return None
+        checks.append(check_min_length)
+
+    if 'maxLength' in spec:
+        max_length = spec['maxLength']
+        max_length_error = FieldError(path, 'maxLength',
+                                      f"{path} must be at most {max_length} characters long")
+
+        def check_max_length(value):
+            if isinstance(value, str) and len(value) > max_length:
+                return max_length_error
+            return None
+        checks.append(check_max_length)
+
+    if 'pattern' in spec:
+        search = re.compile(spec['pattern']).search
+        pattern_error = FieldError(path, 'pattern', f"{path} format is invalid")
+
+        def check_pattern(value):
+            if isinstance(value, str) and search(value) is None:
+                return pattern_error
+            return None
+        checks.append(check_pattern)
+
+    return checks
+
+
+def _number_checks(path: str, spec: Dict) -> List[Callable[[Any], Optional[FieldError]]]:
+    """Build range checks, applied to ints and floats only."""
+    checks = []
+    bounds = (
+        ('minimum', lambda v, b: v < b, 'greater than or equal to'),
+        ('exclusiveMinimum', lambda v, b: v <= b, 'greater than'),
+        ('maximum', lambda v, b: v > b, 'less than or equal to'),
+        ('exclusiveMaximum', lambda v, b: v >= b, 'less than'),
+    )
+    for keyword, fails, wording in bounds:
+        if keyword not in spec:
+            continue
+        checks.append(_bound_check(path, keyword, spec[keyword], fails, wording))
+    return checks
+
+
+def _bound_check(path, keyword, bound, fails, wording):
+    """Build a single numeric bound check."""
+    error = FieldError(path, keyword, f"{path} must be {wording} {bound}")
+
+    def check(value):
+        if (isinstance(value, (int, float)) and value.__class__ is not bool
+                and fails(value, bound)):
+            return error
+        return None
+    return check
+
+
+def _compile_value(path: str, spec: Dict) -> Callable[[Any], List[FieldError]]:
+    """Compile the schema for one value into a function returning its errors."""
+    checks = []
+    if 'type' in spec:
+        checks.append(_type_check(path, spec['type']))
+    checks.extend(_string_checks(path, spec))
+    checks.extend(_number_checks(path, spec))
+    nested = _compile_object(path, spec) if 'properties' in spec else None
+
+    def validate_value(value):
+        for check in checks:
+            error = check(value)
+            if error is not None:
+                return [error]
+        if nested is not None and isinstance(value, dict):
+            return nested(value)
+        return []
+    return validate_value
+
+
+def _compile_object(prefix: str, spec: Dict) -> Validator:
+    """Compile an object schema into a validator for dicts."""
+    properties = spec.get('properties', {})
+    required = spec.get('required', [])
+    steps = []
+
+    # Required fields without a property schema are checked first
+    for name in required:
+        if name not in properties:
+            path = f"{prefix}.{name}" if prefix else name
+            steps.append((name, FieldError(path, 'required', f"{path} is required"), None))
+
+    for name, property_spec in properties.items():
+        path = f"{prefix}.{name}" if prefix else name
+        missing = FieldError(path, 'required', f"{path} is required") if name in required else None
+        steps.append((name, missing, _compile_value(path, property_spec)))
+
+    def validate_object(data):
+        errors = []
+        for name, missing, validate_value in steps:
+            value = data.get(name)
+            if value is None:
+                if missing is not None:
+                    errors.append(missing)
+                continue
+            if validate_value is not None:
+                field_errors = validate_value(value)
+                if field_errors:
+                    errors.extend(field_errors)
+        return errors
+    return validate_object
+
+
+def compile_schema(schema: Dict) -> Validator:
+    """
+    Compile a JSON Schema subset into a validator function.
+
+    The returned function takes the decoded JSON document and returns a
+    list of FieldError, empty when the document is valid. Each field
+    reports at most one error, in property declaration order.
+    """
+    if schema.get('type', 'object') != 'object':
+        raise ValueError("Top-level schema must describe an object")
+    validate_object = _compile_object('', schema)
+    not_an_object = [FieldError('', 'type', 'Expected a JSON object')]
+
+    def validate(data):
+        if not isinstance(data, dict):
+            return list(not_an_object)
+        return validate_object(data)
+    return validate
@@ -1,3 +1,5 @@
+import io
+import json
 import os
 import pytest
 from unittest.mock import Mock, patch
@@ -18,6 +20,12 @@ def setup_test_env():
     # Set test environment variables
     os.environ['PYTEST_CURRENT_TEST'] = '1'
     
+    # Forget events published by earlier tests so they are not deduplicated
+    main = sys.modules.get('main')
+    cache = getattr(main, 'idempotency_cache', None)
+    if hasattr(cache, 'clear'):
+        cache.clear()
+    
     yield
     
     # Restore original environment
@@ -27,6 +35,24 @@ def setup_test_env():
         elif var in os.environ:
             del os.environ[var]
 
+class MockBody:
+    """
+    Body stream of a mock request: what its get_json returns, as JSON.
+    Starts over once read to the end, as the mock is reused across calls.
+    """
+
+    def __init__(self, request):
+        self._request = request
+        self._body = None
+
+    def read(self, size=-1):
+        if self._body is None:
+            self._body = io.BytesIO(json.dumps(self._request.get_json()).encode())
+        chunk = self._body.read(size)
+        if not chunk:
+            self._body = None
+        return chunk
+
 @pytest.fixture
 def mock_request():
     """Create a mock request object."""
@@ -39,6 +65,8 @@ def mock_request():
     mock.remote_addr = '127.0.0.1'
     mock.method = 'POST'
     mock.path = '/validate'
+    mock.content_length = None
+    mock.stream = MockBody(mock)
     return mock
 
 @pytest.fixture
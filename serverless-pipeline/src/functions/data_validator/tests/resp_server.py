@@ -0,0 +1,80 @@
+"""
+A small in-process stand-in for a Redis server, for tests.
+
+Speaks enough of the Redis protocol for the rate limit and idempotency
+backends: PING, AUTH, SELECT, GET, SET, INCRBY and EXPIRE (expiry is
+recorded, not enforced).
+"""
+import socketserver
+import threading
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            count = int(line[1:])
+            args = []
+            for _ in range(count):
+                length = int(self.rfile.readline()[1:])
+                args.append(self.rfile.read(length + 2)[:-2].decode('utf-8'))
+            self.wfile.write(self.server.execute(args))
+
+
+class RespServer(socketserver.ThreadingTCPServer):
+    """Threaded RESP server on localhost; use as a context manager."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, password=None):
+        super().__init__(('127.0.0.1', 0), _Handler)
+        self.password = password
+        self.data = {}
+        self.expiry = {}
+        self.commands = []
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address
+        auth = f":{self.password}@" if self.password else ''
+        return f"redis://{auth}{host}:{port}/0"
+
+    def execute(self, args):
+        name = args[0].upper()
+        with self.lock:
+            self.commands.append(name)
+            if name == 'PING':
+                return b'+PONG\r\n'
+            if name == 'AUTH':
+                return b'+OK\r\n' if args[1] == self.password else b'-ERR invalid password\r\n'
+            if name == 'SELECT':
+                return b'+OK\r\n'
+            if name == 'GET':
+                value = self.data.get(args[1])
+                if value is None:
+                    return b'$-1\r\n'
+                value = str(value).encode('utf-8')
+                return b'$%d\r\n%s\r\n' % (len(value), value)
+            if name == 'SET':
+                self.data[args[1]] = args[2]
+                if len(args) == 5 and args[3].upper() == 'EX':
+                    self.expiry[args[1]] = int(args[4])
+                return b'+OK\r\n'
+            if name == 'INCRBY':
+                self.data[args[1]] = self.data.get(args[1], 0) + int(args[2])
+                return b':%d\r\n' % self.data[args[1]]
+            if name == 'EXPIRE':
+                self.expiry[args[1]] = int(args[2])
+                return b':%d\r\n' % int(args[1] in self.data)
+        return b'-ERR unknown command\r\n'
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
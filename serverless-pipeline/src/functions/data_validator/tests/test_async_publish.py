@@ -0,0 +1,166 @@
+import pytest
+from unittest.mock import patch
+import os
+import sys
+
+# Add the parent directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+from main import data_validator
+from metrics import metrics
+from publishing import InFlightWindow
+
+class FakeFuture:
+    """Publish future that completes only when the test says so."""
+
+    def __init__(self):
+        self._callbacks = []
+        self._exception = None
+
+    def add_done_callback(self, callback):
+        self._callbacks.append(callback)
+
+    def result(self):
+        if self._exception:
+            raise self._exception
+        return 'message-id'
+
+    def complete(self, exception=None):
+        self._exception = exception
+        for callback in self._callbacks:
+            callback(self)
+
+@pytest.fixture
+def window():
+    """Replace the module-level in-flight window with a small one."""
+    metrics.reset()
+    small = InFlightWindow(max_in_flight=2, retry_buffer_size=10)
+    with patch.object(main, 'in_flight_window', small):
+        yield small
+
+@pytest.fixture
+def futures(mock_publisher):
+    """Make each publish return a new FakeFuture."""
+    created = []
+
+    def publish(topic, data):
+        created.append(FakeFuture())
+        return created[-1]
+    mock_publisher.publish.side_effect = publish
+    return created
+
+@pytest.fixture
+def async_request(mock_request):
+    """A valid request asking for an asynchronous acknowledgement."""
+    mock_request.headers = dict(mock_request.headers, Prefer='respond-async')
+    mock_request.get_json.return_value = {'name': 'Test', 'email': 'test@example.com', 'age': 30}
+    return mock_request
+
+@pytest.mark.timeout(5)
+def test_async_ack_returns_202(async_request, window, futures):
+    """Test the function answers before the publish completes."""
+    response, status_code = data_validator(async_request)
+    assert status_code == 202
+    assert response['request_id']
+    assert window.in_flight == 1
+    futures[0].complete()
+    assert window.in_flight == 0
+    assert metrics.get('publish_async_succeeded') == 1
+
+@pytest.mark.timeout(5)
+def test_sync_is_default(mock_request, window, futures):
+    """Test requests without Prefer still wait for the result."""
+    mock_request.get_json.return_value = {'name': 'Test', 'email': 'test@example.com', 'age': 30}
+    response, status_code = data_validator(mock_request)
+    assert status_code == 200
+    assert window.in_flight == 0
+
+@pytest.mark.timeout(5)
+def test_config_switch(mock_request, window, futures):
+    """Test ASYNC_ACK enables the mode for every request."""
+    mock_request.get_json.return_value = {'name': 'Test', 'email': 'test@example.com', 'age': 30}
+    with patch.object(main, 'ASYNC_ACK', True):
+        response, status_code = data_validator(mock_request)
+    assert status_code == 202
+
+@pytest.mark.timeout(5)
+def test_back_pressure(async_request, window, futures):
+    """Test a full window sheds load with 503 and Retry-After."""
+    assert data_validator(async_request)[1] == 202
+    assert data_validator(async_request)[1] == 202
+    response, status_code, headers = data_validator(async_request)
+    assert status_code == 503
+    assert headers['Retry-After'] == main.RETRY_AFTER_SECONDS
+    assert metrics.get('publish_async_rejected') == 1
+
+    futures[0].complete()
+    assert data_validator(async_request)[1] == 202
+
+@pytest.mark.timeout(5)
+def test_failure_goes_to_retry_buffer(async_request, window, futures):
+    """Test failed publishes are counted and kept for retry."""
+    data_validator(async_request)
+    futures[0].complete(Exception('Publish error'))
+    assert window.in_flight == 0
+    assert metrics.get('publish_async_failures') == 1
+    assert window.retry_pending == 1
+
+@pytest.mark.timeout(5)
+def test_failed_publish_is_republished(async_request, window, futures, mock_publisher):
+    """Test an acknowledged event whose publish failed is sent again on the next request."""
+    data_validator(async_request)
+    futures[0].complete(Exception('Publish error'))
+    assert window.retry_pending == 1
+    assert metrics.get('publish_retry_buffered') == 1
+
+    assert data_validator(async_request)[1] == 202
+    assert len(futures) == 3  # The retry, then the new event
+    assert mock_publisher.publish.call_args_list[1] == mock_publisher.publish.call_args_list[0]
+    assert window.retry_pending == 0
+    assert metrics.get('publish_async_retried') == 1
+    futures[1].complete()
+    futures[2].complete()
+    assert metrics.get('publish_async_succeeded') == 2
+    assert metrics.get('publish_retry_buffered') == 0
+
+@pytest.mark.timeout(5)
+def test_retries_are_bounded(mock_publisher, futures):
+    """Test events are dropped, and counted, after max_attempts or when the buffer is full."""
+    metrics.reset()
+    window = InFlightWindow(max_in_flight=10, retry_buffer_size=2, max_attempts=2)
+    for n in range(3):
+        assert window.try_acquire()
+        window.track(mock_publisher.publish('topic', b'%d' % n), str(n), b'%d' % n, 'topic')
+    for future in futures[:3]:
+        future.complete(Exception('Publish error'))
+    # The oldest failure was pushed out of the full buffer
+    assert window.retry_pending == 2
+    assert metrics.get('publish_async_dropped') == 1
+
+    assert window.replay(mock_publisher.publish) == 2
+    for future in futures[3:]:
+        future.complete(Exception('Publish error'))
+    # Second attempts failed too, and max_attempts is 2
+    assert window.retry_pending == 0
+    assert metrics.get('publish_async_dropped') == 3
+    assert window.in_flight == 0
+
+@pytest.mark.timeout(5)
+def test_synchronous_publish_error_releases_slot(async_request, window, mock_publisher):
+    """Test a publish call that raises does not leak a slot."""
+    mock_publisher.publish.side_effect = Exception('Publish error')
+    response, status_code = data_validator(async_request)
+    assert status_code == 500
+    assert window.in_flight == 0
+
+@pytest.mark.timeout(5)
+def test_metrics_endpoint(mock_request):
+    """Test the metrics snapshot endpoint."""
+    metrics.reset()
+    metrics.increment('publish_async_failures')
+    mock_request.method = 'GET'
+    mock_request.path = '/metrics'
+    response, status_code = data_validator(mock_request)
+    assert status_code == 200
+    assert response['counters'] == {'publish_async_failures': 1}
@@ -0,0 +1,164 @@
+import pytest
+from unittest.mock import patch, MagicMock
+import json
+import os
+import sys
+
+# Add the parent directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Request
+from werkzeug.test import EnvironBuilder
+
+import main
+from main import data_validator, parse_ndjson, MALFORMED
+
+VALID = {'name': 'Test User', 'email': 'test@example.com', 'age': 25}
+INVALID = {'name': 'Test User', 'email': 'invalid-email', 'age': 25}
+
+def make_request(body, content_type='application/json', path='/'):
+    """Build a real Flask request with the given body."""
+    if not isinstance(body, (str, bytes)):
+        body = json.dumps(body)
+    builder = EnvironBuilder(method='POST', path=path, data=body,
+                             headers={'Content-Type': content_type,
+                                      'X-Forwarded-For': '127.0.0.1'})
+    return Request(builder.get_environ())
+
+@pytest.fixture
+def mock_publisher():
+    """Create a mock publisher client returning sequential message IDs."""
+    with patch('main.publisher') as mock:
+        mock.topic_path.return_value = "projects/test-project/topics/events-topic"
+        counter = iter(range(1000))
+
+        def publish(topic, data):
+            future = MagicMock()
+            future.result.return_value = f"id-{next(counter)}"
+            return future
+        mock.publish.side_effect = publish
+        yield mock
+
+@pytest.mark.timeout(5)
+def test_parse_ndjson():
+    """Test NDJSON parsing with blank and malformed lines."""
+    items = parse_ndjson(b'{"a": 1}\n\n  \n{bad\n[2]\r\n')
+    assert items == [{'a': 1}, MALFORMED, [2]]
+
+@pytest.mark.timeout(5)
+def test_json_array_batch(mock_publisher):
+    """Test a JSON array body gets per-item results."""
+    response, status_code = data_validator(make_request([VALID, INVALID, VALID]))
+    assert status_code == 200
+    assert response['published'] == 2
+    assert response['invalid'] == 1
+    assert [r['status'] for r in response['results']] == ['published', 'invalid', 'published']
+    assert response['results'][0]['event_id'] == 'id-0'
+    assert response['results'][1]['errors'] == ['email format is invalid']
+    assert mock_publisher.publish.call_count == 2
+
+@pytest.mark.timeout(5)
+def test_ndjson_batch(mock_publisher):
+    """Test an NDJSON body including a malformed line."""
+    body = '\n'.join([json.dumps(VALID), '{not json', json.dumps([1])])
+    response, status_code = data_validator(make_request(body, 'application/x-ndjson'))
+    assert status_code == 200
+    assert [r['status'] for r in response['results']] == ['published', 'invalid', 'invalid']
+    assert response['results'][1]['errors'] == ['malformed JSON']
+    assert response['results'][2]['errors'] == ['Expected a JSON object']
+
+@pytest.mark.timeout(5)
+def test_publishes_before_waiting(mock_publisher):
+    """Test all valid items are handed to the client before any result is awaited."""
+    calls = []
+    mock_publisher.publish.side_effect = lambda topic, data: calls.append('publish') or MagicMock(
+        result=lambda: calls.append('result') or 'id')
+    data_validator(make_request([VALID] * 3))
+    assert calls == ['publish'] * 3 + ['result'] * 3
+
+@pytest.mark.timeout(5)
+def test_batch_publish_failure(mock_publisher):
+    """Test a failed publish is reported per item."""
+    mock_publisher.publish.side_effect = Exception('Publish error')
+    response, status_code = data_validator(make_request([VALID, VALID]))
+    assert status_code == 500
+    assert response['failed'] == 2
+    assert 'Publish error' in response['results'][0]['error']
+
+@pytest.mark.timeout(5)
+def test_batch_item_limit(mock_publisher):
+    """Test the maximum batch size."""
+    with patch.object(main, 'BATCH_MAX_ITEMS', 2):
+        response, status_code = data_validator(make_request([VALID] * 3))
+    assert status_code == 413
+    mock_publisher.publish.assert_not_called()
+
+@pytest.mark.timeout(5)
+def test_batch_byte_limit(mock_publisher):
+    """Test the maximum batch size in bytes for both body formats."""
+    with patch.object(main, 'BATCH_MAX_BYTES', 64):
+        response, status_code = data_validator(make_request([VALID] * 3))
+        assert status_code == 413
+        body = '\n'.join([json.dumps(VALID)] * 3)
+        response, status_code = data_validator(make_request(body, 'application/x-ndjson'))
+        assert status_code == 413
+    mock_publisher.publish.assert_not_called()
+
+@pytest.mark.timeout(5)
+def test_batch_byte_limit_without_content_length(mock_publisher):
+    """Test a chunked body with no Content-Length is cut off at the limit before parsing."""
+    environ = make_request([VALID] * 3).environ
+    del environ['CONTENT_LENGTH']
+    environ['wsgi.input_terminated'] = True
+    with patch.object(main, 'BATCH_MAX_BYTES', 64), \
+            patch.object(main, 'parse_json', side_effect=AssertionError('parsed')):
+        response, status_code = data_validator(Request(environ))
+    assert status_code == 413
+    mock_publisher.publish.assert_not_called()
+
+    environ = make_request([VALID] * 3).environ
+    del environ['CONTENT_LENGTH']
+    environ['wsgi.input_terminated'] = True
+    response, status_code = data_validator(Request(environ))
+    assert status_code == 200
+    assert response['published'] == 3
+
+@pytest.mark.timeout(5)
+def test_single_event_unchanged(mock_publisher):
+    """Test a single JSON object still takes the single-event path."""
+    response, status_code = data_validator(make_request(VALID))
+    assert status_code == 200
+    assert response['event_id'] == 'id-0'
+
+@pytest.mark.timeout(5)
+def test_coalesced_batch_answers_like_single_calls(mock_publisher):
+    """Test POST /batch gives each event the status and body of a call of its own."""
+    response, status_code = data_validator(make_request([VALID, INVALID], path='/batch'))
+    assert status_code == 200
+    single = data_validator(make_request(INVALID))
+    assert response['results'] == [
+        {'status': 200, 'body': {'message': 'Event validated and published successfully',
+                                 'event_id': 'id-0'}},
+        {'status': single[1], 'body': single[0]},
+    ]
+    assert mock_publisher.publish.call_count == 1
+
+    # An event published before is answered as a replay, without publishing again
+    response, _ = data_validator(make_request([VALID], path='/batch'))
+    assert response['results'][0]['headers'] == {'Idempotent-Replayed': 'true'}
+    assert response['results'][0]['body']['event_id'] == 'id-0'
+    assert mock_publisher.publish.call_count == 1
+
+    mock_publisher.publish.side_effect = Exception('Publish error')
+    response, _ = data_validator(make_request([dict(VALID, age=26)], path='/batch'))
+    assert response['results'][0]['status'] == 500
+    assert 'Publish error' in response['results'][0]['body']['error']
+
+@pytest.mark.timeout(5)
+def test_coalesced_batch_rejected_before_processing(mock_publisher):
+    """Test a /batch body that is not a usable array is rejected as a whole."""
+    for body in (VALID, [], '{bad'):
+        assert data_validator(make_request(body, path='/batch'))[1] == 400
+    with patch.object(main, 'BATCH_MAX_ITEMS', 2):
+        assert data_validator(make_request([VALID] * 3, path='/batch'))[1] == 413
+    mock_publisher.publish.assert_not_called()
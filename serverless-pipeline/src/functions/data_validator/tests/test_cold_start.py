@@ -0,0 +1,60 @@
+import pytest
+from unittest.mock import patch
+import os
+import sys
+
+# Add the parent directory to the Python path
+FUNCTION_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(FUNCTION_DIR)
+sys.path.append(os.path.join(FUNCTION_DIR, '..', '..', '..', 'benchmarks'))
+
+import main
+from main import data_validator
+from import_time import imported_lazy_modules, measure, own_modules, total_us
+
+# Budgets for `import main` in a fresh interpreter, in milliseconds
+IMPORT_TIME_BUDGET_MS = float(os.getenv('IMPORT_TIME_BUDGET_MS', '1500'))
+OWN_MODULES_BUDGET_MS = float(os.getenv('OWN_MODULES_IMPORT_BUDGET_MS', '50'))
+
+@pytest.fixture(scope='module')
+def records():
+    """Import-time records of the fastest of three fresh imports of main."""
+    return measure(FUNCTION_DIR, runs=3)
+
+@pytest.mark.timeout(60)
+def test_clients_are_not_imported(records):
+    """Test the Pub/Sub and gRPC libraries stay out of module import."""
+    assert imported_lazy_modules(records) == []
+
+@pytest.mark.timeout(60)
+def test_import_time_budget(records):
+    """Test importing the entry point stays within the budget."""
+    assert total_us(records) / 1000 < IMPORT_TIME_BUDGET_MS
+
+@pytest.mark.timeout(60)
+def test_own_modules_budget(records):
+    """Test the function's own modules stay cheap to import."""
+    own = own_modules(records, FUNCTION_DIR)
+    assert 'main' in own and 'schema' in own
+    assert sum(own.values()) / 1000 < OWN_MODULES_BUDGET_MS
+
+@pytest.mark.timeout(5)
+def test_warmup(mock_request, mock_publisher):
+    """Test /warmup creates the publisher and opens its channel."""
+    mock_request.method = 'GET'
+    mock_request.path = '/warmup'
+    with patch('main.open_channel') as open_channel:
+        response, status_code = data_validator(mock_request)
+    assert status_code == 200
+    assert response['status'] == 'warm'
+    open_channel.assert_called_once_with(mock_publisher.get.return_value, main.WARMUP_TIMEOUT)
+
+@pytest.mark.timeout(5)
+def test_warmup_failure(mock_request, mock_publisher):
+    """Test a channel that cannot connect reports 503."""
+    mock_request.method = 'GET'
+    mock_request.path = '/warmup'
+    with patch('main.open_channel', side_effect=TimeoutError('not ready')):
+        response, status_code = data_validator(mock_request)
+    assert status_code == 503
+    assert 'not ready' in response['error']
@@ -0,0 +1,174 @@
+import pytest
+from unittest.mock import patch, MagicMock
+import json
+import os
+import sys
+
+# Add the parent directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from flask import Flask, Request, request
+from werkzeug.test import EnvironBuilder
+
+import main
+from main import data_validator
+from idempotency import InMemoryDedupCache, RedisDedupCache, idempotency_key
+from metrics import metrics
+from resp_server import RespServer
+
+TOPIC = "projects/test-project/topics/events-topic"
+EVENT = {'name': 'Test User', 'email': 'test@example.com', 'age': 25}
+
+class FakeClock:
+    """Manually advanced monotonic clock."""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def mock_publisher():
+    """Create a mock publisher client returning sequential message IDs."""
+    metrics.reset()
+    with patch('main.publisher') as mock:
+        mock.topic_path.return_value = TOPIC
+        counter = iter(range(1000))
+
+        def publish(topic, data):
+            future = MagicMock()
+            future.result.return_value = f"id-{next(counter)}"
+            return future
+        mock.publish.side_effect = publish
+        yield mock
+
+def make_request(body):
+    """Build a real Flask request with a JSON body."""
+    builder = EnvironBuilder(method='POST', path='/', data=json.dumps(body),
+                             headers={'Content-Type': 'application/json',
+                                      'X-Forwarded-For': '127.0.0.1'})
+    return Request(builder.get_environ())
+
+def send(mock_request, data, **headers):
+    mock_request.get_json.return_value = data
+    mock_request.headers = dict(mock_request.headers, **headers)
+    return data_validator(mock_request)
+
+@pytest.mark.timeout(5)
+def test_key_sources():
+    """Test the header wins over event_id, which wins over the content hash."""
+    event = dict(EVENT, event_id='evt-1')
+    assert idempotency_key(TOPIC, event, 'abc') == f"{TOPIC}|key:abc"
+    assert idempotency_key(TOPIC, event) == f"{TOPIC}|event:evt-1"
+    hashed = idempotency_key(TOPIC, EVENT)
+    assert hashed.startswith(f"{TOPIC}|sha256:")
+    # The hash is over canonical JSON, so key order does not matter
+    assert idempotency_key(TOPIC, dict(reversed(list(EVENT.items())))) == hashed
+    assert idempotency_key(TOPIC, dict(EVENT, age=26)) != hashed
+    assert idempotency_key('other-topic', EVENT) != hashed
+
+@pytest.mark.timeout(5)
+def test_retry_is_not_republished(mock_request, mock_publisher):
+    """Test a retried event gets the original event_id without a second publish."""
+    first, status = send(mock_request, EVENT)
+    assert status == 200
+    # Email normalization makes this the same event
+    retry, status = send(mock_request, dict(EVENT, email='  TEST@example.com '))
+    assert status == 200
+    assert retry == first
+    assert mock_publisher.publish.call_count == 1
+    assert metrics.get('idempotency_hits') == 1
+    assert metrics.get('idempotency_misses') == 1
+
+@pytest.mark.timeout(5)
+def test_idempotency_key_header(mock_request, mock_publisher):
+    """Test events with the same Idempotency-Key are published once."""
+    first, _ = send(mock_request, EVENT, **{'Idempotency-Key': 'order-17'})
+    second, _ = send(mock_request, dict(EVENT, age=40), **{'Idempotency-Key': 'order-17'})
+    assert second['event_id'] == first['event_id']
+    third, _ = send(mock_request, EVENT, **{'Idempotency-Key': 'order-18'})
+    assert third['event_id'] != first['event_id']
+    assert mock_publisher.publish.call_count == 2
+
+@pytest.mark.timeout(5)
+def test_failures_are_not_cached(mock_request, mock_publisher):
+    """Test an event whose publish failed is published again on retry."""
+    mock_publisher.publish.side_effect = Exception('Publish error')
+    assert send(mock_request, EVENT)[1] == 500
+    mock_publisher.publish.side_effect = None
+    mock_publisher.publish.return_value.result.return_value = 'id-ok'
+    assert send(mock_request, EVENT)[0]['event_id'] == 'id-ok'
+    assert mock_publisher.publish.call_count == 2
+
+@pytest.mark.timeout(5)
+def test_disabled(mock_request, mock_publisher):
+    """Test an IDEMPOTENCY_TTL_SECONDS of 0 publishes every request."""
+    with patch.object(main, 'idempotency_cache', None):
+        send(mock_request, EVENT)
+        send(mock_request, EVENT)
+    assert mock_publisher.publish.call_count == 2
+
+@pytest.mark.timeout(5)
+def test_batch_skips_published_items(mock_publisher):
+    """Test batch items published by an earlier request are reported as duplicates."""
+    first, _ = data_validator(make_request([EVENT]))
+    second, _ = data_validator(make_request([EVENT, dict(EVENT, age=30)]))
+    assert second['results'][0] == {"index": 0, "status": "published",
+                                    "event_id": first['results'][0]['event_id'],
+                                    "duplicate": True}
+    assert 'duplicate' not in second['results'][1]
+    assert second['published'] == 2
+    assert mock_publisher.publish.call_count == 2
+
+@pytest.mark.timeout(5)
+def test_replayed_header(mock_publisher):
+    """Test a cached response is marked with Idempotent-Replayed."""
+    app = Flask(__name__)
+    app.add_url_rule('/', 'validate', lambda: data_validator(request), methods=['POST'])
+    client = app.test_client()
+    assert 'Idempotent-Replayed' not in client.post('/', json=EVENT).headers
+    response = client.post('/', json=EVENT)
+    assert response.headers['Idempotent-Replayed'] == 'true'
+    assert mock_publisher.publish.call_count == 1
+
+@pytest.mark.timeout(5)
+def test_in_memory_cache_ttl_and_lru():
+    """Test entries expire after the TTL and the cache stays within its size."""
+    clock = FakeClock()
+    cache = InMemoryDedupCache(ttl=60, max_entries=2, clock=clock)
+    cache.put('a', 'id-a')
+    cache.put('b', 'id-b')
+    assert cache.get('a') == 'id-a'  # 'a' is now most recently used
+    cache.put('c', 'id-c')
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == ('id-a', 'id-c')
+
+    clock.now += 61
+    assert cache.get('a') is None
+    cache.put('d', 'id-d')
+    assert len(cache) == 1
+
+@pytest.mark.timeout(5)
+def test_redis_cache_shared_between_instances():
+    """Test a success recorded by one instance is seen by another."""
+    with RespServer() as server:
+        first = RedisDedupCache.from_url(server.url, ttl=600)
+        second = RedisDedupCache.from_url(server.url, ttl=600)
+        assert second.get('topic|event:1') is None
+        first.put('topic|event:1', 'id-1')
+        assert second.get('topic|event:1') == 'id-1'
+        assert server.expiry['idempotency:topic|event:1'] == 600
+
+@pytest.mark.timeout(5)
+def test_redis_cache_outage_is_a_miss():
+    """Test an unreachable cache lets events through."""
+    with RespServer() as server:
+        url = server.url
+    metrics.reset()
+    cache = RedisDedupCache.from_url(url, ttl=600)
+    assert cache.lookup('topic|event:1') is None
+    cache.put('topic|event:1', 'id-1')
+    assert metrics.get('idempotency_misses') == 1
+    assert metrics.get('idempotency_backend_errors') == 2
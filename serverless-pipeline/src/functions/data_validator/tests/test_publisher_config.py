@@ -0,0 +1,107 @@
+import pytest
+from unittest.mock import patch
+import os
+import sys
+import threading
+import time
+
+# Add the parent directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from publisher_config import LazyClient, load_publisher_settings, create_publisher, PRESETS
+
+@pytest.mark.timeout(5)
+def test_default_preset():
+    """Test the default preset matches the client library defaults."""
+    settings = load_publisher_settings({})
+    assert settings == PRESETS['default']
+    assert (settings.max_messages, settings.max_bytes, settings.max_latency) == (100, 1000000, 0.01)
+    assert settings.limit_behavior == 'ignore'
+
+@pytest.mark.timeout(5)
+def test_preset_with_overrides():
+    """Test individual variables override the chosen preset."""
+    settings = load_publisher_settings({
+        'PUBSUB_BATCH_PRESET': 'throughput',
+        'PUBSUB_BATCH_MAX_LATENCY': '0.2',
+        'PUBSUB_FLOW_MAX_MESSAGES': '50',
+        'PUBSUB_FLOW_LIMIT_BEHAVIOR': 'ERROR',
+    })
+    assert settings.max_messages == PRESETS['throughput'].max_messages
+    assert settings.max_latency == 0.2
+    assert settings.flow_max_messages == 50
+    assert settings.limit_behavior == 'error'
+
+@pytest.mark.timeout(5)
+@pytest.mark.parametrize('environ', [
+    {'PUBSUB_BATCH_PRESET': 'fastest'},
+    {'PUBSUB_FLOW_LIMIT_BEHAVIOR': 'drop'},
+    {'PUBSUB_BATCH_MAX_BYTES': '20000000'},
+    {'PUBSUB_BATCH_MAX_MESSAGES': '0'},
+])
+def test_invalid_settings(environ):
+    """Test invalid configuration is rejected."""
+    with pytest.raises(ValueError):
+        load_publisher_settings(environ)
+
+@pytest.mark.timeout(5)
+def test_create_publisher():
+    """Test the client is built with batch settings and flow control."""
+    settings = PRESETS['throughput']
+    with patch('google.cloud.pubsub_v1.PublisherClient') as client:
+        create_publisher(settings, enable_message_ordering=True)
+    kwargs = client.call_args.kwargs
+    assert kwargs['batch_settings'].max_messages == settings.max_messages
+    assert kwargs['batch_settings'].max_latency == settings.max_latency
+    flow_control = kwargs['publisher_options'].flow_control
+    assert flow_control.message_limit == settings.flow_max_messages
+    assert flow_control.limit_exceeded_behavior == 'block'
+    assert kwargs['publisher_options'].enable_message_ordering is True
+
+@pytest.mark.timeout(5)
+def test_lazy_client_created_once_under_concurrency():
+    """Test racing threads share one client built on first use."""
+    created = []
+
+    def factory():
+        time.sleep(0.05)  # Widen the race window
+        created.append(object())
+        return created[-1]
+
+    client = LazyClient(factory)
+    assert not client.created
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(client.get())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(created) == 1
+    assert all(result is created[0] for result in results)
+
+@pytest.mark.timeout(5)
+def test_lazy_client_forwards_attributes():
+    """Test attribute access reaches the underlying client."""
+    class StubClient:
+        def topic_path(self, project, topic):
+            return f"{project}/{topic}"
+
+    client = LazyClient(StubClient)
+    assert client.topic_path('p', 't') == 'p/t'
+    assert client.created
+
+def test_patching_a_lazy_client_does_not_create_it():
+    """Test mock.patch can replace a module-level client without building it."""
+    import main
+
+    def factory():
+        raise AssertionError('client created')
+
+    lazy = LazyClient(factory)
+    with patch.object(main, 'publisher', lazy):
+        with patch('main.publisher') as mock:
+            assert main.publisher is mock
+        assert main.publisher is lazy
+    assert not lazy.created
+    with pytest.raises(AttributeError):
+        lazy.__func__
@@ -0,0 +1,138 @@
+import pytest
+from unittest.mock import patch
+import os
+import sys
+import threading
+
+# Add the parent directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, request
+
+import main
+from ratelimit import SlidingWindowLimiter, TokenBucketLimiter, create_rate_limiter
+
+class FakeClock:
+    """Manually advanced monotonic clock."""
+
+    def __init__(self, now=1020.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+@pytest.mark.timeout(5)
+def test_sliding_window_limit(clock):
+    """Test the limit holds within a window and recovers gradually."""
+    limiter = SlidingWindowLimiter(10, 60, clock=clock)
+    results = [limiter.acquire('1.2.3.4') for _ in range(11)]
+    assert [r.allowed for r in results] == [True] * 10 + [False]
+    assert results[0].remaining == 9
+    assert results[9].remaining == 0
+
+    # Halfway into the next window, half of the previous window still counts
+    clock.now = 1080.0 + 30
+    allowed = sum(limiter.acquire('1.2.3.4').allowed for _ in range(10))
+    assert allowed == 5
+
+@pytest.mark.timeout(5)
+def test_sliding_window_resets_after_idle(clock):
+    """Test two idle windows forget the previous count."""
+    limiter = SlidingWindowLimiter(2, 60, clock=clock)
+    limiter.acquire('ip')
+    limiter.acquire('ip')
+    clock.now += 180
+    assert limiter.acquire('ip').remaining == 1
+
+@pytest.mark.timeout(5)
+def test_token_bucket(clock):
+    """Test bursts up to the limit and refill at limit/window per second."""
+    limiter = TokenBucketLimiter(10, 60, clock=clock)
+    assert all(limiter.acquire('ip').allowed for _ in range(10))
+    denied = limiter.acquire('ip')
+    assert not denied.allowed
+    assert denied.reset == pytest.approx(6.0)
+    clock.now += 6
+    assert limiter.acquire('ip').allowed
+    assert not limiter.acquire('ip').allowed
+
+@pytest.mark.timeout(5)
+def test_keys_are_independent(clock):
+    """Test one key's usage does not affect another."""
+    limiter = TokenBucketLimiter(1, 60, clock=clock)
+    assert limiter.acquire('a').allowed
+    assert not limiter.acquire('a').allowed
+    assert limiter.acquire('b').allowed
+
+@pytest.mark.timeout(5)
+def test_idle_keys_are_evicted(clock):
+    """Test keys idle past the TTL are dropped when new keys arrive."""
+    limiter = TokenBucketLimiter(5, 60, stripes=1, clock=clock)
+    for i in range(100):
+        limiter.acquire(f"10.0.0.{i}")
+    assert len(limiter) == 100
+    clock.now += 61
+    limiter.acquire('new')
+    assert len(limiter) == 1
+
+@pytest.mark.timeout(5)
+def test_capacity_evicts_least_recently_used(clock):
+    """Test memory stays bounded by max_keys with LRU eviction."""
+    limiter = SlidingWindowLimiter(5, 60, max_keys=4, stripes=1, clock=clock)
+    for key in ['a', 'b', 'c', 'd']:
+        limiter.acquire(key)
+    limiter.acquire('a')  # 'b' is now least recently used
+    limiter.acquire('e')
+    assert len(limiter) == 4
+    assert limiter.acquire('a').remaining == 2  # 'a' kept its count
+    assert limiter.acquire('b').remaining == 4  # 'b' started over
+
+@pytest.mark.timeout(10)
+@pytest.mark.parametrize('algorithm', ['sliding_window', 'token_bucket'])
+def test_concurrent_acquire(algorithm):
+    """Test the limit is exact under concurrent threads."""
+    limiter = create_rate_limiter(algorithm, 500, 3600)
+    allowed = []
+
+    def worker():
+        allowed.append(sum(limiter.acquire('shared').allowed for _ in range(200)))
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sum(allowed) == 500
+
+@pytest.mark.timeout(5)
+def test_unknown_algorithm():
+    """Test an unknown algorithm is rejected."""
+    with pytest.raises(ValueError):
+        create_rate_limiter('leaky', 10, 60)
+
+@pytest.mark.timeout(5)
+def test_rate_limit_headers(mock_publisher):
+    """Test responses carry X-RateLimit-* headers and 429 has Retry-After."""
+    os.environ['TEST_RATE_LIMIT'] = '1'
+    app = Flask(__name__)
+    app.add_url_rule('/', 'validate', lambda: main.data_validator(request), methods=['POST'])
+    client = app.test_client()
+    limiter = SlidingWindowLimiter(2, 60)
+    body = {'name': 'Test', 'email': 'test@example.com', 'age': 30}
+
+    with patch.object(main, 'rate_limiter', limiter):
+        first = client.post('/', json=body)
+        second = client.post('/', json=body)
+        third = client.post('/', json=body)
+
+    assert first.status_code == 200
+    assert first.headers['X-RateLimit-Limit'] == '2'
+    assert first.headers['X-RateLimit-Remaining'] == '1'
+    assert 0 < int(first.headers['X-RateLimit-Reset']) <= 60
+    assert second.headers['X-RateLimit-Remaining'] == '0'
+    assert third.status_code == 429
+    assert third.headers['Retry-After'] == third.headers['X-RateLimit-Reset']
@@ -0,0 +1,117 @@
+import pytest
+import os
+import sys
+
+# Add the parent directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from schema import compile_schema, FieldError
+
+SCHEMA = {
+    'type': 'object',
+    'required': ['name', 'email', 'age'],
+    'properties': {
+        'name': {'type': 'string', 'minLength': 2, 'maxLength': 5},
+        'email': {'type': 'string', 'pattern': r'^[^@]+@[^@]+\.[a-z]{2,}$'},
+        'age': {'type': 'integer', 'minimum': 0, 'maximum': 120},
+        'address': {
+            'type': 'object',
+            'required': ['city'],
+            'properties': {
+                'city': {'type': 'string', 'minLength': 1},
+                'zip': {'type': 'string', 'pattern': r'^\d{5}$'}
+            }
+        }
+    }
+}
+
+validate = compile_schema(SCHEMA)
+
+@pytest.fixture
+def valid_data():
+    """Return a document that satisfies SCHEMA."""
+    return {'name': 'John', 'email': 'john@example.com', 'age': 30}
+
+@pytest.mark.timeout(5)
+def test_valid_document(valid_data):
+    """Test that a valid document has no errors."""
+    assert validate(valid_data) == []
+    valid_data['address'] = {'city': 'Anytown', 'zip': '12345'}
+    assert validate(valid_data) == []
+
+@pytest.mark.timeout(5)
+def test_required_fields():
+    """Test that missing and null fields are reported in declaration order."""
+    errors = validate({'age': None})
+    assert [e.message for e in errors] == [
+        'name is required', 'email is required', 'age is required'
+    ]
+    assert all(e.keyword == 'required' for e in errors)
+
+@pytest.mark.timeout(5)
+def test_type_errors(valid_data):
+    """Test type checks, including booleans not counting as integers."""
+    valid_data['name'] = 42
+    valid_data['age'] = True
+    assert validate(valid_data) == [
+        FieldError('name', 'type', 'name must be a string'),
+        FieldError('age', 'type', 'age must be an integer'),
+    ]
+
+@pytest.mark.timeout(5)
+def test_string_constraints(valid_data):
+    """Test minLength, maxLength and pattern."""
+    valid_data['name'] = 'J'
+    assert validate(valid_data)[0].message == 'name must be at least 2 characters long'
+    valid_data['name'] = 'Johnny'
+    assert validate(valid_data)[0].message == 'name must be at most 5 characters long'
+    valid_data['name'] = 'John'
+    valid_data['email'] = 'invalid-email'
+    assert validate(valid_data)[0].message == 'email format is invalid'
+
+@pytest.mark.timeout(5)
+def test_number_constraints(valid_data):
+    """Test minimum and maximum."""
+    valid_data['age'] = -1
+    assert validate(valid_data)[0].message == 'age must be greater than or equal to 0'
+    valid_data['age'] = 121
+    assert validate(valid_data)[0].message == 'age must be less than or equal to 120'
+
+@pytest.mark.timeout(5)
+def test_exclusive_bounds():
+    """Test exclusiveMinimum and exclusiveMaximum."""
+    check = compile_schema({'properties': {'n': {'exclusiveMinimum': 0, 'exclusiveMaximum': 1}}})
+    assert check({'n': 0.5}) == []
+    assert check({'n': 0})[0].keyword == 'exclusiveMinimum'
+    assert check({'n': 1})[0].keyword == 'exclusiveMaximum'
+
+@pytest.mark.timeout(5)
+def test_one_error_per_field(valid_data):
+    """Test that a field stops at its first failing keyword."""
+    valid_data['name'] = 'J'
+    valid_data['age'] = 'old'
+    errors = validate(valid_data)
+    assert [e.field for e in errors] == ['name', 'age']
+
+@pytest.mark.timeout(5)
+def test_nested_object(valid_data):
+    """Test that nested objects report dotted paths."""
+    valid_data['address'] = {'zip': '12'}
+    assert [e.message for e in validate(valid_data)] == [
+        'address.city is required', 'address.zip format is invalid'
+    ]
+    valid_data['address'] = 'Main St'
+    assert validate(valid_data)[0].message == 'address must be an object'
+
+@pytest.mark.timeout(5)
+def test_non_object_document():
+    """Test that a non-object document is rejected."""
+    assert validate(['name']) == [FieldError('', 'type', 'Expected a JSON object')]
+
+@pytest.mark.timeout(5)
+def test_invalid_schema():
+    """Test that unsupported schemas fail at compile time."""
+    with pytest.raises(ValueError):
+        compile_schema({'type': 'array'})
+    with pytest.raises(ValueError):
+        compile_schema({'properties': {'x': {'type': 'date'}}})
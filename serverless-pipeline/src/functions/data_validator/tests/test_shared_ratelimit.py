@@ -0,0 +1,192 @@
+import pytest
+import os
+import random
+import sys
+import threading
+
+# Add the parent directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from metrics import metrics
+from ratelimit import LeasedRateLimiter, create_rate_limiter
+from ratelimit_backends import BackendError, InMemoryBackend, RedisBackend
+from resp_server import RespServer
+
+class FakeClock:
+    """Manually advanced wall clock."""
+
+    def __init__(self, now=1020.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+class CountingBackend(InMemoryBackend):
+    """In-memory backend that counts round trips."""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    def reserve(self, *args):
+        self.calls += 1
+        return super().reserve(*args)
+
+@pytest.mark.timeout(5)
+def test_global_limit_across_instances():
+    """Test instances sharing a backend never allow more than the limit in total."""
+    clock = FakeClock()
+    backend = CountingBackend()
+    instances = [LeasedRateLimiter(100, 60, backend, lease_size=7, clock=clock)
+                 for _ in range(5)]
+
+    rng = random.Random(42)
+    allowed = sum(rng.choice(instances).acquire('1.2.3.4').allowed for _ in range(1000))
+    assert allowed <= 100
+    # Tokens stranded in other instances' leases are the only shortfall
+    assert allowed > 100 - len(instances) * 7
+    # Leasing means far fewer backend calls than requests
+    assert backend.calls < 100
+
+    # The next window starts from zero on every instance
+    clock.now = 1080.0
+    assert all(instance.acquire('1.2.3.4').allowed for instance in instances)
+
+@pytest.mark.timeout(5)
+def test_single_instance_is_exact():
+    """Test one instance spends its whole lease before being limited."""
+    limiter = LeasedRateLimiter(10, 60, InMemoryBackend(), lease_size=4, clock=FakeClock())
+    results = [limiter.acquire('1.2.3.4') for _ in range(11)]
+    assert [r.allowed for r in results] == [True] * 10 + [False]
+    assert [r.remaining for r in results[:10]] == list(range(9, -1, -1))
+    assert results[10].reset == 60  # The clock sits on a window boundary
+
+@pytest.mark.timeout(5)
+def test_keys_are_independent():
+    """Test each client IP has its own shared counter."""
+    limiter = LeasedRateLimiter(2, 60, InMemoryBackend(), clock=FakeClock())
+    assert [limiter.acquire('a').allowed for _ in range(3)] == [True, True, False]
+    assert limiter.acquire('b').allowed
+
+@pytest.mark.timeout(10)
+def test_redis_backend_global_limit():
+    """Test threaded instances sharing a Redis-protocol server hold the global limit."""
+    with RespServer() as server:
+        instances = [LeasedRateLimiter(200, 60, RedisBackend.from_url(server.url), lease_size=10)
+                     for _ in range(4)]
+        allowed = []
+
+        def worker(limiter):
+            count = sum(limiter.acquire('10.0.0.1').allowed for _ in range(150))
+            allowed.append(count)
+
+        threads = [threading.Thread(target=worker, args=(limiter,))
+                   for limiter in instances for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert sum(allowed) <= 200
+        assert sum(allowed) > 200 - len(instances) * 10
+        keys = list(server.data)
+        assert len(keys) == 1 and keys[0].startswith('ratelimit:10.0.0.1:')
+        assert server.expiry[keys[0]] == 60
+        assert server.commands.count('INCRBY') < 100
+
+@pytest.mark.timeout(5)
+def test_redis_backend_auth_and_errors():
+    """Test AUTH on connect and that error replies raise BackendError."""
+    with RespServer(password='secret') as server:
+        backend = RedisBackend.from_url(server.url)
+        assert backend.reserve('k', 1, 5, 8, 60) == (5, 5)
+        assert backend.reserve('k', 1, 5, 8, 60) == (3, 8)
+        assert backend.reserve('k', 1, 5, 8, 60) == (0, 8)
+        assert server.commands[0] == 'AUTH'
+        with pytest.raises(BackendError):
+            backend.execute(('FLUSHALL',))
+
+        wrong = RedisBackend.from_url(server.url.replace('secret', 'wrong'))
+        with pytest.raises(BackendError):
+            wrong.reserve('k', 1, 5, 8, 60)
+
+@pytest.mark.timeout(5)
+def test_backend_outage_limits_locally():
+    """Test an unreachable backend is skipped for the cool-down and the limit enforced locally."""
+    with RespServer() as server:
+        url = server.url
+    metrics.reset()
+    limiter = create_rate_limiter('sliding_window', 2, 60,
+                                  backend=RedisBackend.from_url(url, timeout=0.1))
+    assert isinstance(limiter, LeasedRateLimiter)
+    assert [limiter.acquire('1.2.3.4').allowed for _ in range(3)] == [True, True, False]
+    assert metrics.get('rate_limit_backend_errors') == 1
+
+class FailingBackend(CountingBackend):
+    """Backend that fails while `down` is set."""
+
+    def __init__(self):
+        super().__init__()
+        self.down = True
+
+    def reserve(self, *args):
+        if self.down:
+            self.calls += 1
+            raise BackendError('unreachable')
+        return super().reserve(*args)
+
+@pytest.mark.timeout(5)
+def test_failed_backend_is_retried_after_cooldown():
+    """Test the backend is not called again until the cool-down has passed."""
+    clock = FakeClock()
+    backend = FailingBackend()
+    limiter = LeasedRateLimiter(100, 60, backend, backend_cooldown=5, clock=clock)
+    assert all(limiter.acquire(f'10.0.0.{i}').allowed for i in range(10))
+    assert backend.calls == 1
+    backend.down = False
+    clock.now += 5
+    assert limiter.acquire('10.0.0.1').allowed
+    assert backend.calls == 2
+    assert limiter.acquire('10.0.0.1').allowed
+    assert backend.calls == 2
+
+class SlowBackend(InMemoryBackend):
+    """Backend whose reservations for one key block until released."""
+
+    def __init__(self, slow_key):
+        super().__init__()
+        self.slow_key = slow_key
+        self.entered = threading.Event()
+        self.release = threading.Event()
+
+    def reserve(self, key, *args):
+        if key == self.slow_key:
+            self.entered.set()
+            self.release.wait(5)
+        return super().reserve(key, *args)
+
+@pytest.mark.timeout(5)
+def test_reservation_does_not_hold_stripe_lock():
+    """Test a slow reservation does not block other keys on the same stripe."""
+    backend = SlowBackend('slow')
+    limiter = LeasedRateLimiter(10, 60, backend, stripes=1, clock=FakeClock())
+    slow = threading.Thread(target=limiter.acquire, args=('slow',))
+    slow.start()
+    try:
+        assert backend.entered.wait(2)
+        assert limiter.acquire('fast').allowed
+    finally:
+        backend.release.set()
+        slow.join()
+    assert limiter.acquire('slow').remaining == 8
+
+@pytest.mark.timeout(5)
+def test_from_url():
+    """Test parsing of redis:// URLs."""
+    backend = RedisBackend.from_url('redis://:pw@10.1.2.3:6380/2')
+    assert (backend.host, backend.port, backend.password, backend.db) == ('10.1.2.3', 6380, 'pw', 2)
+    backend = RedisBackend.from_url('redis://cache')
+    assert (backend.host, backend.port, backend.db) == ('cache', 6379, 0)
+    with pytest.raises(ValueError):
+        RedisBackend.from_url('http://cache')
@@ -0,0 +1,152 @@
+import pytest
+from unittest.mock import patch, MagicMock
+import io
+import json
+import os
+import subprocess
+import sys
+import textwrap
+
+# Add the parent directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Request
+from werkzeug.test import EnvironBuilder
+
+import main
+from main import data_validator, iter_lines, TOO_LONG
+
+FUNCTION_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+VALID = {'name': 'Test User', 'email': 'test@example.com', 'age': 25}
+INVALID = {'name': 'Test User', 'email': 'invalid-email', 'age': 25}
+
+def make_stream_request(body, query_string=None):
+    """Build a real Flask request posting body to /stream."""
+    builder = EnvironBuilder(method='POST', path='/stream', data=body,
+                             query_string=query_string,
+                             headers={'Content-Type': 'application/x-ndjson',
+                                      'X-Forwarded-For': '127.0.0.1'})
+    return Request(builder.get_environ())
+
+def read_response(response):
+    """Decode the streamed NDJSON result lines."""
+    return [json.loads(line) for line in b''.join(response.response).splitlines()]
+
+@pytest.fixture
+def mock_publisher():
+    """Create a mock publisher client returning sequential message IDs."""
+    with patch('main.publisher') as mock:
+        mock.topic_path.return_value = "projects/test-project/topics/events-topic"
+        counter = iter(range(10000))
+
+        def publish(topic, data):
+            future = MagicMock()
+            future.result.return_value = f"id-{next(counter)}"
+            return future
+        mock.publish.side_effect = publish
+        yield mock
+
+@pytest.mark.timeout(5)
+def test_iter_lines_across_chunks():
+    """Test lines split across read chunks are joined, and long lines are dropped."""
+    body = b'{"a": 1}\n' + b'x' * 40 + b'\n\n[2]'
+    lines = list(iter_lines(io.BytesIO(body), chunk_size=3, max_line_bytes=16))
+    assert lines == [(1, b'{"a": 1}'), (2, TOO_LONG), (3, b''), (4, b'[2]')]
+    assert list(iter_lines(io.BytesIO(b'y' * 40), 3, 16)) == [(1, TOO_LONG)]
+
+@pytest.mark.timeout(5)
+def test_stream_reports_unpublished_lines(mock_publisher):
+    """Test only lines that were not published are reported, with a summary."""
+    body = '\n'.join([json.dumps(VALID), '', '{bad', json.dumps(INVALID), json.dumps(VALID)])
+    response = data_validator(make_stream_request(body))
+    assert response.mimetype == 'application/x-ndjson'
+    lines = read_response(response)
+    assert lines[0] == {'line': 3, 'status': 'invalid', 'errors': ['malformed JSON']}
+    assert lines[1] == {'line': 4, 'status': 'invalid', 'errors': ['email format is invalid']}
+    assert lines[2] == {'summary': {'lines': 5, 'published': 2, 'invalid': 2, 'failed': 0}}
+    assert mock_publisher.publish.call_count == 2
+
+@pytest.mark.timeout(5)
+def test_stream_all_results_in_chunks(mock_publisher):
+    """Test every line is reported with ?results=all, across publish chunks."""
+    body = '\n'.join(json.dumps(dict(VALID, age=20 + i)) for i in range(7)) + '\n'
+    with patch.object(main, 'STREAM_CHUNK_ITEMS', 3):
+        lines = read_response(data_validator(make_stream_request(body, 'results=all')))
+    assert [line['line'] for line in lines[:-1]] == list(range(1, 8))
+    assert [line['event_id'] for line in lines[:-1]] == [f'id-{i}' for i in range(7)]
+    assert lines[-1]['summary']['published'] == 7
+
+@pytest.mark.timeout(5)
+def test_stream_publish_failure(mock_publisher):
+    """Test a failed publish is reported for its line without ending the stream."""
+    mock_publisher.publish.side_effect = Exception('unavailable')
+    body = '\n'.join([json.dumps(VALID), json.dumps(INVALID)])
+    lines = read_response(data_validator(make_stream_request(body)))
+    assert lines[0]['status'] == 'failed'
+    assert lines[1]['status'] == 'invalid'
+    assert lines[2]['summary'] == {'lines': 2, 'published': 0, 'invalid': 1, 'failed': 1}
+
+# Feeds a ~300 MB NDJSON upload through the real request path with a publisher
+# that completes at once, and prints the peak RSS growth in KiB
+PEAK_RSS_SCRIPT = textwrap.dedent('''
+    import json, resource, sys
+    from unittest.mock import MagicMock
+    from flask import Request
+    from werkzeug.test import EnvironBuilder
+    import main
+
+    LINES = int(sys.argv[1])
+    line = (json.dumps({"name": "Test User", "email": "test@example.com", "age": 25,
+                        "notes": "x" * 10000}) + "\\n").encode()
+
+    class Upload:
+        """File-like body generated as it is read."""
+        def __init__(self):
+            self.left = LINES
+            self.buffer = b""
+        def read(self, size=-1):
+            while len(self.buffer) < size and self.left:
+                self.buffer += line
+                self.left -= 1
+            data, self.buffer = self.buffer[:size], self.buffer[size:]
+            return data
+
+    class Publisher:
+        """Completes every publish at once and keeps nothing."""
+        def topic_path(self, project, topic):
+            return f"projects/{project}/topics/{topic}"
+        def publish(self, topic, data):
+            future = MagicMock()
+            future.result.return_value = "id"
+            return future
+
+    main.publisher = Publisher()
+    main.idempotency_cache = None
+
+    builder = EnvironBuilder(method="POST", path="/stream",
+                             headers={"Content-Type": "application/x-ndjson",
+                                      "X-Forwarded-For": "127.0.0.1"})
+    environ = builder.get_environ()
+    environ.update({"wsgi.input": Upload(), "CONTENT_LENGTH": str(LINES * len(line))})
+    request = Request(environ)
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    output = b"".join(main.data_validator(request).response)
+    summary = json.loads(output.splitlines()[-1])["summary"]
+    assert summary["published"] == LINES, summary
+    print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline)
+''')
+
+@pytest.mark.timeout(300)
+def test_stream_memory_stays_flat():
+    """Test peak RSS does not grow with the size of a ~300 MB upload."""
+    pytest.importorskip('resource')  # The script measures peak RSS with it
+    completed = subprocess.run(
+        [sys.executable, '-c', PEAK_RSS_SCRIPT, '30000'],
+        cwd=FUNCTION_DIR, capture_output=True, text=True, timeout=280,
+        env=dict(os.environ, PYTEST_CURRENT_TEST='1',
+                 PYTHONPATH=os.pathsep.join(sys.path)),
+    )
+    assert completed.returncode == 0, completed.stderr
+    growth_kib = int(completed.stdout.strip().splitlines()[-1])
+    assert growth_kib < 100 * 1024
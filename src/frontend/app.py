@@ -5,8 +5,15 @@ Provides a web interface and API endpoints for data validation.
 import os
 import json
 import re
+import threading
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
 from flask import Flask, render_template, request, jsonify
+import embedded_validator
+from coalescer import BatchNotSent, Coalescer
+from metrics import metrics
+from result_cache import ResultCache, cache_key
 
 app = Flask(__name__)
 
@@ -16,6 +23,53 @@ FUNCTION_URL = os.getenv(
     'VALIDATOR_URL',
     f'https://us-central1-{PROJECT_ID}.cloudfunctions.net/data-validator'
 )
+# One pooled connection per gunicorn thread (see Dockerfile)
+POOL_SIZE = int(os.getenv('VALIDATOR_POOL_SIZE', os.getenv('GUNICORN_THREADS', '8')))
+# Separate limits for opening a connection and for waiting on the response
+CONNECT_TIMEOUT = float(os.getenv('VALIDATOR_CONNECT_TIMEOUT', '3.05'))
+READ_TIMEOUT = float(os.getenv('VALIDATOR_READ_TIMEOUT', '10'))
+# 'remote' calls the data-validator function over HTTP; 'embedded' validates
+# and publishes in-process, calling the function only if a publish cannot start
+VALIDATOR_MODE = os.getenv('VALIDATOR_MODE', 'remote')
+if VALIDATOR_MODE not in ('remote', 'embedded'):
+    raise ValueError(f"Unknown VALIDATOR_MODE {VALIDATOR_MODE!r}; expected 'remote' or 'embedded'")
+# Merge calls to the function made within COALESCE_WINDOW_MS of each other
+# into /batch calls of up to COALESCE_MAX_ITEMS events; off unless the
+# window is set
+COALESCE_WINDOW_MS = float(os.getenv('COALESCE_WINDOW_MS', '0'))
+COALESCE_MAX_ITEMS = int(os.getenv('COALESCE_MAX_ITEMS', '16'))
+# Each submission's own limit on waiting for its result, batched or not
+SUBMISSION_TIMEOUT = CONNECT_TIMEOUT + READ_TIMEOUT
+# Answer resubmitted payloads from up to RESULT_CACHE_MAX_ENTRIES recent
+# validator results; off unless set. Rejections are kept longer than
+# successes, which are only replayed to retries with the same idempotency key.
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv('RESULT_CACHE_MAX_ENTRIES', '0'))
+RESULT_CACHE_TTL_SECONDS = float(os.getenv('RESULT_CACHE_TTL_SECONDS', '30'))
+RESULT_CACHE_NEGATIVE_TTL_SECONDS = float(os.getenv('RESULT_CACHE_NEGATIVE_TTL_SECONDS', '300'))
+
+# Coalescer threads sending batches at once, each on a connection of its own
+COALESCE_SENDERS = POOL_SIZE if COALESCE_WINDOW_MS > 0 else 0
+
+# Keep-alive connection pool shared by every thread, sized for the request
+# threads and the coalescer's senders together. Sessions themselves are not
+# thread-safe, so each thread gets its own, mounted on this adapter.
+http_adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE + COALESCE_SENDERS)
+_thread_state = threading.local()
+
+def get_session():
+    """
+    Return this thread's requests session.
+
+    Returns:
+        requests.Session: Session using the shared connection pool
+    """
+    session = getattr(_thread_state, 'session', None)
+    if session is None:
+        session = requests.Session()
+        session.mount('https://', http_adapter)
+        session.mount('http://', http_adapter)
+        _thread_state.session = session
+    return session
 
 def is_valid_email(email):
     """
@@ -41,16 +95,121 @@ def validate_data(data):
         tuple: (response_data, status_code)
     """
     try:
-        response = requests.post(
+        response = get_session().post(
             FUNCTION_URL,
             json=data,
             headers={'Content-Type': 'application/json'},
-            timeout=10
+            timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)
         )
         return response.json(), response.status_code
     except requests.exceptions.RequestException as req_error:
         return {'error': str(req_error)}, 500
 
+def check_submission(data):
+    """
+    Check a submission's required fields, email and age before it is sent on.
+
+    Args:
+        data (dict): The submitted data
+
+    Returns:
+        tuple: (error_data, 400) if a check fails, None otherwise
+    """
+    required_fields = ['name', 'email', 'age']
+    missing_fields = [field for field in required_fields if field not in data]
+    if missing_fields:
+        return {'error': f'Missing required fields: {", ".join(missing_fields)}'}, 400
+
+    # Validate email format
+    if not is_valid_email(data['email']):
+        return {'error': 'Invalid email format'}, 400
+
+    # Validate age
+    if not isinstance(data.get('age'), int) or data['age'] < 0:
+        return {'error': 'Age must be a positive integer'}, 400
+    return None
+
+def never_connected(req_error):
+    """
+    Tell whether a request failed before reaching the function.
+
+    Args:
+        req_error (requests.exceptions.RequestException): The failure
+
+    Returns:
+        bool: True if no connection was made, so nothing was sent
+    """
+    if isinstance(req_error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(req_error.args[0], 'reason', None) if req_error.args else None
+    return isinstance(reason, NewConnectionError)
+
+def validate_batch(items):
+    """
+    Validate several submissions with one call to the function's /batch path.
+
+    Args:
+        items (list): The submissions to validate
+
+    Returns:
+        list: (response_data, status_code) for each submission, in order
+
+    Raises:
+        BatchNotSent: If the function provably processed none of the items,
+            because no connection was made or it rejected the batch (4xx)
+    """
+    try:
+        response = get_session().post(
+            f"{FUNCTION_URL.rstrip('/')}/batch",
+            json=items,
+            headers={'Content-Type': 'application/json'},
+            timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)
+        )
+    except requests.exceptions.RequestException as req_error:
+        if never_connected(req_error):
+            raise BatchNotSent(str(req_error)) from req_error
+        # Some events may have been published; don't send them again
+        return [({'error': str(req_error)}, 500)] * len(items)
+    if 400 <= response.status_code < 500:
+        raise BatchNotSent(f'Validator answered /batch with {response.status_code}')
+    if response.status_code >= 500:
+        error = {'error': f'Validator answered /batch with {response.status_code}'}
+        return [(error, 500)] * len(items)
+    return [(result['body'], result['status']) for result in response.json()['results']]
+
+coalescer = Coalescer(
+    lambda items: validate_batch(items),
+    lambda data: validate_data(data),
+    window=COALESCE_WINDOW_MS / 1000,
+    max_items=COALESCE_MAX_ITEMS,
+    max_batches=COALESCE_SENDERS
+) if COALESCE_WINDOW_MS > 0 else None
+
+result_cache = ResultCache(
+    RESULT_CACHE_MAX_ENTRIES,
+    success_ttl=RESULT_CACHE_TTL_SECONDS,
+    negative_ttl=RESULT_CACHE_NEGATIVE_TTL_SECONDS
+) if RESULT_CACHE_MAX_ENTRIES > 0 else None
+
+def call_validator(data):
+    """
+    Validate and publish in-process, or call the validation function.
+
+    Args:
+        data (dict): A submission that passed check_submission
+
+    Returns:
+        tuple: (response_data, status_code)
+    """
+    outcome = None
+    if VALIDATOR_MODE == 'embedded':
+        outcome = embedded_validator.validate_and_publish(data)
+    if outcome is None and coalescer is not None:
+        outcome = coalescer.validate(data, SUBMISSION_TIMEOUT)
+    if outcome is None:
+        outcome = validate_data(data)
+    return outcome
+
 @app.route('/')
 def index():
     """Render the main page."""
@@ -61,6 +220,11 @@ def health():
     """Health check endpoint."""
     return jsonify({'status': 'healthy'}), 200
 
+@app.route('/metrics')
+def get_metrics():
+    """In-process counters and gauges, such as the coalescer's and result cache's."""
+    return jsonify(metrics.snapshot()), 200
+
 @app.route('/api/validate', methods=['POST'])
 def validate():
     """
@@ -74,24 +238,23 @@ def validate():
         if not data:
             return jsonify({'error': 'No data provided'}), 400
 
-        # Validate required fields
-        required_fields = ['name', 'email', 'age']
-        missing_fields = [field for field in required_fields if field not in data]
-        if missing_fields:
-            return jsonify({
-                'error': f'Missing required fields: {", ".join(missing_fields)}'
-            }), 400
-
-        # Validate email format
-        if not is_valid_email(data['email']):
-            return jsonify({'error': 'Invalid email format'}), 400
+        rejected = check_submission(data)
+        if rejected is not None:
+            error, status_code = rejected
+            return jsonify(error), status_code
 
-        # Validate age
-        if not isinstance(data.get('age'), int) or data['age'] < 0:
-            return jsonify({'error': 'Age must be a positive integer'}), 400
+        # A resubmission may be answered with the validator's earlier result
+        key = None
+        if result_cache is not None:
+            key = cache_key(data, request.headers.get('Idempotency-Key'))
+            cached = result_cache.lookup(key)
+            if cached is not None:
+                result, status_code = cached
+                return jsonify(result), status_code
 
-        # Call the validation function
-        result, status_code = validate_data(data)
+        result, status_code = call_validator(data)
+        if key is not None:
+            result_cache.store(key, result, status_code)
         return jsonify(result), status_code
 
     except json.JSONDecodeError:
@@ -0,0 +1,184 @@
+"""
+ASGI entry point for the frontend, served by uvicorn when the Dockerfile's
+FRONTEND_SERVER is 'async'.
+
+Under gunicorn's gthread worker every submission holds one of
+GUNICORN_THREADS threads while it waits on the validator. Here
+/api/validate waits on the event loop instead, calling the validator
+through a pooled aiohttp session, so one instance can hold thousands of
+submissions in flight. Only well-formed JSON submissions that pass the
+frontend's checks take this path. Every other request, including
+malformed /api/validate bodies, goes to the Flask app through asgiref's
+WsgiToAsgi, so routes and responses are the same in both modes.
+"""
+import asyncio
+import json
+import os
+
+import aiohttp
+from asgiref.wsgi import WsgiToAsgi
+
+import app as frontend
+import embedded_validator
+from result_cache import cache_key
+
+# Connections to the validator; submissions beyond this wait for a free one
+MAX_CONNECTIONS = int(os.getenv('VALIDATOR_MAX_CONNECTIONS', '512'))
+
+wsgi_app = WsgiToAsgi(frontend.app)
+_client = None
+
+def get_client():
+    """
+    Return the shared client session, creating it on first use. Must be
+    called on the event loop that serves requests.
+
+    Returns:
+        aiohttp.ClientSession: Session with a keep-alive pool to the validator
+    """
+    global _client
+    if _client is None:
+        _client = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=MAX_CONNECTIONS),
+            # connect includes waiting for a free pooled connection
+            timeout=aiohttp.ClientTimeout(total=None, connect=frontend.READ_TIMEOUT,
+                                          sock_connect=frontend.CONNECT_TIMEOUT,
+                                          sock_read=frontend.READ_TIMEOUT)
+        )
+    return _client
+
+async def close_client():
+    """Close the shared client session's connections."""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+async def validate_data(data):
+    """
+    Validate data using the Cloud Function, without blocking the event loop.
+
+    Args:
+        data (dict): The data to validate
+
+    Returns:
+        tuple: (response_data, status_code)
+    """
+    try:
+        async with get_client().post(frontend.FUNCTION_URL, json=data) as response:
+            return await response.json(content_type=None), response.status
+    except (aiohttp.ClientError, asyncio.TimeoutError) as req_error:
+        return {'error': str(req_error) or type(req_error).__name__}, 500
+
+async def validate(data, idempotency_key=None):
+    """Async counterpart of the Flask /api/validate view, after its checks."""
+    key = None
+    if frontend.result_cache is not None:
+        key = cache_key(data, idempotency_key)
+        cached = frontend.result_cache.lookup(key)
+        if cached is not None:
+            return cached
+
+    outcome = None
+    if frontend.VALIDATOR_MODE == 'embedded':
+        outcome = await embedded_validator.validate_and_publish_async(data)
+    if outcome is None and frontend.coalescer is not None:
+        outcome = await frontend.coalescer.validate_async(data, frontend.SUBMISSION_TIMEOUT)
+    if outcome is None:
+        outcome = await validate_data(data)
+    if key is not None:
+        frontend.result_cache.store(key, *outcome)
+    return outcome
+
+def header(scope, name):
+    """Return the first value of a request header, as Flask's headers.get would."""
+    for key, value in scope['headers']:
+        if key == name:
+            return value.decode('latin-1')
+    return None
+
+def parse_submission(scope, body):
+    """
+    Decode a submission the async path can take, as Flask's get_json would.
+
+    Returns:
+        dict: The submission, or None if Flask should answer the request
+    """
+    content_type = dict(scope['headers']).get(b'content-type', b'').decode('latin-1')
+    mimetype = content_type.split(';', 1)[0].strip().lower()
+    if not (mimetype == 'application/json'
+            or (mimetype.startswith('application/') and mimetype.endswith('+json'))):
+        return None
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return None
+    if not data or not isinstance(data, dict) or frontend.check_submission(data) is not None:
+        return None
+    return data
+
+async def read_body(receive):
+    """Read the whole request body; None if the client disconnected."""
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body', False):
+            return b''.join(chunks)
+
+def replay(body, receive):
+    """Return a receive callable that yields an already read body first."""
+    sent = False
+
+    async def receive_body():
+        nonlocal sent
+        if sent:
+            return await receive()
+        sent = True
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+    return receive_body
+
+async def send_json(send, result, status_code):
+    """Send a JSON response encoded exactly as Flask's jsonify would."""
+    response = frontend.app.json.response(result)
+    await send({
+        'type': 'http.response.start',
+        'status': status_code,
+        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                    for name, value in response.headers.items()]
+    })
+    await send({'type': 'http.response.body', 'body': response.get_data()})
+
+async def lifespan(receive, send):
+    """Handle server startup and shutdown; the client is closed on shutdown."""
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await close_client()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def app(scope, receive, send):
+    """ASGI application: async /api/validate, Flask for everything else."""
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if not (scope['type'] == 'http' and scope['method'] == 'POST'
+            and scope['path'] == '/api/validate'):
+        return await wsgi_app(scope, receive, send)
+
+    body = await read_body(receive)
+    if body is None:
+        return
+    data = parse_submission(scope, body)
+    if data is None:
+        return await wsgi_app(scope, replay(body, receive), send)
+    try:
+        result, status_code = await validate(data, header(scope, b'idempotency-key'))
+    except Exception as error:
+        frontend.app.logger.error('Error processing request: %s', str(error))
+        result, status_code = {'error': 'Internal server error'}, 500
+    await send_json(send, result, status_code)
@@ -0,0 +1,164 @@
+"""
+Micro-batching of calls to the data-validator function.
+
+Under load every /api/validate request would make a call of its own. A
+Coalescer collects submissions for up to a window (COALESCE_WINDOW_MS,
+counted from the first submission waiting) or until max_items are
+waiting, and sends them to the function's /batch path as one request.
+Each caller gets its own result back. A lone submission is sent with the
+normal single-event call.
+
+Every caller keeps its own timeout, counted from when it submitted and
+covering both the wait for a batch and the batch call itself. A
+submission whose caller has given up before its batch is sent is left
+out of the batch. If send_batch raises BatchNotSent, the validator
+provably did not process the batch, and each of its submissions is sent
+with a call of its own. Any other failure may have come after events were
+published, so it is raised to every caller instead of risking publishing
+them twice.
+
+Metrics, in the frontend's /metrics:
+
+    coalesce_batch_size      histogram of submissions per batch sent
+    coalesce_queue_seconds   histogram of time from submission to send
+    coalesce_timeouts        callers that gave up waiting
+    coalesce_fallbacks       batch calls not sent, whose submissions went singly
+    coalesce_batch_errors    batch calls that failed with an unknown outcome
+"""
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Callable, List, NamedTuple, Tuple
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+QUEUE_SECONDS_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1)
+
+Result = Tuple[Any, int]
+
+
+class BatchNotSent(Exception):
+    """Raised by send_batch when the validator did not process any of the batch."""
+
+
+class Submission(NamedTuple):
+    future: Future
+    data: Any
+    submitted: float
+
+
+class Coalescer:
+    """Merges concurrent validator calls into batch calls."""
+
+    def __init__(self, send_batch: Callable[[List[Any]], List[Result]],
+                 send_one: Callable[[Any], Result], window: float, max_items: int,
+                 max_batches: int = 8):
+        self.window = window
+        self.max_items = max_items
+        self._send_batch = send_batch
+        self._send_one = send_one
+        self._cond = threading.Condition()
+        self._queue: List[Submission] = []
+        # Batch calls in flight at once, each on its own pooled connection
+        self._senders = ThreadPoolExecutor(max_workers=max_batches,
+                                           thread_name_prefix='coalesce')
+        self._collector = None
+
+    def submit(self, data) -> Future:
+        """Queue a submission; the future resolves to (response_data, status_code)."""
+        submission = Submission(Future(), data, time.monotonic())
+        with self._cond:
+            if self._collector is None:
+                # Started on first use, so a forking server starts it in the worker
+                self._collector = threading.Thread(target=self._collect, daemon=True,
+                                                   name='coalesce-collector')
+                self._collector.start()
+            self._queue.append(submission)
+            if len(self._queue) == 1 or len(self._queue) >= self.max_items:
+                self._cond.notify()
+        return submission.future
+
+    def validate(self, data, timeout: float) -> Result:
+        """Submit and wait at most timeout seconds for this submission's result."""
+        future = self.submit(data)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            return self._timed_out(timeout)
+
+    async def validate_async(self, data, timeout: float) -> Result:
+        """Like validate, waiting on the event loop."""
+        future = self.submit(data)
+        try:
+            # Cancelling the wrapper on timeout cancels the submission too
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            return self._timed_out(timeout)
+
+    @staticmethod
+    def _timed_out(timeout):
+        metrics.increment('coalesce_timeouts')
+        return {'error': f'Timed out after {timeout} seconds waiting for the validator'}, 500
+
+    def _collect(self) -> None:
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                deadline = self._queue[0].submitted + self.window
+                while len(self._queue) < self.max_items:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._queue[:self.max_items]
+                del self._queue[:self.max_items]
+            self._senders.submit(self._send, batch)
+
+    def _send(self, batch: List[Submission]) -> None:
+        now = time.monotonic()
+        batch = [s for s in batch if s.future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        metrics.observe('coalesce_batch_size', len(batch), BATCH_SIZE_BUCKETS)
+        for submission in batch:
+            metrics.observe('coalesce_queue_seconds', now - submission.submitted,
+                            QUEUE_SECONDS_BUCKETS)
+        if len(batch) == 1:
+            self._resolve(batch[0], self._send_one)
+        else:
+            self._send_together(batch)
+
+    def _send_together(self, batch: List[Submission]) -> None:
+        try:
+            results = self._send_batch([submission.data for submission in batch])
+            if len(results) != len(batch):
+                raise ValueError(f'{len(results)} results for {len(batch)} events')
+        except BatchNotSent as error:
+            logger.warning('Batch of %d was not sent, sending them singly: %s', len(batch), error)
+            metrics.increment('coalesce_fallbacks')
+            for submission in batch:
+                self._senders.submit(self._resolve, submission, self._send_one)
+            return
+        except Exception as error:
+            logger.error('Batch of %d failed: %s', len(batch), error)
+            metrics.increment('coalesce_batch_errors')
+            for submission in batch:
+                submission.future.set_exception(error)
+            return
+        for submission, result in zip(batch, results):
+            submission.future.set_result(result)
+
+    @staticmethod
+    def _resolve(submission: Submission, send: Callable[[Any], Result]) -> None:
+        try:
+            submission.future.set_result(send(submission.data))
+        except BaseException as error:
+            submission.future.set_exception(error)
@@ -0,0 +1,165 @@
+"""
+In-process validation and publishing for the frontend.
+
+With VALIDATOR_MODE=embedded, /api/validate checks events against the
+shared event schema (event_schema.py) and publishes them to Pub/Sub
+itself, skipping the HTTP call to the data-validator function. Events are
+published the way the function publishes them by default: compact JSON
+on the routed topic, with the same message attributes, and the response
+bodies are the function's.
+
+Spilling, overload protection, payload encoding, claim checks, envelope
+packing and ordering keys stay in the function. When a publish cannot be
+started, validate_and_publish returns None and the caller hands the event
+to the function instead. Once started, a publish cannot be cancelled and
+may still succeed, so one that fails or times out gets the function's
+PUBLISH_ERROR response rather than being sent again.
+validate_and_publish_async is the same for the ASGI entry point
+(asgi.py), awaiting the publish on the event loop.
+"""
+import asyncio
+import json
+import logging
+import os
+
+from event_schema import EVENT_SCHEMA, FIELD_ERRORS
+from publisher_config import LazyClient, create_publisher
+from routing import RoutingTable, parse_routes
+from schema import compile_schema
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ID = os.getenv('PROJECT_ID', 'servless-pipeline')
+PUBLISH_TIMEOUT = float(os.getenv('PUBLISH_TIMEOUT_SECONDS', '10'))
+
+validate_event = compile_schema(EVENT_SCHEMA)
+routes = RoutingTable(
+    PROJECT_ID, 'events-topic', parse_routes(os.getenv('TOPIC_ROUTES', '')),
+    schema_version=os.getenv('SCHEMA_VERSION', '1'),
+    default_event_type=os.getenv('DEFAULT_EVENT_TYPE', 'user')
+)
+
+# Pub/Sub client, created on the first embedded publish and reused
+publisher = LazyClient(create_publisher)
+
+# The function's response to a publish that failed
+PUBLISH_ERROR = {
+    'error': 'Publishing failed',
+    'code': 'PUBLISH_ERROR',
+    'message': 'Failed to publish data to the queue'
+}
+
+# Same compact encoding as the function's JSON codec
+_encode = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+
+def check_event(data):
+    """
+    Validate an event against the shared schema.
+
+    Args:
+        data (dict): The decoded event
+
+    Returns:
+        tuple: (error_data, 400) for an invalid event, None for a valid one
+    """
+    errors = validate_event(data)
+    if not errors:
+        return None
+    missing = {e.field for e in errors if e.keyword == 'required'}
+    if missing:
+        missing_fields = [f for f in EVENT_SCHEMA['required'] if f in missing]
+        return {
+            'error': 'Missing required fields',
+            'code': 'MISSING_FIELDS',
+            'message': f'Required fields missing: {", ".join(missing_fields)}',
+            'missing_fields': missing_fields
+        }, 400
+    error = errors[0]
+    body = FIELD_ERRORS.get((error.field, error.keyword))
+    if body is None:
+        body = {'error': 'Invalid field', 'code': 'INVALID_FIELD', 'message': error.message}
+    return body, 400
+
+def publish(data):
+    """
+    Publish a valid event to its route's topic.
+
+    Args:
+        data (dict): The decoded event
+
+    Returns:
+        concurrent.futures.Future: Resolves to the message ID
+    """
+    route = routes.route_event(data)
+    return publisher.publish(route.topic_path, _encode(data).encode('utf-8'),
+                             **route.attributes)
+
+def success_body(data):
+    """Response body for a published event, as the function returns it."""
+    return {
+        'message': 'Data validated and published successfully',
+        'code': 'SUCCESS',
+        'data': data
+    }
+
+def start_publish(data):
+    """
+    Start publishing a valid event.
+
+    Args:
+        data (dict): The decoded event
+
+    Returns:
+        concurrent.futures.Future: The publish, or None if it did not start
+    """
+    try:
+        return publish(data)
+    except Exception as error:
+        logger.warning('Embedded publish did not start, falling back to the function: %s', error)
+        return None
+
+def publish_failed(error):
+    """Response for a started publish that failed or timed out."""
+    # It may still be delivered, so the event is not handed to the function
+    logger.error('Embedded publish failed: %s', error)
+    return PUBLISH_ERROR, 500
+
+def validate_and_publish(data):
+    """
+    Validate an event and publish it to its route's topic.
+
+    Args:
+        data (dict): The decoded event
+
+    Returns:
+        tuple: (response_data, status_code), or None if the publish could
+            not be started
+    """
+    rejected = check_event(data)
+    if rejected is not None:
+        return rejected
+    future = start_publish(data)
+    if future is None:
+        return None
+    try:
+        future.result(timeout=PUBLISH_TIMEOUT)
+    except Exception as error:
+        return publish_failed(error)
+    return success_body(data), 200
+
+async def validate_and_publish_async(data):
+    """
+    Like validate_and_publish, but waits for the publish without blocking
+    the event loop.
+    """
+    rejected = check_event(data)
+    if rejected is not None:
+        return rejected
+    future = start_publish(data)
+    if future is None:
+        return None
+    try:
+        await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), PUBLISH_TIMEOUT)
+    except Exception as error:
+        return publish_failed(error)
+    return success_body(data), 200
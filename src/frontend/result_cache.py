@@ -0,0 +1,134 @@
+"""
+Cache of recent validator results, keyed by a canonical payload hash.
+
+Users double-submit forms and scripted clients resend identical
+payloads. The frontend answers those from here instead of calling the
+validator again. A payload's key is the SHA-256 of its canonical JSON:
+keys sorted, no whitespace, and the email lower-cased. The validator's
+email check accepts either case, so case cannot change the answer.
+
+Rejections (400) depend only on the payload and are reused for any
+resubmission, for the longer negative TTL. A success means the event was
+published, so it is only replayed to a resubmission that declares itself
+a retry of the same event. That is one with the same idempotency token:
+the Idempotency-Key header if sent, else the event's event_id, as the
+data-validator function's duplicate suppression uses. Successes without a
+token are not cached, and other statuses (5xx, 503) never are.
+
+Entries are kept in TTL+LRU order per instance. Metrics:
+result_cache_hits, result_cache_misses, result_cache_evictions (dropped
+for capacity), result_cache_expirations, and result_cache_hit_rate and
+result_cache_entries gauges.
+"""
+import collections
+import hashlib
+import json
+import threading
+import time
+from typing import Any, Callable, NamedTuple, Optional, Tuple
+
+from metrics import metrics
+
+
+class CacheKey(NamedTuple):
+    digest: str
+    token: Optional[str]  # Idempotency token; None if the request has none
+
+
+def payload_digest(data: dict) -> str:
+    """SHA-256 of the payload's canonical JSON."""
+    if isinstance(data.get('email'), str):
+        data = {**data, 'email': data['email'].lower()}
+    canonical = json.dumps(data, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def cache_key(data: dict, idempotency_key: Optional[str] = None) -> CacheKey:
+    """Key a submission by its payload and idempotency token."""
+    if idempotency_key:
+        token = f'key:{idempotency_key}'
+    elif data.get('event_id') is not None:
+        token = f"event:{data['event_id']}"
+    else:
+        token = None
+    return CacheKey(payload_digest(data), token)
+
+
+class ResultCache:
+    """Bounded per-instance cache of (response_data, status_code) by payload."""
+
+    def __init__(self, max_entries: int, success_ttl: float, negative_ttl: float,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.success_ttl = success_ttl
+        self.negative_ttl = negative_ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        # digest -> (expires, token, response_data, status_code)
+        self._entries = collections.OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def lookup(self, key: CacheKey) -> Optional[Tuple[Any, int]]:
+        """Return a cached result this submission may reuse, counting the hit or miss."""
+        now = self._clock()
+        with self._lock:
+            result = None
+            entry = self._entries.get(key.digest)
+            if entry is not None and entry[0] <= now:
+                del self._entries[key.digest]
+                metrics.increment('result_cache_expirations')
+            elif entry is not None and (entry[3] == 400 or (key.token and entry[1] == key.token)):
+                self._entries.move_to_end(key.digest)
+                result = entry[2], entry[3]
+            if result is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+            self._update_gauges()
+        metrics.increment('result_cache_hits' if result is not None else 'result_cache_misses')
+        return result
+
+    def store(self, key: CacheKey, response_data: Any, status_code: int) -> None:
+        """Keep a validator result, if it may be reused."""
+        if status_code == 400:
+            ttl = self.negative_ttl
+        elif 200 <= status_code < 300 and key.token:
+            ttl = self.success_ttl
+        else:
+            return
+        now = self._clock()
+        evicted = expired = 0
+        with self._lock:
+            entries = self._entries
+            entries[key.digest] = (now + ttl, key.token, response_data, status_code)
+            entries.move_to_end(key.digest)
+            # Drop expired entries from the LRU end, then entries over capacity
+            while entries:
+                expires = next(iter(entries.values()))[0]
+                if expires <= now:
+                    expired += 1
+                elif len(entries) > self.max_entries:
+                    evicted += 1
+                else:
+                    break
+                entries.popitem(last=False)
+            self._update_gauges()
+        if evicted:
+            metrics.increment('result_cache_evictions', evicted)
+        if expired:
+            metrics.increment('result_cache_expirations', expired)
+
+    def clear(self) -> None:
+        """Forget all results."""
+        with self._lock:
+            self._entries.clear()
+            self._update_gauges()
+
+    def _update_gauges(self) -> None:
+        lookups = self._hits + self._misses
+        metrics.set_gauge('result_cache_hit_rate', self._hits / lookups if lookups else 0.0)
+        metrics.set_gauge('result_cache_entries', len(self._entries))
@@ -0,0 +1,120 @@
+"""
+Topic routing and message attributes for published events.
+
+Every event is published with attributes that describe it, so subscribers
+can use server-side filters (e.g. ``attributes.event_type = "user.created"``)
+instead of decoding every payload to find the ones they want:
+
+    event_type        the event's event_type field, or the default type
+    schema_version    version of the schema the payload was validated against
+    content_encoding  encoding of the payload bytes; identity is plain JSON
+    priority          the event's priority field, when it has one
+
+Some events can go to topics of their own. Routes are given as a
+comma-separated list of ``<event_type>=<topic>`` and
+``priority:<level>=<topic>`` entries (TOPIC_ROUTES). An event_type route
+wins over a priority route; everything else goes to the default topic.
+Routes, with their attribute dicts, are built once and reused.
+
+This module is shared by data_validator and the frontend; keep the
+copies in sync.
+"""
+from typing import Dict, Mapping, NamedTuple, Optional, Tuple
+
+PRIORITY_PREFIX = 'priority:'
+
+
+class Route(NamedTuple):
+    """Where an event is published, and the attributes it carries."""
+    topic_path: str
+    attributes: Dict[str, str]
+
+
+def parse_routes(spec: str) -> Dict[str, str]:
+    """
+    Parse a TOPIC_ROUTES value into {key: topic}, where key is an event
+    type or 'priority:<level>'. Raises ValueError for a malformed entry.
+    """
+    routes = {}
+    for entry in spec.split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        key, sep, topic = (part.strip() for part in entry.partition('='))
+        if not sep or not key or not topic or key == PRIORITY_PREFIX:
+            raise ValueError(f"Invalid TOPIC_ROUTES entry {entry!r}; expected <event_type>=<topic>"
+                             f" or {PRIORITY_PREFIX}<level>=<topic>")
+        if key in routes:
+            raise ValueError(f"Duplicate TOPIC_ROUTES entry for {key!r}")
+        routes[key] = topic
+    return routes
+
+
+class RoutingTable:
+    """Resolves an event's type and priority to a Route."""
+
+    def __init__(self, project_id: str, default_topic: str,
+                 routes: Optional[Mapping[str, str]] = None, schema_version: str = '1',
+                 content_encoding: str = 'identity', default_event_type: str = 'event',
+                 max_cached: int = 1024):
+        self.project_id = project_id
+        self.schema_version = schema_version
+        self.content_encoding = content_encoding
+        self.default_event_type = default_event_type
+        self.max_cached = max_cached
+        self.default_topic = self._topic_path(default_topic)
+        self._type_topics = {}
+        self._priority_topics = {}
+        for key, topic in (routes or {}).items():
+            if key.startswith(PRIORITY_PREFIX):
+                self._priority_topics[key[len(PRIORITY_PREFIX):]] = self._topic_path(topic)
+            else:
+                self._type_topics[key] = self._topic_path(topic)
+        # (event_type, priority) -> Route; the configured routes are built up
+        # front, other combinations on first use
+        self._routes: Dict[Tuple[Optional[str], Optional[str]], Route] = {}
+        self.route(None, None)
+        for event_type in self._type_topics:
+            self.route(event_type, None)
+        for priority in self._priority_topics:
+            self.route(None, priority)
+
+    @property
+    def topics(self) -> Tuple[str, ...]:
+        """Every topic path events can be published to."""
+        return tuple(sorted({self.default_topic, *self._type_topics.values(),
+                             *self._priority_topics.values()}))
+
+    def route(self, event_type: Optional[str] = None, priority: Optional[str] = None) -> Route:
+        """Return the Route for an event type and priority (None for absent)."""
+        key = (event_type, priority)
+        route = self._routes.get(key)
+        if route is None:
+            route = self._build(event_type, priority)
+            # Bounded, since both values come from requests
+            if len(self._routes) < self.max_cached:
+                self._routes[key] = route
+        return route
+
+    def route_event(self, event: Mapping) -> Route:
+        """Return the Route for a decoded event."""
+        return self.route(event.get('event_type'), event.get('priority'))
+
+    def _build(self, event_type: Optional[str], priority: Optional[str]) -> Route:
+        event_type = event_type or self.default_event_type
+        topic_path = (self._type_topics.get(event_type)
+                      or self._priority_topics.get(priority)
+                      or self.default_topic)
+        attributes = {
+            'event_type': event_type,
+            'schema_version': self.schema_version,
+            'content_encoding': self.content_encoding,
+        }
+        if priority:
+            attributes['priority'] = priority
+        return Route(topic_path, attributes)
+
+    def _topic_path(self, topic: str) -> str:
+        if topic.startswith('projects/'):
+            return topic
+        return f'projects/{self.project_id}/topics/{topic}'
@@ -1,6 +1,23 @@
+import asyncio
 import json
+import socket
+import threading
 import unittest
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+import app as app_module
+import embedded_validator
 from app import app
+from coalescer import BatchNotSent, Coalescer
+from metrics import metrics
+from result_cache import ResultCache, cache_key
+
+try:
+    import asgi
+except ImportError:  # The async server's dependencies are optional for tests
+    asgi = None
 
 class TestApp(unittest.TestCase):
     def setUp(self):
@@ -56,5 +73,448 @@ class TestApp(unittest.TestCase):
         data = json.loads(response.data)
         self.assertIn('error', data)
 
+class StandInValidator(BaseHTTPRequestHandler):
+    """Keep-alive HTTP/1.1 stand-in for the Cloud Function."""
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_POST(self):
+        data = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        status = 200
+        if self.path.endswith('/batch'):
+            self.server.batches.append(len(data))
+            threading.Event().wait(getattr(self.server, 'batch_delay', 0))
+            status = getattr(self.server, 'batch_status', 200)
+            body = json.dumps({'results': [{'status': 200, 'body': {'message': 'ok', 'data': each}}
+                                           for each in data]}).encode()
+        else:
+            body = json.dumps({'message': 'ok', 'data': data}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class TestValidatorSession(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StandInValidator)
+        self.server.lock = threading.Lock()
+        self.server.connections = 0
+        self.server.batches = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/'
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_connections_are_reused(self):
+        """Test that requests from many threads share a bounded pool of connections"""
+        event = {'name': 'Test User', 'email': 'test@example.com', 'age': 25}
+        with patch.object(app_module, 'FUNCTION_URL', self.url):
+            with ThreadPoolExecutor(max_workers=4) as pool:
+                results = list(pool.map(lambda _: app_module.validate_data(event), range(100)))
+        self.assertEqual(results, [({'message': 'ok', 'data': event}, 200)] * 100)
+        self.assertLessEqual(self.server.connections, 4)
+
+    def test_connect_and_read_timeouts(self):
+        """Test that connect and read timeouts are passed separately"""
+        with patch.object(app_module, 'get_session') as get_session:
+            get_session.return_value.post.return_value.json.return_value = {}
+            get_session.return_value.post.return_value.status_code = 200
+            app_module.validate_data({})
+        timeout = get_session.return_value.post.call_args[1]['timeout']
+        self.assertEqual(timeout, (app_module.CONNECT_TIMEOUT, app_module.READ_TIMEOUT))
+
+    def test_sessions_are_per_thread_with_shared_pool(self):
+        """Test that each thread gets its own session mounted on the shared adapter"""
+        sessions = []
+        thread = threading.Thread(target=lambda: sessions.append(app_module.get_session()))
+        thread.start()
+        thread.join()
+        session = app_module.get_session()
+        self.assertIs(session, app_module.get_session())
+        self.assertIsNot(session, sessions[0])
+        for each in (session, sessions[0]):
+            self.assertIs(each.get_adapter('https://example.com'), app_module.http_adapter)
+
+class FakePublisher:
+    """
+    Records published messages. While failing is set every publish fails,
+    and while unavailable is set every publish raises before it starts.
+    """
+    def __init__(self, failing=False):
+        self.failing = failing
+        self.unavailable = False
+        self.published = []
+
+    def publish(self, topic, data, **attributes):
+        if self.unavailable:
+            raise Exception('Publisher is shut down')
+        future = Future()
+        if self.failing:
+            future.set_exception(Exception('Deadline exceeded'))
+        else:
+            self.published.append((topic, json.loads(data), attributes))
+            future.set_result(str(len(self.published)))
+        return future
+
+class TestEmbeddedValidator(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+        self.publisher = FakePublisher()
+        patches = [patch.object(app_module, 'VALIDATOR_MODE', 'embedded'),
+                   patch.object(embedded_validator, 'publisher', self.publisher)]
+        for each in patches:
+            each.start()
+            self.addCleanup(each.stop)
+
+    def test_publishes_in_process(self):
+        """Test that embedded mode publishes without calling the function"""
+        event = {'name': 'Test User', 'email': 'test@example.com', 'age': 25,
+                 'event_type': 'user.created'}
+        with patch.object(app_module, 'validate_data') as validate_data:
+            response = self.app.post('/api/validate', json=event)
+        validate_data.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data), {
+            'message': 'Data validated and published successfully',
+            'code': 'SUCCESS', 'data': event})
+        topic, data, attributes = self.publisher.published[0]
+        self.assertEqual(topic, 'projects/servless-pipeline/topics/events-topic')
+        self.assertEqual(data, event)
+        self.assertEqual(attributes['event_type'], 'user.created')
+
+    def test_rejects_with_the_function_errors(self):
+        """Test that schema failures get the function's error bodies"""
+        event = {'name': ' ', 'email': 'test@example.com', 'age': 25}
+        response = self.app.post('/api/validate', json=event)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(json.loads(response.data)['code'], 'INVALID_NAME')
+        self.assertEqual(embedded_validator.check_event({'name': 'x'})[0]['missing_fields'],
+                         ['age', 'email'])
+        self.assertEqual(self.publisher.published, [])
+
+    def test_falls_back_to_the_function(self):
+        """Test that an embedded publish that cannot start is handed to the function"""
+        self.publisher.unavailable = True
+        event = {'name': 'Test User', 'email': 'test@example.com', 'age': 25}
+        with patch.object(app_module, 'validate_data',
+                          return_value=({'code': 'QUEUED'}, 202)) as validate_data:
+            response = self.app.post('/api/validate', json=event)
+        validate_data.assert_called_once_with(event)
+        self.assertEqual(response.status_code, 202)
+
+    def test_started_publish_is_not_sent_again(self):
+        """Test that a failed or timed-out embedded publish is not handed to the function"""
+        event = {'name': 'Test User', 'email': 'test@example.com', 'age': 25}
+        self.publisher.failing = True
+        with patch.object(app_module, 'validate_data') as validate_data:
+            response = self.app.post('/api/validate', json=event)
+        validate_data.assert_not_called()
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(json.loads(response.data)['code'], 'PUBLISH_ERROR')
+
+        def publish_never_completes(topic, data, **attributes):
+            return Future()
+        with patch.object(self.publisher, 'publish', publish_never_completes), \
+                patch.object(embedded_validator, 'PUBLISH_TIMEOUT', 0.05), \
+                patch.object(app_module, 'validate_data') as validate_data:
+            response = self.app.post('/api/validate', json=event)
+        validate_data.assert_not_called()
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(json.loads(response.data), embedded_validator.PUBLISH_ERROR)
+
+@unittest.skipUnless(asgi, 'aiohttp and asgiref are not installed')
+class TestAsgiApp(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StandInValidator)
+        self.server.lock = threading.Lock()
+        self.server.connections = 0
+        self.server.batches = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        url_patch = patch.object(app_module, 'FUNCTION_URL',
+                                 f'http://127.0.0.1:{self.server.server_address[1]}/')
+        url_patch.start()
+        self.addCleanup(url_patch.stop)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    @staticmethod
+    async def post(body, content_type):
+        """POST to /api/validate through the ASGI app; returns (status, headers, body)."""
+        scope = {'type': 'http', 'method': 'POST', 'path': '/api/validate', 'query_string': b'',
+                 'root_path': '', 'scheme': 'http', 'http_version': '1.1',
+                 'server': ('test', 80), 'client': ('127.0.0.1', 1234),
+                 'headers': [(b'content-type', content_type.encode()),
+                             (b'content-length', str(len(body)).encode())]}
+        messages = [{'type': 'http.request', 'body': body.encode(), 'more_body': False}]
+        sent = []
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            await asyncio.Event().wait()
+
+        async def send(message):
+            sent.append(message)
+        await asgi.app(scope, receive, send)
+        return (sent[0]['status'], dict(sent[0]['headers']),
+                b''.join(message.get('body', b'') for message in sent[1:]))
+
+    def post_all(self, requests):
+        """Send (body, content_type) pairs to the ASGI app concurrently."""
+        async def send_all():
+            responses = await asyncio.gather(*(self.post(body, content_type)
+                                               for body, content_type in requests))
+            await asgi.close_client()
+            return responses
+        return asyncio.run(send_all())
+
+    def test_responses_match_flask(self):
+        """Test that the async path answers every submission as the Flask view does"""
+        requests = [
+            (json.dumps({'name': 'Test User', 'email': 'test@example.com', 'age': 25}),
+             'application/json'),
+            (json.dumps({'name': 'Test User', 'email': 'invalid-email', 'age': 25}),
+             'application/json'),
+            (json.dumps({'name': 'Test User'}), 'application/json; charset=utf-8'),
+            ('{}', 'application/json'),
+            ('[1]', 'application/json'),
+            ('{bad', 'application/json'),
+            ('name=Test', 'text/plain'),
+        ]
+        client = app.test_client()
+        expected = [client.post('/api/validate', data=body, content_type=content_type)
+                    for body, content_type in requests]
+        for (status, headers, body), flask_response in zip(self.post_all(requests), expected):
+            self.assertEqual(status, flask_response.status_code)
+            self.assertEqual(body, flask_response.data)
+            self.assertEqual(headers[b'content-type'].decode(),
+                             flask_response.headers['Content-Type'])
+
+    def test_submissions_wait_on_the_event_loop(self):
+        """Test that far more submissions than threads can be in flight at once"""
+        publisher = FakePublisher()
+        pending = []
+
+        def publish(topic, data, **attributes):
+            pending.append(Future())
+            return pending[-1]
+        publisher.publish = publish
+        event = json.dumps({'name': 'Test User', 'email': 'test@example.com', 'age': 25})
+
+        def complete_when_all_in_flight():
+            while len(pending) < 500:
+                threading.Event().wait(0.01)
+            for future in pending:
+                future.set_result('1')
+        threading.Thread(target=complete_when_all_in_flight, daemon=True).start()
+        with patch.object(app_module, 'VALIDATOR_MODE', 'embedded'), \
+                patch.object(embedded_validator, 'publisher', publisher):
+            responses = self.post_all([(event, 'application/json')] * 500)
+        self.assertEqual({status for status, _, _ in responses}, {200})
+        self.assertEqual(len(pending), 500)
+
+class TestCoalescer(unittest.TestCase):
+    def setUp(self):
+        metrics.reset()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StandInValidator)
+        self.server.lock = threading.Lock()
+        self.server.connections = 0
+        self.server.batches = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        url_patch = patch.object(app_module, 'FUNCTION_URL',
+                                 f'http://127.0.0.1:{self.server.server_address[1]}')
+        url_patch.start()
+        self.addCleanup(url_patch.stop)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_concurrent_submissions_share_a_batch(self):
+        """Test that submissions within the window go to /batch together"""
+        coalescer = Coalescer(app_module.validate_batch, app_module.validate_data,
+                              window=5, max_items=6)
+        events = [{'name': f'User {n}', 'email': 'test@example.com', 'age': 20 + n}
+                  for n in range(6)]
+        with ThreadPoolExecutor(max_workers=6) as pool:
+            results = list(pool.map(lambda event: coalescer.validate(event, 10), events))
+        self.assertEqual(results, [({'message': 'ok', 'data': event}, 200) for event in events])
+        self.assertEqual(self.server.batches, [6])
+        self.assertEqual(metrics.get('coalesce_batch_size_count'), 1)
+        self.assertEqual(metrics.get('coalesce_batch_size_le_4'), 0)
+        self.assertEqual(metrics.get('coalesce_batch_size_le_8'), 1)
+        self.assertEqual(metrics.get('coalesce_queue_seconds_count'), 6)
+
+    def test_route_uses_the_coalescer(self):
+        """Test that /api/validate goes through the coalescer when one is set"""
+        coalescer = Coalescer(app_module.validate_batch, app_module.validate_data,
+                              window=0.001, max_items=16)
+        event = {'name': 'Test User', 'email': 'test@example.com', 'age': 25}
+        with patch.object(app_module, 'coalescer', coalescer):
+            response = app.test_client().post('/api/validate', json=event)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data), {'message': 'ok', 'data': event})
+        # A lone submission is sent with the single-event call
+        self.assertEqual(self.server.batches, [])
+        self.assertEqual(metrics.get('coalesce_batch_size_le_1'), 1)
+        snapshot = json.loads(app.test_client().get('/metrics').data)
+        self.assertEqual(snapshot['counters']['coalesce_batch_size_count'], 1)
+
+    def test_unsent_batch_falls_back_to_single_calls(self):
+        """Test that each submission of a batch that was not sent is sent on its own"""
+        def fail(items):
+            raise BatchNotSent('connection refused')
+        singles = []
+        coalescer = Coalescer(fail, lambda data: singles.append(data) or (data, 200),
+                              window=5, max_items=3)
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            results = list(pool.map(lambda n: coalescer.validate(n, 10), range(3)))
+        self.assertEqual(results, [(0, 200), (1, 200), (2, 200)])
+        self.assertEqual(sorted(singles), [0, 1, 2])
+        self.assertEqual(metrics.get('coalesce_fallbacks'), 1)
+
+    def test_failed_batch_is_not_sent_again(self):
+        """Test that a batch that may have been processed is not resent singly"""
+        def fail(items):
+            raise ValueError('3 results for 2 events')
+        singles = []
+        coalescer = Coalescer(fail, lambda data: singles.append(data) or (data, 200),
+                              window=5, max_items=2)
+        futures = [coalescer.submit(n) for n in range(2)]
+        for future in futures:
+            with self.assertRaises(ValueError):
+                future.result(timeout=5)
+        self.assertEqual(singles, [])
+        self.assertEqual(metrics.get('coalesce_batch_errors'), 1)
+        self.assertEqual(metrics.get('coalesce_fallbacks'), 0)
+
+    def test_batch_call_outcomes(self):
+        """Test that validate_batch only reports a batch as not sent when it provably was not"""
+        events = [{'name': f'User {n}', 'email': 'test@example.com', 'age': 20} for n in range(2)]
+        self.server.batch_status = 404
+        with self.assertRaises(BatchNotSent):
+            app_module.validate_batch(events)
+
+        self.server.batch_status = 500
+        self.assertEqual([status for _, status in app_module.validate_batch(events)], [500, 500])
+
+        # The function may have published before the response was lost
+        self.server.batch_status = 200
+        self.server.batch_delay = 0.5
+        with patch.object(app_module, 'READ_TIMEOUT', 0.05):
+            results = app_module.validate_batch(events)
+        self.assertEqual([status for _, status in results], [500, 500])
+        self.assertIn('timed out', results[0][0]['error'])
+
+        closed = socket.socket()
+        closed.bind(('127.0.0.1', 0))
+        port = closed.getsockname()[1]
+        closed.close()
+        with patch.object(app_module, 'FUNCTION_URL', f'http://127.0.0.1:{port}'):
+            with self.assertRaises(BatchNotSent):
+                app_module.validate_batch(events)
+
+    def test_each_submission_keeps_its_own_timeout(self):
+        """Test that a caller gives up on time and its submission is not sent"""
+        sent = []
+        coalescer = Coalescer(lambda items: sent.extend(items) or [(i, 200) for i in items],
+                              lambda data: sent.append(data) or (data, 200),
+                              window=0.3, max_items=16)
+        impatient = coalescer.validate('impatient', 0.05)
+        self.assertEqual(impatient[1], 500)
+        self.assertIn('Timed out', impatient[0]['error'])
+        self.assertEqual(coalescer.validate('patient', 5), ('patient', 200))
+        self.assertEqual(sent, ['patient'])
+        self.assertEqual(metrics.get('coalesce_timeouts'), 1)
+
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        metrics.reset()
+        self.now = 0.0
+        self.cache = ResultCache(3, success_ttl=10, negative_ttl=60, clock=lambda: self.now)
+        cache_patch = patch.object(app_module, 'result_cache', self.cache)
+        cache_patch.start()
+        self.addCleanup(cache_patch.stop)
+
+    def test_rejections_are_reused_for_resubmissions(self):
+        """Test that a rejected payload is answered from the cache, however it is written"""
+        rejection = {'error': 'Validation failed', 'code': 'INVALID_AGE'}, 400
+        client = app.test_client()
+        with patch.object(app_module, 'validate_data', return_value=rejection) as validate_data:
+            first = client.post('/api/validate',
+                                data='{"name": "A", "email": "a@example.com", "age": 200}',
+                                content_type='application/json')
+            again = client.post('/api/validate',
+                                data='{"age":200,"email":"A@Example.COM","name":"A"}',
+                                content_type='application/json')
+        validate_data.assert_called_once()
+        self.assertEqual((again.status_code, again.data), (first.status_code, first.data))
+        self.assertEqual(metrics.get('result_cache_hits'), 1)
+        self.assertEqual(metrics.get('result_cache_misses'), 1)
+        self.assertEqual(metrics.get('result_cache_hit_rate'), 0.5)
+
+    def test_successes_are_reused_only_for_retries(self):
+        """Test that a success is only replayed to a resubmission with the same idempotency key"""
+        event = {'name': 'Test User', 'email': 'test@example.com', 'age': 25}
+        client = app.test_client()
+        with patch.object(app_module, 'validate_data',
+                          return_value=({'message': 'ok', 'data': event}, 200)) as validate_data:
+            for _ in range(2):
+                client.post('/api/validate', json=event)
+            self.assertEqual(validate_data.call_count, 2)
+            for key in ('abc', 'abc', 'def'):
+                response = client.post('/api/validate', json=event,
+                                       headers={'Idempotency-Key': key})
+                self.assertEqual(response.status_code, 200)
+            self.assertEqual(validate_data.call_count, 4)
+            # An event_id marks a resent event as the same one
+            for _ in range(2):
+                client.post('/api/validate', json=dict(event, event_id='e-1'))
+            self.assertEqual(validate_data.call_count, 5)
+        self.assertEqual(metrics.get('result_cache_hits'), 2)
+
+    def test_errors_are_not_cached(self):
+        """Test that validator failures are always retried"""
+        key = cache_key({'name': 'A'}, 'abc')
+        for status_code in (500, 503):
+            self.cache.store(key, {'error': 'unavailable'}, status_code)
+        self.assertIsNone(self.cache.lookup(key))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_expiry_and_eviction(self):
+        """Test that rejections outlive successes and the least recently used go first"""
+        success = cache_key({'n': 1}, 'abc')
+        rejected = [cache_key({'n': n}) for n in range(2, 6)]
+        self.cache.store(success, {'message': 'ok'}, 200)
+        self.cache.store(rejected[0], {'error': 'bad'}, 400)
+        self.now = 30
+        self.assertIsNone(self.cache.lookup(success))
+        self.assertEqual(self.cache.lookup(rejected[0]), ({'error': 'bad'}, 400))
+        self.assertEqual(metrics.get('result_cache_expirations'), 1)
+
+        for key in rejected[1:3]:
+            self.cache.store(key, {'error': 'bad'}, 400)
+        self.cache.lookup(rejected[0])
+        self.cache.store(rejected[3], {'error': 'bad'}, 400)
+        # rejected[1] was used least recently, so it goes to make room
+        self.assertEqual(len(self.cache), 3)
+        self.assertIsNone(self.cache.lookup(rejected[1]))
+        self.assertEqual(metrics.get('result_cache_evictions'), 1)
+        self.now = 70
+        self.assertIsNone(self.cache.lookup(rejected[0]))
+        self.assertEqual(metrics.get('result_cache_entries'), 2)
+
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file
@@ -0,0 +1,191 @@
+"""
+Claim-check offload of large event payloads to object storage.
+
+Pub/Sub caps message size, and one large message holds up the whole
+publish batch it travels in. ClaimCheck writes message data of at least
+threshold bytes to a store under a key derived from its SHA-256, and
+returns a small reference to publish instead. Identical bodies share one
+object, so a body that is already stored is not written again.
+
+A reference message carries the original attributes plus
+``claim_check`` (the body's SHA-256); its data is a JSON object with the
+store URI, key, digest and size. Subscribers pass messages through
+ClaimCheckResolver, which fetches and verifies the body and keeps
+recently used bodies in a size-bounded LRU cache, before decoding them.
+
+Stores are a Cloud Storage bucket (``gs://bucket/prefix``, needs
+google-cloud-storage) or a local directory, used in tests and local runs.
+"""
+import collections
+import hashlib
+import json
+import os
+import threading
+from typing import Dict, Mapping, Optional, Tuple
+
+CLAIM_CHECK_ATTRIBUTE = 'claim_check'
+
+
+class FilesystemStore:
+    """Local directory standing in for a bucket."""
+
+    def __init__(self, root: str):
+        self.root = root
+        self.uri = 'file://' + os.path.abspath(root)
+
+    def put_if_absent(self, key: str, data: bytes) -> bool:
+        """Write data under key unless it exists; returns True if written."""
+        path = self._path(key)
+        if os.path.exists(path):
+            return False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)  # Readers never see a partial object
+        return True
+
+    def get(self, key: str) -> bytes:
+        """Return the object's bytes; raises KeyError if it does not exist."""
+        try:
+            with open(self._path(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            raise KeyError(key) from None
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split('/'))
+
+
+class GCSStore:
+    """Cloud Storage bucket; the client is created on first use."""
+
+    def __init__(self, bucket_name: str, prefix: str = ''):
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+        self.uri = f'gs://{bucket_name}/{prefix}'
+        self._bucket = None
+        self._lock = threading.Lock()
+
+    def put_if_absent(self, key: str, data: bytes) -> bool:
+        from google.api_core.exceptions import PreconditionFailed
+
+        try:
+            # Generation 0 means "only if no live object exists", in one request
+            self._blob(key).upload_from_string(data, if_generation_match=0)
+        except PreconditionFailed:
+            return False
+        return True
+
+    def get(self, key: str) -> bytes:
+        from google.api_core.exceptions import NotFound
+
+        try:
+            return self._blob(key).download_as_bytes()
+        except NotFound:
+            raise KeyError(key) from None
+
+    def _blob(self, key: str):
+        if self._bucket is None:
+            with self._lock:
+                if self._bucket is None:
+                    from google.cloud import storage
+                    self._bucket = storage.Client().bucket(self.bucket_name)
+        return self._bucket.blob(self.prefix + key)
+
+
+def open_store(url: str):
+    """Open a store from gs://bucket/prefix, file:///path or a plain path."""
+    if url.startswith('gs://'):
+        bucket_name, _, prefix = url[len('gs://'):].partition('/')
+        if not bucket_name:
+            raise ValueError(f"Invalid claim-check bucket URL {url!r}")
+        if prefix and not prefix.endswith('/'):
+            prefix += '/'
+        return GCSStore(bucket_name, prefix)
+    if url.startswith('file://'):
+        url = url[len('file://'):]
+    return FilesystemStore(url)
+
+
+class ClaimCheck:
+    """Replaces large message data with a reference to a stored copy."""
+
+    def __init__(self, store, threshold: int = 256 * 1024, remember: int = 1024):
+        self.store = store
+        self.threshold = threshold
+        self.remember = remember
+        self._stored = collections.OrderedDict()  # Digests known to be in the store
+        self._lock = threading.Lock()
+
+    def offload(self, data: bytes,
+                attributes: Mapping[str, str]) -> Tuple[bytes, Dict[str, str]]:
+        """
+        Store data and return the reference message data and attributes.
+        Raises whatever the store raises if the write fails.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        key = f'{digest[:2]}/{digest}'
+        with self._lock:
+            known = digest in self._stored
+        if not known:
+            self.store.put_if_absent(key, data)
+            with self._lock:
+                self._stored[digest] = None
+                if len(self._stored) > self.remember:
+                    self._stored.popitem(last=False)
+        reference = json.dumps({'store': self.store.uri, 'key': key, 'sha256': digest,
+                                'size': len(data)}, separators=(',', ':')).encode('utf-8')
+        return reference, {**attributes, CLAIM_CHECK_ATTRIBUTE: digest}
+
+
+class ClaimCheckResolver:
+    """Subscriber-side: swaps reference messages for their stored bodies."""
+
+    def __init__(self, store, cache_bytes: int = 64 * 1024 * 1024):
+        self.store = store
+        self.cache_bytes = cache_bytes
+        self.hits = 0
+        self.misses = 0
+        self._cache = collections.OrderedDict()  # digest -> body, least recent first
+        self._cached_bytes = 0
+        self._lock = threading.Lock()
+
+    def resolve(self, data: bytes, attributes: Optional[Mapping[str, str]] = None
+                ) -> Tuple[bytes, Dict[str, str]]:
+        """
+        Return the message's body and attributes without the claim-check
+        marker; other messages come back as they are. Raises KeyError for
+        a missing body and ValueError for one that fails verification.
+        """
+        attributes = dict(attributes or {})
+        digest = attributes.pop(CLAIM_CHECK_ATTRIBUTE, None)
+        if digest is None:
+            return data, attributes
+        with self._lock:
+            body = self._cache.get(digest)
+            if body is not None:
+                self._cache.move_to_end(digest)
+                self.hits += 1
+                return body, attributes
+            self.misses += 1
+        reference = json.loads(data)
+        if reference.get('sha256') != digest:
+            raise ValueError(f"Claim-check reference does not match attribute {digest}")
+        body = self.store.get(reference['key'])
+        if hashlib.sha256(body).hexdigest() != digest:
+            raise ValueError(f"Claim-check body {reference['key']} failed verification")
+        self._remember(digest, body)
+        return body, attributes
+
+    def _remember(self, digest: str, body: bytes) -> None:
+        if len(body) > self.cache_bytes:
+            return
+        with self._lock:
+            if digest in self._cache:
+                return
+            self._cache[digest] = body
+            self._cached_bytes += len(body)
+            while self._cached_bytes > self.cache_bytes:
+                _, evicted = self._cache.popitem(last=False)
+                self._cached_bytes -= len(evicted)
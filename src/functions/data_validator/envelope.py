@@ -0,0 +1,191 @@
+"""
+Packing of many events into one Pub/Sub message.
+
+Pub/Sub bills and throttles per message as well as per byte, which
+dominates for small events. An envelope holds several events' data:
+
+    magic        4 bytes, b'EVP1'
+    count        4-byte big-endian number of events
+    offsets      count 4-byte big-endian end offsets, relative to the body
+    body         the events' data, back to back
+
+Envelope messages carry an ``envelope`` attribute (the format version)
+and ``event_count``; all other attributes are shared by every event in
+it. unpack yields memoryview slices over the message data, so events are
+not copied; orjson.loads and gzip.decompress take them directly, while
+json.loads needs bytes(event). EnvelopePacker gathers events published to the same topic
+with the same attributes and sends them as one envelope when it has
+max_events events, would exceed max_bytes, or max_latency has passed.
+"""
+import struct
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, Iterator, List, Mapping, Optional, Tuple
+
+MAGIC = b'EVP1'
+ENVELOPE_ATTRIBUTE = 'envelope'
+VERSION = '1'
+_COUNT = struct.Struct('>4sI')
+_OFFSET_SIZE = 4
+
+
+def pack(events: List[bytes]) -> bytes:
+    """Pack event data into an envelope."""
+    offsets = []
+    end = 0
+    for data in events:
+        end += len(data)
+        offsets.append(end)
+    return b''.join([_COUNT.pack(MAGIC, len(events)),
+                     struct.pack(f'>{len(offsets)}I', *offsets), *events])
+
+
+def envelope_size(count: int, body_bytes: int) -> int:
+    """Size of an envelope holding count events of body_bytes in total."""
+    return _COUNT.size + _OFFSET_SIZE * count + body_bytes
+
+
+def is_envelope(attributes: Optional[Mapping[str, str]]) -> bool:
+    """True if a message with these attributes is an envelope."""
+    return bool(attributes) and ENVELOPE_ATTRIBUTE in attributes
+
+
+def unpack(data) -> Iterator[memoryview]:
+    """
+    Yield each event's data as a memoryview into data. Raises ValueError
+    if data is not a well-formed envelope.
+    """
+    view = memoryview(data)
+    if len(view) < _COUNT.size:
+        raise ValueError("Envelope is truncated")
+    magic, count = _COUNT.unpack_from(view)
+    if magic != MAGIC:
+        raise ValueError(f"Not an envelope: magic {bytes(magic)!r}")
+    start = _COUNT.size + _OFFSET_SIZE * count
+    if start > len(view):
+        raise ValueError("Envelope is truncated")
+    offsets = struct.unpack_from(f'>{count}I', view, _COUNT.size)
+    previous = 0
+    for end in offsets:
+        if end < previous or start + end > len(view):
+            raise ValueError("Envelope offsets are corrupt")
+        yield view[start + previous:start + end]
+        previous = end
+
+
+class _Batch:
+    __slots__ = ('events', 'futures', 'body_bytes', 'deadline')
+
+    def __init__(self, deadline: float):
+        self.events: List[bytes] = []
+        self.futures: List[Future] = []
+        self.body_bytes = 0
+        self.deadline = deadline
+
+
+class EnvelopePacker:
+    """Gathers events into envelopes and publishes them."""
+
+    def __init__(self, publish: Callable[..., Future], max_events: int = 100,
+                 max_bytes: int = 256 * 1024, max_latency: float = 0.01):
+        self.publish = publish  # publish(topic, data, **attributes) -> future
+        self.max_events = max_events
+        self.max_bytes = max_bytes
+        self.max_latency = max_latency
+        self.envelopes_sent = 0
+        self.events_sent = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._batches: Dict[Tuple[str, Tuple[Tuple[str, str], ...], str], _Batch] = {}
+        self._thread = None
+
+    def add(self, topic: str, data: bytes, attributes: Mapping[str, str],
+            ordering_key: str = '') -> Future:
+        """
+        Queue one event's data. The returned future resolves to the
+        envelope's message ID, or fails with its publish error. Events
+        with different ordering keys never share an envelope.
+        """
+        future = Future()
+        if envelope_size(1, len(data)) > self.max_bytes:
+            # Too big to share an envelope; send it on its own as is
+            self._chain(self._publish(topic, data, attributes, ordering_key), [future])
+            return future
+        key = (topic, tuple(sorted(attributes.items())), ordering_key)
+        full = []
+        with self._lock:
+            batch = self._batches.get(key)
+            if batch is not None and envelope_size(len(batch.events) + 1,
+                                                   batch.body_bytes + len(data)) > self.max_bytes:
+                full.append(self._batches.pop(key))
+                batch = None
+            if batch is None:
+                batch = self._batches[key] = _Batch(time.monotonic() + self.max_latency)
+                self._start()
+                self._wakeup.notify()
+            batch.events.append(data)
+            batch.futures.append(future)
+            batch.body_bytes += len(data)
+            if len(batch.events) >= self.max_events:
+                full.append(self._batches.pop(key))
+        for batch in full:
+            self._send(key, batch)
+        return future
+
+    def flush(self) -> None:
+        """Send every pending envelope now."""
+        with self._lock:
+            batches, self._batches = self._batches, {}
+        for key, batch in batches.items():
+            self._send(key, batch)
+
+    def _start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='envelope-packer', daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            due = []
+            with self._lock:
+                now = time.monotonic()
+                for key, batch in list(self._batches.items()):
+                    if batch.deadline <= now:
+                        due.append((key, self._batches.pop(key)))
+                if not due:
+                    deadlines = [batch.deadline for batch in self._batches.values()]
+                    self._wakeup.wait(min(deadlines) - now if deadlines else None)
+            for key, batch in due:
+                self._send(key, batch)
+
+    def _send(self, key, batch: _Batch) -> None:
+        topic, attributes, ordering_key = key
+        attributes = dict(attributes, **{ENVELOPE_ATTRIBUTE: VERSION,
+                                         'event_count': str(len(batch.events))})
+        try:
+            future = self._publish(topic, pack(batch.events), attributes, ordering_key)
+        except Exception as e:
+            for waiting in batch.futures:
+                waiting.set_exception(e)
+            return
+        self.envelopes_sent += 1
+        self.events_sent += len(batch.events)
+        self._chain(future, batch.futures)
+
+    def _publish(self, topic, data, attributes, ordering_key) -> Future:
+        if ordering_key:
+            return self.publish(topic, data, ordering_key=ordering_key, **attributes)
+        return self.publish(topic, data, **attributes)
+
+    @staticmethod
+    def _chain(future: Future, waiting: List[Future]) -> None:
+        """Settle every waiting future with the publish future's outcome."""
+        def done(published):
+            error = published.exception()
+            for each in waiting:
+                if error is not None:
+                    each.set_exception(error)
+                else:
+                    each.set_result(published.result())
+        future.add_done_callback(done)
@@ -0,0 +1,70 @@
+"""
+The event schema and the error bodies for its failures.
+
+Shared by the data_validator function and the frontend's embedded
+validator so both accept the same events and answer with the same
+errors; keep the copies in sync.
+"""
+# Protobuf field numbers follow the order of 'properties': only ever add
+# properties at the end.
+EMAIL_PATTERN = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
+EVENT_SCHEMA = {
+    'type': 'object',
+    'required': ['name', 'age', 'email'],
+    'properties': {
+        'name': {'type': 'string', 'pattern': r'\S'},
+        'email': {'type': 'string', 'pattern': EMAIL_PATTERN},
+        'age': {'type': 'integer', 'exclusiveMinimum': 0},
+        'address': {
+            'type': 'object',
+            'properties': {
+                'street': {'type': 'string', 'minLength': 1},
+                'city': {'type': 'string', 'minLength': 1},
+                'state': {'type': 'string', 'minLength': 1},
+                'zip': {'type': 'string', 'pattern': r'^\d{5}(-\d{4})?$'}
+            }
+        },
+        # Optional; published as message attributes and used for routing
+        'event_type': {'type': 'string', 'pattern': r'^[A-Za-z0-9_.:-]{1,128}$'},
+        'priority': {'type': 'string', 'pattern': r'^[A-Za-z0-9_-]{1,32}$'}
+    }
+}
+
+# Error bodies keyed by (field, schema keyword)
+FIELD_ERRORS = {
+    ('', 'type'): {
+        'error': 'Invalid data format',
+        'code': 'INVALID_FORMAT',
+        'message': 'Expected a JSON object'
+    },
+    ('name', 'type'): {
+        'error': 'Invalid name',
+        'code': 'INVALID_NAME',
+        'message': 'Name must be a non-empty string'
+    },
+    ('name', 'pattern'): {
+        'error': 'Invalid name',
+        'code': 'INVALID_NAME',
+        'message': 'Name must be a non-empty string'
+    },
+    ('email', 'type'): {
+        'error': 'Invalid email',
+        'code': 'INVALID_EMAIL',
+        'message': 'Email must be a valid email address (e.g., user@example.com)'
+    },
+    ('email', 'pattern'): {
+        'error': 'Invalid email',
+        'code': 'INVALID_EMAIL',
+        'message': 'Email must be a valid email address (e.g., user@example.com)'
+    },
+    ('age', 'type'): {
+        'error': 'Invalid age type',
+        'code': 'INVALID_AGE_TYPE',
+        'message': 'Age must be an integer'
+    },
+    ('age', 'exclusiveMinimum'): {
+        'error': 'Invalid age value',
+        'code': 'INVALID_AGE_VALUE',
+        'message': 'Age must be a positive integer'
+    }
+}
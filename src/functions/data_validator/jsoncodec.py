@@ -0,0 +1,58 @@
+"""
+JSON codec used for request bodies, Pub/Sub payloads and responses.
+
+orjson is used when it is installed and the standard library otherwise;
+set JSON_CODEC to 'orjson' or 'json' to choose explicitly. Both codecs
+produce compact UTF-8 bytes, so a payload encoded once can be published
+and spliced into a response as is.
+"""
+import json
+import os
+
+
+class StdlibCodec:
+    """Codec on the standard library json module."""
+    name = 'json'
+
+    def __init__(self):
+        self._encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+        self._decode = json.loads
+
+    def loads(self, data):
+        """Decode bytes or str; raises ValueError for malformed JSON."""
+        return self._decode(data)
+
+    def dumps(self, obj) -> bytes:
+        """Encode to compact UTF-8 JSON bytes."""
+        return self._encoder.encode(obj).encode('utf-8')
+
+
+class OrjsonCodec:
+    """Codec on orjson, several times faster than the standard library."""
+    name = 'orjson'
+
+    def __init__(self):
+        import orjson
+        self.loads = orjson.loads  # orjson.JSONDecodeError is a ValueError
+        self.dumps = orjson.dumps
+
+
+CODECS = {
+    'json': StdlibCodec,
+    'orjson': OrjsonCodec,
+}
+
+
+def get_codec(name=None):
+    """Return the named codec, or the fastest one installed if name is empty."""
+    if name:
+        if name not in CODECS:
+            raise ValueError(f"Unknown JSON_CODEC {name!r}; expected one of {sorted(CODECS)}")
+        return CODECS[name]()
+    try:
+        return OrjsonCodec()
+    except ImportError:
+        return StdlibCodec()
+
+
+codec = get_codec(os.getenv('JSON_CODEC'))
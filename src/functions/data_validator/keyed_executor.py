@@ -0,0 +1,97 @@
+"""
+Keyed concurrent executor for subscribers.
+
+Messages with an ordering key must be handled one at a time and in the
+order they arrive, but messages with different keys can be handled in
+parallel. KeyedExecutor runs tasks on a thread pool with that guarantee:
+tasks for one key run sequentially in submission order, and each key's
+queue is handed back to the pool after every task so that a busy key
+cannot hold a worker while others wait. Tasks without a key run as soon
+as a worker is free.
+
+A failing task fails its own future only; later tasks for the key still
+run, so callers that need stop-on-failure (e.g. nack the rest of a key's
+messages) should check earlier futures themselves.
+"""
+import collections
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+
+class KeyedExecutor:
+    """Thread pool that serializes tasks sharing a key."""
+
+    def __init__(self, max_workers: int = 8, thread_name_prefix: str = 'keyed'):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers,
+                                        thread_name_prefix=thread_name_prefix)
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        # Keys with a task queued or running, and their waiting tasks
+        self._queues: Dict[str, Deque[Tuple[Future, Callable, tuple, dict]]] = {}
+
+    def submit(self, key: Optional[str], fn: Callable[..., Any], *args, **kwargs) -> Future:
+        """Schedule fn(*args, **kwargs) after every earlier task with the same key."""
+        future = Future()
+        task = (future, fn, args, kwargs)
+        if not key:
+            self._pool.submit(self._run, task)
+            return future
+        with self._lock:
+            queue = self._queues.get(key)
+            if queue is not None:
+                queue.append(task)
+                return future
+            self._queues[key] = collections.deque([task])
+        self._pool.submit(self._run_next, key)
+        return future
+
+    def pending(self) -> int:
+        """Number of keys with tasks queued or running."""
+        with self._lock:
+            return len(self._queues)
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        Stop the pool. With wait, block until every queued task has run;
+        without, tasks still queued behind their key are cancelled.
+        """
+        if wait:
+            with self._lock:
+                while self._queues:
+                    self._idle.wait()
+        self._pool.shutdown(wait=wait)
+
+    def _run_next(self, key: str) -> None:
+        with self._lock:
+            task = self._queues[key][0]
+        self._run(task)
+        with self._lock:
+            queue = self._queues[key]
+            queue.popleft()
+            if not queue:
+                del self._queues[key]
+                if not self._queues:
+                    self._idle.notify_all()
+                return
+        try:
+            self._pool.submit(self._run_next, key)
+        except RuntimeError:  # Shut down without waiting
+            with self._lock:
+                queue = self._queues.pop(key)
+                if not self._queues:
+                    self._idle.notify_all()
+            for future, _, _, _ in queue:
+                future.cancel()
+
+    @staticmethod
+    def _run(task) -> None:
+        future, fn, args, kwargs = task
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
@@ -1,107 +1,479 @@
-import json
+import functools
 import functions_framework
-from google.cloud import pubsub_v1
+import itertools
 import logging
+import math
 import os
 import re
+import time
+from typing import Any, NamedTuple
+
+from claim_check import ClaimCheck, open_store
+from envelope import EnvelopePacker
+from event_schema import EMAIL_PATTERN, EVENT_SCHEMA, FIELD_ERRORS
+from jsoncodec import codec
+from metrics import metrics
+from ordering import SpilledKeys, ordering_key_extractor
+from overload import AIMDLimiter, CircuitBreaker
+from payload_encoding import PayloadEncoder
+from prescan import scan
+from publisher_config import LazyClient, create_publisher, open_channel
+from routing import RoutingTable, parse_routes
+from schema import compile_schema
+from spill import SpillDrainer, SpillLog
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize Pub/Sub client
-publisher = pubsub_v1.PublisherClient()
+# Events with the same ordering key (e.g. ORDERING_KEY=email, or event_id:-
+# for the part of event_id before the first '-') are delivered in order
+ORDERING_KEY = os.getenv('ORDERING_KEY', '')
+ordering_key_for = ordering_key_extractor(ORDERING_KEY) if ORDERING_KEY else None
+# Ordering keys with events waiting in the spill log; later events follow them there
+spilled_keys = SpilledKeys()
+
+# Pub/Sub client, created on first use to keep it out of cold-start import time
+publisher = LazyClient(functools.partial(create_publisher,
+                                         enable_message_ordering=bool(ORDERING_KEY)))
 project_id = 'servless-pipeline'  # Hardcoding the project ID since we know it
-topic_path = publisher.topic_path(project_id, 'events-topic')
+WARMUP_TIMEOUT = float(os.getenv('WARMUP_TIMEOUT_SECONDS', '10'))
+
+# Topic and message attributes for each event, keyed by event_type and priority
+SCHEMA_VERSION = os.getenv('SCHEMA_VERSION', '1')
+routes = RoutingTable(
+    project_id, 'events-topic', parse_routes(os.getenv('TOPIC_ROUTES', '')),
+    schema_version=SCHEMA_VERSION,
+    default_event_type=os.getenv('DEFAULT_EVENT_TYPE', 'user')
+)
+
+# Local spill queue for events that fail to publish; off unless SPILL_DIR is set
+SPILL_DIR = os.getenv('SPILL_DIR', '')
+SPILL_SEGMENT_BYTES = int(os.getenv('SPILL_SEGMENT_BYTES', str(16 * 1024 * 1024)))
+SPILL_MAX_BYTES = int(os.getenv('SPILL_MAX_BYTES', str(64 * 1024 * 1024)))
+SPILL_FSYNC = os.getenv('SPILL_FSYNC', 'false').lower() == 'true'
+SPILL_MAX_BACKOFF = float(os.getenv('SPILL_MAX_BACKOFF_SECONDS', '60'))
+
+def create_spill():
+    """Open the spill log and start replaying it to the events' topics."""
+    log = SpillLog(SPILL_DIR, segment_bytes=SPILL_SEGMENT_BYTES,
+                   max_bytes=SPILL_MAX_BYTES, fsync=SPILL_FSYNC,
+                   on_commit=spilled_keys.committed)
+    if ordering_key_for:
+        # Events left by an earlier instance still hold back their keys
+        for record in log.pending():
+            spilled_keys.add(ordering_key_for(codec.loads(record.data)), record.position)
+    SpillDrainer(log, republish, max_backoff=SPILL_MAX_BACKOFF).start()
+    return log
+
+spill = LazyClient(create_spill) if SPILL_DIR else None
+
+# Overload protection around publishing: a circuit breaker on Pub/Sub
+# health and an adaptive limit on publishes waiting at once
+PUBLISH_TIMEOUT = float(os.getenv('PUBLISH_TIMEOUT_SECONDS', '10'))
+publish_breaker = CircuitBreaker(
+    failure_rate=float(os.getenv('BREAKER_FAILURE_RATE', '0.5')),
+    slow_rate=float(os.getenv('BREAKER_SLOW_RATE', '0.5')),
+    slow_call_seconds=float(os.getenv('BREAKER_SLOW_CALL_SECONDS', '2')),
+    open_seconds=float(os.getenv('BREAKER_OPEN_SECONDS', '10'))
+)
+publish_limiter = AIMDLimiter(
+    initial_limit=int(os.getenv('CONCURRENCY_INITIAL_LIMIT', '20')),
+    max_limit=int(os.getenv('CONCURRENCY_MAX_LIMIT', '200')),
+    latency_target=float(os.getenv('CONCURRENCY_LATENCY_TARGET_SECONDS', '1'))
+)
+LOAD_SHED_RETRY_AFTER = int(os.getenv('LOAD_SHED_RETRY_AFTER_SECONDS', '1'))
+
+# Event schema (event_schema.py), compiled once at import
+validate_event = compile_schema(EVENT_SCHEMA)
+
+# How published payloads are encoded: JSON or protobuf, compressed when
+# at least PAYLOAD_COMPRESS_MIN_BYTES long
+payload_encoder = PayloadEncoder(
+    content_type=os.getenv('PAYLOAD_CONTENT_TYPE', 'json'),
+    compression=os.getenv('PAYLOAD_COMPRESSION', 'identity'),
+    min_bytes=int(os.getenv('PAYLOAD_COMPRESS_MIN_BYTES', '1024')),
+    schema=EVENT_SCHEMA
+)
+
+# Message data of at least CLAIM_CHECK_MIN_BYTES is written to this bucket
+# (gs://bucket/prefix, or a local directory) and published as a reference;
+# off unless CLAIM_CHECK_URL is set
+CLAIM_CHECK_URL = os.getenv('CLAIM_CHECK_URL', '')
+claim_check = ClaimCheck(
+    open_store(CLAIM_CHECK_URL),
+    threshold=int(os.getenv('CLAIM_CHECK_MIN_BYTES', str(256 * 1024)))
+) if CLAIM_CHECK_URL else None
+
+# Pack up to PACK_MAX_EVENTS events bound for the same topic, with the same
+# attributes, into one envelope message; off unless PACK_MAX_EVENTS is set
+PACK_MAX_EVENTS = int(os.getenv('PACK_MAX_EVENTS', '0'))
+packer = EnvelopePacker(
+    lambda topic, data, **options: publish_message(topic, data, **options),
+    max_events=PACK_MAX_EVENTS,
+    max_bytes=int(os.getenv('PACK_MAX_BYTES', str(256 * 1024))),
+    max_latency=float(os.getenv('PACK_MAX_LATENCY_SECONDS', '0.01'))
+) if PACK_MAX_EVENTS > 1 else None
+_email_match = re.compile(EMAIL_PATTERN).match
+
+# Guards applied to the raw body before it is decoded
+MAX_BODY_BYTES = int(os.getenv('MAX_BODY_BYTES', str(1024 * 1024)))
+MAX_JSON_DEPTH = int(os.getenv('MAX_JSON_DEPTH', '20'))
+MAX_JSON_KEYS = int(os.getenv('MAX_JSON_KEYS', '1000'))
+# Events per request on the /batch path
+MAX_BATCH_EVENTS = int(os.getenv('MAX_BATCH_EVENTS', '100'))
+
+# 'full' echoes the published event back; 'minimal' returns only the
+# status and message ID. Clients can ask for either with a Prefer header.
+RESPONSE_MODE = os.getenv('RESPONSE_MODE', 'full')
+
+def encode_response(body, status):
+    """Encode a response body with the JSON codec."""
+    return (codec.dumps(body).decode('utf-8'), status)
+
+def response_template(body, field):
+    """
+    Encode a response body once, leaving out one dynamic field.
+    The returned function takes the field's already-encoded value.
+    """
+    prefix = codec.dumps(body)[:-1] + b',' + codec.dumps(field) + b':'
+
+    def fill(encoded_value):
+        return (prefix + encoded_value + b'}').decode('utf-8')
+    return fill
+
+# Response bodies encoded once at import
+FIELD_ERROR_BODIES = {key: codec.dumps(body).decode('utf-8') for key, body in FIELD_ERRORS.items()}
+MISSING_FIELDS_BODIES = {
+    fields: codec.dumps({
+        'error': 'Missing required fields',
+        'code': 'MISSING_FIELDS',
+        'message': f'Required fields missing: {", ".join(fields)}',
+        'missing_fields': list(fields)
+    }).decode('utf-8')
+    # Every ordered subset of the required fields
+    for count in range(1, len(EVENT_SCHEMA['required']) + 1)
+    for fields in itertools.combinations(EVENT_SCHEMA['required'], count)
+}
+INVALID_JSON_BODY = codec.dumps({
+    'error': 'Invalid JSON payload',
+    'code': 'INVALID_JSON',
+    'message': 'The request body must be a valid JSON object'
+}).decode('utf-8')
+PAYLOAD_TOO_LARGE_BODY = codec.dumps({
+    'error': 'Payload too large',
+    'code': 'PAYLOAD_TOO_LARGE',
+    'message': f'The request body must be at most {MAX_BODY_BYTES} bytes'
+}).decode('utf-8')
+INVALID_CONTENT_LENGTH_BODY = codec.dumps({
+    'error': 'Invalid Content-Length',
+    'code': 'INVALID_CONTENT_LENGTH',
+    'message': 'The Content-Length header must be a non-negative integer'
+}).decode('utf-8')
+# Bodies for pre-parse rejections, keyed by prescan reason
+REJECTION_BODIES = {
+    'depth': codec.dumps({
+        'error': 'Payload too deeply nested',
+        'code': 'PAYLOAD_TOO_DEEP',
+        'message': f'JSON nesting must be at most {MAX_JSON_DEPTH} levels deep'
+    }).decode('utf-8'),
+    'keys': codec.dumps({
+        'error': 'Too many keys',
+        'code': 'TOO_MANY_KEYS',
+        'message': f'The request body may have at most {MAX_JSON_KEYS} object keys'
+    }).decode('utf-8'),
+}
+INVALID_BATCH_BODY = codec.dumps({
+    'error': 'Invalid batch',
+    'code': 'INVALID_BATCH',
+    'message': f'A batch must be a JSON array of at most {MAX_BATCH_EVENTS} events'
+}).decode('utf-8')
+QUEUED_BODY = codec.dumps({
+    'message': 'Data validated and queued for publishing',
+    'code': 'QUEUED'
+}).decode('utf-8')
+OVERLOADED_BODY = codec.dumps({
+    'error': 'Service overloaded',
+    'code': 'OVERLOADED',
+    'message': 'Too many requests are waiting on the queue; retry later'
+}).decode('utf-8')
+QUEUE_UNAVAILABLE_BODY = codec.dumps({
+    'error': 'Queue unavailable',
+    'code': 'QUEUE_UNAVAILABLE',
+    'message': 'Publishing is paused after repeated failures; retry later'
+}).decode('utf-8')
+PUBLISH_ERROR_BODY = codec.dumps({
+    'error': 'Publishing failed',
+    'code': 'PUBLISH_ERROR',
+    'message': 'Failed to publish data to the queue'
+}).decode('utf-8')
+invalid_field_body = response_template({
+    'error': 'Invalid field',
+    'code': 'INVALID_FIELD'
+}, 'message')
+server_error_body = response_template({'error': 'Server error', 'code': 'SERVER_ERROR'}, 'message')
+success_body = response_template({
+    'message': 'Data validated and published successfully',
+    'code': 'SUCCESS'
+}, 'data')
+minimal_success_body = response_template({'code': 'SUCCESS'}, 'message_id')
+
+def wants_minimal(request):
+    """Return True if the response should leave out the echoed event."""
+    prefer = request.headers.get('Prefer', '')
+    if 'return=minimal' in prefer:
+        return True
+    if 'return=representation' in prefer:
+        return False
+    return RESPONSE_MODE == 'minimal'
+
+def read_body(request):
+    """
+    Read the request body, rejecting a malformed Content-Length or a body
+    over MAX_BODY_BYTES. A too-large Content-Length is rejected without
+    reading the body. Returns (body, None), or (None, error response).
+    """
+    try:
+        content_length = int(request.headers.get('Content-Length') or 0)
+    except ValueError:
+        content_length = -1
+    if content_length < 0:
+        return None, (INVALID_CONTENT_LENGTH_BODY, 400)
+    if content_length > MAX_BODY_BYTES:
+        return None, (PAYLOAD_TOO_LARGE_BODY, 413)
+    body = request.get_data()
+    if len(body) > MAX_BODY_BYTES:
+        return None, (PAYLOAD_TOO_LARGE_BODY, 413)
+    return body, None
+
+def read_json(request, batch=False):
+    """
+    Read the request body and decode it with the JSON codec.
+    Oversized, too deeply nested, key-heavy and incomplete bodies, and
+    malformed Content-Length headers, are rejected before decoding. A batch
+    body is a list of events, each held to the per-event limits. Returns
+    (request_json, None), or (None, error response) if the body is
+    rejected, empty or malformed.
+    """
+    body, error = read_body(request)
+    if error is not None:
+        return None, error
+    if batch:
+        rejection = scan(body, (), MAX_JSON_DEPTH + 1, MAX_JSON_KEYS * MAX_BATCH_EVENTS)
+    else:
+        rejection = scan(body, EVENT_SCHEMA['required'], MAX_JSON_DEPTH, MAX_JSON_KEYS)
+    if rejection is not None:
+        if rejection.reason == 'missing':
+            return None, (MISSING_FIELDS_BODIES[rejection.missing], 400)
+        return None, (REJECTION_BODIES[rejection.reason], 400)
+    try:
+        request_json = codec.loads(body) if body else None
+    except ValueError:
+        request_json = None
+    if not request_json:
+        return None, (INVALID_JSON_BODY, 400)
+    return request_json, None
 
 def validate_email(email):
     """Validate email format using regex."""
-    email_regex = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-    return bool(re.match(email_regex, email))
+    return bool(_email_match(email))
 
-def validate_data(request_json):
+def validate_data(request_json, minimal=False):
     """Core validation logic, separated for testing."""
-    # Basic validation
-    if not isinstance(request_json, dict):
-        return (json.dumps({
-            'error': 'Invalid data format',
-            'code': 'INVALID_FORMAT',
-            'message': 'Expected a JSON object'
-        }), 400)
-    # Check required fields
-    required_fields = ['name', 'age', 'email']
-    missing_fields = [field for field in required_fields if field not in request_json]
-    if missing_fields:
-        return (json.dumps({
-            'error': 'Missing required fields',
-            'code': 'MISSING_FIELDS',
-            'message': f'Required fields missing: {", ".join(missing_fields)}',
-            'missing_fields': missing_fields
-        }), 400)
-    # Validate name
-    if not isinstance(request_json['name'], str) or len(request_json['name'].strip()) == 0:
-        return (json.dumps({
-            'error': 'Invalid name',
-            'code': 'INVALID_NAME',
-            'message': 'Name must be a non-empty string'
-        }), 400)
-    # Validate email format
-    if not isinstance(request_json['email'], str) or not validate_email(request_json['email']):
-        return (json.dumps({
-            'error': 'Invalid email',
-            'code': 'INVALID_EMAIL',
-            'message': 'Email must be a valid email address (e.g., user@example.com)'
-        }), 400)
-    # Validate age
-    if not isinstance(request_json['age'], int):
-        return (json.dumps({
-            'error': 'Invalid age type',
-            'code': 'INVALID_AGE_TYPE',
-            'message': 'Age must be an integer'
-        }), 400)
-    if request_json['age'] <= 0:
-        return (json.dumps({
-            'error': 'Invalid age value',
-            'code': 'INVALID_AGE_VALUE',
-            'message': 'Age must be a positive integer'
-        }), 400)
+    return finish_validation(begin_validation(request_json), minimal)
+
+class PendingPublish(NamedTuple):
+    """A valid event whose publish has been started."""
+    payload: bytes
+    ordering_key: str
+    future: Any  # None if the publish failed to start
+    started: float
+    limited: bool  # Holds a concurrency limiter slot of its own
+
+def begin_validation(request_json, admitted=None):
+    """
+    Validate an event and start publishing it. Returns a response if the
+    event is settled without a publish (rejected, shed or spilled), and a
+    PendingPublish otherwise. admitted is the limiter's answer for a whole
+    batch; a single event (None) takes a limiter slot of its own.
+    """
+    errors = validate_event(request_json)
+    if errors:
+        # Check required fields
+        missing = {e.field for e in errors if e.keyword == 'required'}
+        if missing:
+            missing_fields = tuple(f for f in EVENT_SCHEMA['required'] if f in missing)
+            return (MISSING_FIELDS_BODIES[missing_fields], 400)
+        error = errors[0]
+        body = FIELD_ERROR_BODIES.get((error.field, error.keyword))
+        if body is None:
+            body = invalid_field_body(codec.dumps(error.message))
+        return (body, 400)
+
+    # Encode once; the same bytes are published and echoed back
+    payload = codec.dumps(request_json)
+    ordering_key = ordering_key_for(request_json) if ordering_key_for else ''
+    if ordering_key and ordering_key in spilled_keys:
+        # Publishing now would overtake this key's spilled events
+        return spill_event(payload, ordering_key)
+
+    # Shed load at once rather than queue behind a slow or failing publisher
+    limited = admitted is None
+    if not (publish_limiter.try_acquire() if limited else admitted):
+        return (OVERLOADED_BODY, 503, {'Retry-After': str(LOAD_SHED_RETRY_AFTER)})
+    if not publish_breaker.allow():
+        if limited:
+            publish_limiter.release()
+        return spill_or_reject(payload, ordering_key)
+
     # Publish to Pub/Sub
+    started = time.monotonic()
     try:
-        future = publisher.publish(
-            topic_path,
-            json.dumps(request_json).encode('utf-8')
-        )
-        future.result()  # Wait for the publish to complete
-        return (json.dumps({
-            'message': 'Data validated and published successfully',
-            'code': 'SUCCESS',
-            'data': request_json
-        }), 200)
+        future = publish_event(payload, request_json, ordering_key)
     except Exception as e:
         logger.error(f"Error publishing to Pub/Sub: {str(e)}")
-        return (json.dumps({
-            'error': 'Publishing failed',
-            'code': 'PUBLISH_ERROR',
-            'message': 'Failed to publish data to the queue'
-        }), 500)
+        future = None
+    return PendingPublish(payload, ordering_key, future, started, limited)
+
+def finish_validation(pending, minimal=False):
+    """Wait for a publish started by begin_validation and return the response."""
+    if not isinstance(pending, PendingPublish):
+        return pending
+    published = False
+    if pending.future is not None:
+        try:
+            # Wait for the publish to complete, at most PUBLISH_TIMEOUT after it started
+            remaining = PUBLISH_TIMEOUT - (time.monotonic() - pending.started)
+            message_id = pending.future.result(timeout=max(remaining, 0))
+            published = True
+        except Exception as e:
+            logger.error(f"Error publishing to Pub/Sub: {str(e)}")
+    seconds = time.monotonic() - pending.started
+    if pending.limited:
+        publish_limiter.release(seconds, published)
+    publish_breaker.record(published, seconds)
+
+    if not published:
+        return spill_event(pending.payload, pending.ordering_key)
+    if minimal:
+        return (minimal_success_body(codec.dumps(message_id)), 200)
+    return (success_body(pending.payload), 200)
+
+def validate_batch(events, minimal=False):
+    """
+    Validate and publish a batch of events, as validate_data does for each.
+    Every publish is started before any is waited for, so a batch takes
+    about as long as one event. The batch is one request waiting on
+    Pub/Sub, so it takes one concurrency limiter slot for all its events.
+    """
+    if not isinstance(events, list) or len(events) > MAX_BATCH_EVENTS:
+        return (INVALID_BATCH_BODY, 400)
+    metrics.increment('batches')
+    metrics.increment('batch_events', len(events))
+    admitted = publish_limiter.try_acquire()
+    started = time.monotonic()
+    pending = [begin_validation(event, admitted) for event in events]
+    responses = [finish_validation(each, minimal) for each in pending]
+    if admitted:
+        published = all(response[1] == 200 for each, response in zip(pending, responses)
+                        if isinstance(each, PendingPublish))
+        publish_limiter.release(time.monotonic() - started, published)
+    results = []
+    for response in responses:
+        body, status = response[0], response[1]
+        result = b'{"status":' + codec.dumps(status)
+        if len(response) > 2:
+            result += b',"headers":' + codec.dumps(response[2])
+        results.append(result + b',"body":' + body.encode('utf-8') + b'}')
+    return ((b'{"results":[' + b','.join(results) + b']}').decode('utf-8'), 200)
+
+def publish_event(payload, event, ordering_key=''):
+    """Publish an event, given as JSON bytes and decoded, to its route's topic."""
+    route = routes.route_event(event)
+    data, encoding = payload_encoder.encode(payload, event)
+    attributes = route.attributes if encoding is None else {**route.attributes, **encoding}
+    if claim_check is not None and len(data) >= claim_check.threshold:
+        data, attributes = claim_check.offload(data, attributes)
+        metrics.increment('claim_checks')
+    if packer is not None:
+        return packer.add(route.topic_path, data, attributes, ordering_key)
+    return publish_message(route.topic_path, data, ordering_key, **attributes)
+
+def publish_message(topic, data, ordering_key='', **attributes):
+    """
+    Publish one message. A failed publish pauses its ordering key in the
+    client, so the key is resumed for the events that come after it.
+    """
+    if not ordering_key:
+        return publisher.publish(topic, data, **attributes)
+    try:
+        future = publisher.publish(topic, data, ordering_key=ordering_key, **attributes)
+    except Exception:
+        publisher.resume_publish(topic, ordering_key)
+        raise
+
+    def resume_on_failure(future):
+        if future.cancelled() or future.exception() is not None:
+            publisher.resume_publish(topic, ordering_key)
+    future.add_done_callback(resume_on_failure)
+    return future
+
+def republish(payload):
+    """Publish a spilled event, routing and encoding it again from its JSON."""
+    event = codec.loads(payload)
+    ordering_key = ordering_key_for(event) if ordering_key_for else ''
+    # The key is released once the spill log commits past its last event
+    return publish_event(payload, event, ordering_key)
+
+def spill_event(payload, ordering_key=''):
+    """Keep an unpublished event locally; it is published again once Pub/Sub recovers."""
+    if spill is not None:
+        try:
+            position = spill.append(payload)
+            spilled_keys.add(ordering_key, position)
+            return (QUEUED_BODY, 202)
+        except Exception as e:
+            logger.error(f"Error spilling event: {str(e)}")
+    return (PUBLISH_ERROR_BODY, 500)
+
+def spill_or_reject(payload, ordering_key=''):
+    """Response while the circuit breaker is open: spill the event, or 503."""
+    if spill is not None:
+        response = spill_event(payload, ordering_key)
+        if response[1] == 202:
+            return response
+    retry_after = max(1, math.ceil(publish_breaker.retry_after()))
+    return (QUEUE_UNAVAILABLE_BODY, 503, {'Retry-After': str(retry_after)})
+
+def warm_up():
+    """Create the publisher and connect its gRPC channel ahead of traffic."""
+    try:
+        if spill is not None:
+            spill.get()  # Starts replaying events spilled before a restart
+        open_channel(publisher.get(), WARMUP_TIMEOUT)
+    except Exception as e:
+        logger.error(f"Warmup failed: {str(e)}")
+        return encode_response({'status': 'error', 'message': str(e)}, 503)
+    return encode_response({'status': 'warm'}, 200)
 
 @functions_framework.http
 def data_validator(request):
     """Cloud Function to validate incoming data."""
+    if request.method == 'GET' and request.path == '/warmup':
+        return warm_up()
+    if request.method == 'GET' and request.path == '/metrics':
+        return encode_response(metrics.snapshot(), 200)
     try:
         # Get the request data
-        request_json = request.get_json(silent=True)
-        if not request_json:
-            return (json.dumps({
-                'error': 'Invalid JSON payload',
-                'code': 'INVALID_JSON',
-                'message': 'The request body must be a valid JSON object'
-            }), 400)
-        return validate_data(request_json)
+        if request.method == 'POST' and request.path == '/batch':
+            events, error = read_json(request, batch=True)
+            if error:
+                return error
+            return validate_batch(events, wants_minimal(request))
+        request_json, error = read_json(request)
+        if error:
+            return error
+        return validate_data(request_json, wants_minimal(request))
     except Exception as e:
         logger.error(f"Error processing request: {str(e)}")
-        return (json.dumps({
-            'error': 'Server error',
-            'code': 'SERVER_ERROR',
-            'message': str(e)
-        }), 500)
+        return (server_error_body(codec.dumps(str(e))), 500)
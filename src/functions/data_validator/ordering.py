@@ -0,0 +1,81 @@
+"""
+Ordering keys for published events.
+
+Pub/Sub delivers messages with the same ordering key in publish order,
+while messages with different keys are still delivered in parallel. The
+key comes from a field of the event, set by a spec of the form
+``<field>`` (the whole value, e.g. ``email``) or ``<field>:<separator>``
+(the value up to the first separator, e.g. ``event_id:-`` turns
+``u123-0007`` into ``u123``). Events without the field, or with a value
+that is not a string, are published without a key.
+
+When a publish with a key fails, the client pauses that key and fails
+every later publish for it until resume_publish is called. The event
+itself goes to the spill log, and so must every later event with the same
+key until the spilled ones are replayed, or they would overtake it.
+SpilledKeys tracks those keys by the log position of their last spilled
+event, and lets a key go once the log's committed cursor has passed it.
+"""
+import heapq
+import threading
+from typing import Callable, Dict, List, Mapping, Tuple
+
+MAX_KEY_BYTES = 1024  # Pub/Sub limit on ordering key size
+
+
+def ordering_key_extractor(spec: str) -> Callable[[Mapping], str]:
+    """Build a function returning an event's ordering key ('' for none)."""
+    field, _, separator = spec.partition(':')
+    if not field:
+        raise ValueError(f"Invalid ordering key spec {spec!r}; expected <field> or "
+                         f"<field>:<separator>")
+
+    def ordering_key(event: Mapping) -> str:
+        value = event.get(field)
+        if not isinstance(value, str):
+            return ''
+        if separator:
+            value = value.split(separator, 1)[0]
+        if len(value) * 4 > MAX_KEY_BYTES and len(value.encode('utf-8')) > MAX_KEY_BYTES:
+            return ''
+        return value
+    return ordering_key
+
+
+class SpilledKeys:
+    """
+    Ordering keys with events in the spill log. Each key is held until the
+    log commits the position just after its last spilled event, so
+    replaying an event twice cannot release a key early.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last: Dict[str, Tuple[int, int]] = {}  # key -> end of its last spilled event
+        self._heap: List[Tuple[Tuple[int, int], str]] = []  # (position, key), oldest first
+        self._committed = (0, 0)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._last
+
+    def __len__(self) -> int:
+        return len(self._last)
+
+    def add(self, key: str, position: Tuple[int, int]) -> None:
+        """Record that an event with this key was spilled, ending at position."""
+        if not key:
+            return
+        with self._lock:
+            if position <= self._committed or position <= self._last.get(key, (0, 0)):
+                return
+            self._last[key] = position
+            heapq.heappush(self._heap, (position, key))
+
+    def committed(self, position: Tuple[int, int]) -> None:
+        """Release the keys whose spilled events all end at or before position."""
+        with self._lock:
+            self._committed = max(self._committed, position)
+            while self._heap and self._heap[0][0] <= self._committed:
+                last, key = heapq.heappop(self._heap)
+                if self._last.get(key) == last:
+                    del self._last[key]
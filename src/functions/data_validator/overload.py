@@ -0,0 +1,162 @@
+"""
+Overload protection around the Pub/Sub publish call.
+
+CircuitBreaker watches the outcome and latency of recent publishes. It
+opens when too many of them fail or are slow, rejects calls while open,
+and after a cool-down lets a few probe calls through (half-open) to decide
+whether to close again. AIMDLimiter bounds how many publishes may wait at
+once: the limit grows by one while calls are fast and is cut by a factor
+when one is slow or fails. Both let the caller turn work away at once
+instead of queueing request threads behind a struggling publisher.
+"""
+import collections
+import threading
+import time
+from typing import Callable, Optional
+
+from metrics import metrics
+
+CLOSED, HALF_OPEN, OPEN = 'closed', 'half_open', 'open'
+_STATE_GAUGE = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitBreaker:
+    """Count-based circuit breaker with error-rate and slow-call thresholds."""
+
+    def __init__(self, failure_rate: float = 0.5, slow_rate: float = 0.5,
+                 slow_call_seconds: float = 2.0, window: int = 20, minimum_calls: int = 10,
+                 open_seconds: float = 10.0, half_open_calls: int = 3,
+                 clock: Callable[[], float] = time.monotonic):
+        self.failure_rate = failure_rate
+        self.slow_rate = slow_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.minimum_calls = minimum_calls
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._outcomes = collections.deque(maxlen=window)  # (failed, slow) per call
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes = 0  # Half-open calls let through
+        self._probe_successes = 0
+        metrics.set_gauge('circuit_state', _STATE_GAUGE[CLOSED])
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def allow(self) -> bool:
+        """Return True if a call may go ahead; every allowed call must be recorded."""
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and self._probes < self.half_open_calls:
+                self._probes += 1
+                return True
+            metrics.increment('circuit_rejected')
+            return False
+
+    def record(self, success: bool, seconds: float) -> None:
+        """Record the outcome and latency of an allowed call."""
+        failed = not success
+        slow = seconds >= self.slow_call_seconds
+        with self._lock:
+            state = self._current_state()
+            if state == HALF_OPEN:
+                if failed or slow:
+                    self._open()
+                else:
+                    self._probe_successes += 1
+                    if self._probe_successes >= self.half_open_calls:
+                        self._set_state(CLOSED)
+                return
+            if state == OPEN:
+                return  # A call allowed before the breaker opened
+            self._outcomes.append((failed, slow))
+            calls = len(self._outcomes)
+            if calls < self.minimum_calls:
+                return
+            failures = sum(1 for f, _ in self._outcomes if f)
+            slow_calls = sum(1 for _, s in self._outcomes if s)
+            if failures / calls >= self.failure_rate or slow_calls / calls >= self.slow_rate:
+                self._open()
+
+    def retry_after(self) -> float:
+        """Seconds until the breaker lets probe calls through."""
+        with self._lock:
+            if self._state != OPEN:
+                return 0.0
+            return max(0.0, self._opened_at + self.open_seconds - self.clock())
+
+    def _current_state(self) -> str:
+        if self._state == OPEN and self.clock() >= self._opened_at + self.open_seconds:
+            self._set_state(HALF_OPEN)
+        return self._state
+
+    def _open(self) -> None:
+        self._opened_at = self.clock()
+        self._set_state(OPEN)
+        metrics.increment('circuit_opened')
+
+    def _set_state(self, state: str) -> None:
+        self._state = state
+        self._outcomes.clear()
+        self._probes = 0
+        self._probe_successes = 0
+        metrics.set_gauge('circuit_state', _STATE_GAUGE[state])
+
+
+class AIMDLimiter:
+    """Concurrency limit with additive increase and multiplicative decrease."""
+
+    def __init__(self, initial_limit: int = 20, min_limit: int = 1, max_limit: int = 200,
+                 latency_target: float = 1.0, decrease_factor: float = 0.9):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.decrease_factor = decrease_factor
+        self._lock = threading.Lock()
+        self._limit = float(initial_limit)
+        self._in_flight = 0
+        self._update_gauges()
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def try_acquire(self) -> bool:
+        """Take a slot; returns False (and counts a shed call) at the limit."""
+        with self._lock:
+            if self._in_flight >= int(self._limit):
+                metrics.increment('load_shed')
+                return False
+            self._in_flight += 1
+            self._update_gauges()
+            return True
+
+    def release(self, seconds: Optional[float] = None, success: bool = True) -> None:
+        """
+        Free a slot and adjust the limit from the call's latency and outcome.
+        Pass no latency for a slot that was taken but not used.
+        """
+        with self._lock:
+            in_flight = self._in_flight
+            self._in_flight -= 1
+            if seconds is not None:
+                if not success or seconds > self.latency_target:
+                    self._limit = max(self.min_limit, self._limit * self.decrease_factor)
+                elif in_flight * 2 >= self._limit:
+                    # Only grow when the limit is actually being used
+                    self._limit = min(self.max_limit, self._limit + 1)
+            self._update_gauges()
+
+    def _update_gauges(self) -> None:
+        metrics.set_gauge('concurrency_limit', int(self._limit))
+        metrics.set_gauge('concurrency_in_flight', self._in_flight)
@@ -0,0 +1,178 @@
+"""
+Encodings for published event payloads.
+
+Events can be published as plain JSON (the default), as gzip- or
+zstd-compressed JSON, or as protobuf messages generated from the event
+schema. Compression only applies to payloads of at least min_bytes,
+below which it costs more CPU than it saves in bytes. Each message
+records its encoding in two attributes, as HTTP does:
+
+    content_type      application/json or application/x-protobuf
+    content_encoding  identity, gzip or zstd
+
+Events with fields the schema does not describe, or values protobuf
+cannot hold, are sent as JSON. A message without these attributes is
+plain JSON.
+
+Subscribers decode messages with PayloadDecoder, built from the same
+schema; copy this module next to the subscriber. zstd needs the
+zstandard package and protobuf the proto-plus package, which
+google-cloud-pubsub installs.
+"""
+import gzip
+import hashlib
+import json
+from typing import Any, Callable, Dict, Mapping, Optional, Tuple
+
+JSON = 'application/json'
+PROTOBUF = 'application/x-protobuf'
+CONTENT_TYPES = {'json': JSON, 'protobuf': PROTOBUF}
+COMPRESSIONS = ('identity', 'gzip', 'zstd')
+
+_PROTO_TYPES = {'string': 'STRING', 'integer': 'SINT64', 'number': 'DOUBLE', 'boolean': 'BOOL'}
+_messages: Dict[str, Any] = {}  # Generated message classes, by schema digest
+
+
+def protobuf_message(schema: Mapping) -> Any:
+    """
+    Return a protobuf message class for an object schema. Field numbers
+    follow the order of 'properties', so only ever append properties.
+    Raises ValueError for a schema type protobuf fields cannot represent.
+    """
+    digest = hashlib.sha256(json.dumps(schema, sort_keys=True).encode()).hexdigest()[:12]
+    if digest not in _messages:
+        _messages[digest] = _message_class(f'Event_{digest}', schema).pb()
+    return _messages[digest]
+
+
+def _message_class(name: str, schema: Mapping) -> Any:
+    import proto
+
+    fields = {'__module__': __name__}
+    for number, (field, spec) in enumerate(schema.get('properties', {}).items(), start=1):
+        if spec.get('type') == 'object':
+            field_type = _message_class(f'{name}_{field}', spec)
+        elif spec.get('type') in _PROTO_TYPES:
+            field_type = getattr(proto, _PROTO_TYPES[spec['type']])
+        else:
+            raise ValueError(f"Cannot encode {field!r} of type {spec.get('type')!r} as protobuf")
+        fields[field] = proto.Field(field_type, number=number, optional=True)
+    return type(name, (proto.Message,), fields)
+
+
+def _to_dict(message) -> Dict[str, Any]:
+    return {field.name: _to_dict(value) if field.message_type else value
+            for field, value in message.ListFields()}
+
+
+def _compressor(compression: str, level: Optional[int]) -> Optional[Callable[[bytes], bytes]]:
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unknown compression {compression!r}; expected one of {COMPRESSIONS}")
+    if compression == 'gzip':
+        level = 6 if level is None else level
+        return lambda data: gzip.compress(data, compresslevel=level, mtime=0)
+    if compression == 'zstd':
+        return _zstandard().ZstdCompressor(level=3 if level is None else level).compress
+    return None
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ValueError("zstd compression needs the zstandard package") from None
+    return zstandard
+
+
+class PayloadEncoder:
+    """Turns encoded JSON events into message data and attributes."""
+
+    def __init__(self, content_type: str = 'json', compression: str = 'identity',
+                 min_bytes: int = 1024, schema: Optional[Mapping] = None,
+                 level: Optional[int] = None):
+        if content_type not in CONTENT_TYPES:
+            raise ValueError(f"Unknown content type {content_type!r}; "
+                             f"expected one of {sorted(CONTENT_TYPES)}")
+        if content_type == 'protobuf' and schema is None:
+            raise ValueError("protobuf encoding needs the event schema")
+        self.compression = compression
+        self.min_bytes = min_bytes
+        self._compress = _compressor(compression, level)
+        self._message = protobuf_message(schema) if content_type == 'protobuf' else None
+        # Attribute dicts for each outcome, built once
+        self._attributes = {
+            (media_type, encoding): {'content_type': media_type, 'content_encoding': encoding}
+            for media_type in (JSON, PROTOBUF) for encoding in COMPRESSIONS
+        }
+
+    def encode(self, payload: bytes, event: Mapping) -> Tuple[bytes, Optional[Dict[str, str]]]:
+        """
+        Encode an event, given as its JSON bytes and decoded dict. Returns the
+        message data and its encoding attributes, or None for attributes
+        when the JSON bytes are sent as they are.
+        """
+        media_type = JSON
+        if self._message is not None:
+            try:
+                payload = self._message(**event).SerializeToString()
+                media_type = PROTOBUF
+            except (ValueError, TypeError):
+                pass  # Not expressible in the schema's message; send JSON
+        if self._compress is not None and len(payload) >= self.min_bytes:
+            return self._compress(payload), self._attributes[(media_type, self.compression)]
+        if media_type == JSON:
+            return payload, None
+        return payload, self._attributes[(media_type, 'identity')]
+
+
+class PayloadDecoder:
+    """Turns message data and attributes back into the event dict."""
+
+    def __init__(self, schema: Optional[Mapping] = None,
+                 loads: Callable[[bytes], Any] = json.loads):
+        self.schema = schema
+        self.loads = loads
+        self._message = None
+        self._zstd = None
+        # Handlers by content_encoding, then by content_type
+        self._decompressors = {
+            'identity': lambda data: data, 'gzip': self._gunzip, 'zstd': self._unzstd
+        }
+        self._parsers = {JSON: self.loads, PROTOBUF: self._parse_protobuf}
+
+    def decode(self, data: bytes, attributes: Optional[Mapping[str, str]] = None) -> Any:
+        """Decode a message; raises ValueError for an unknown or corrupt encoding."""
+        attributes = attributes or {}
+        encoding = attributes.get('content_encoding', 'identity')
+        if encoding not in self._decompressors:
+            raise ValueError(f"Unknown content_encoding {encoding!r}")
+        content_type = attributes.get('content_type', JSON)
+        if content_type not in self._parsers:
+            raise ValueError(f"Unknown content_type {content_type!r}")
+        return self._parsers[content_type](self._decompressors[encoding](data))
+
+    def _gunzip(self, data: bytes) -> bytes:
+        try:
+            return gzip.decompress(data)
+        except (OSError, EOFError) as e:
+            raise ValueError(f"Corrupt gzip payload: {str(e)}") from e
+
+    def _unzstd(self, data: bytes) -> bytes:
+        if self._zstd is None:
+            self._zstd = _zstandard().ZstdDecompressor()
+        try:
+            return self._zstd.decompress(data)
+        except Exception as e:
+            raise ValueError(f"Corrupt zstd payload: {str(e)}") from e
+
+    def _parse_protobuf(self, data: bytes) -> Dict[str, Any]:
+        if self.schema is None:
+            raise ValueError("Decoding protobuf payloads needs the event schema")
+        if self._message is None:
+            self._message = protobuf_message(self.schema)
+        message = self._message()
+        try:
+            message.ParseFromString(data)
+        except Exception as e:
+            raise ValueError(f"Corrupt protobuf payload: {str(e)}") from e
+        return _to_dict(message)
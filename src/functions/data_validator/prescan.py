@@ -0,0 +1,91 @@
+"""
+Cheap structural checks on a raw JSON body, run before it is decoded.
+
+Every check is a byte translation, search, split or count done in C, and
+no values are built. The body is first reduced to its structure: the
+brackets and colons outside strings. Key count and nesting depth are read
+from that. A required field is reported missing only if its key appears
+nowhere in a complete object body; a key that is only present in a nested
+object passes here and is caught by the schema after decoding. Anything
+the checks cannot settle is left to the JSON decoder.
+"""
+import re
+from array import array
+from functools import lru_cache
+from itertools import accumulate
+from typing import Iterable, NamedTuple, Optional, Tuple
+
+# A complete string, unrolled so a failed match stays linear
+_STRING = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"', re.S)
+_OBJECT = re.compile(rb'\s*\{.*\}\s*$', re.S)
+
+# Translation tables: keep only quotes, brackets and colons; turn braces
+# into square brackets; map brackets to +1/-1 as signed bytes
+_NOT_STRUCTURE = bytes(c for c in range(256) if c not in b'"[]{}:')
+_BRACKETS = bytes(ord('[') if c in b'[{' else ord(']') if c in b']}' else c for c in range(256))
+_DEPTH_STEPS = bytes(1 if c == ord('[') else 255 if c == ord(']') else 0 for c in range(256))
+
+
+class Rejection(NamedTuple):
+    """Why a body was rejected; missing lists required fields in order."""
+    reason: str  # 'depth', 'keys' or 'missing'
+    missing: Tuple[str, ...] = ()
+
+
+@lru_cache(maxsize=None)
+def _key_pattern(field: str):
+    return re.compile(re.escape(b'"' + field.encode('utf-8') + b'"') + rb'\s*:')
+
+
+def _structure(body: bytes) -> bytes:
+    """The brackets and colons of the body that are not inside strings."""
+    if b'\\' in body:
+        body = _STRING.sub(b'', body)  # Strings may hold escaped quotes
+    # Strings without structural characters become a pair of adjacent
+    # quotes; dropping those pairs leaves few strings to split out
+    kept = body.translate(None, _NOT_STRUCTURE).replace(b'""', b'')
+    if b'"' in kept:
+        kept = b''.join(kept.split(b'"')[::2])
+    return kept
+
+
+def _too_deep(structure: bytes, max_depth: int) -> bool:
+    """True if brackets nest deeper than max_depth."""
+    brackets = structure.translate(_BRACKETS, b':')
+    # Each pass removes the innermost level of balanced brackets, which
+    # quickly shrinks wide documents; deep ones are walked below instead
+    level = 0
+    while level < max_depth:
+        shorter = brackets.replace(b'[]', b'')
+        if not shorter:
+            return False
+        if len(shorter) > len(brackets) * 3 // 4:
+            break
+        brackets = shorter
+        level += 1
+    # Walk what is left, stopping as soon as it passes the limit
+    steps = array('b', brackets.translate(_DEPTH_STEPS))
+    return any(map((max_depth - level).__lt__, accumulate(steps)))
+
+
+def scan(body: bytes, required: Iterable[str], max_depth: int,
+         max_keys: int) -> Optional[Rejection]:
+    """
+    Return a Rejection if the body is an object without some required key,
+    has more than max_keys object keys in total, or nests deeper than
+    max_depth. Returns None otherwise, including for bodies that are not
+    well formed.
+    """
+    # Keys written with \u escapes cannot be searched for literally
+    if (b'\\' not in body or b'\\u' not in body) and _OBJECT.match(body):
+        missing = tuple(field for field in required if not _key_pattern(field).search(body))
+        if missing:
+            return Rejection('missing', missing)
+
+    structure = _structure(body)
+    if structure.count(b':') > max_keys:
+        return Rejection('keys')
+    if structure.count(b'[') + structure.count(b'{') > max_depth:
+        if _too_deep(structure, max_depth):
+            return Rejection('depth')
+    return None
@@ -0,0 +1,152 @@
+"""
+Batching and flow-control settings for the Pub/Sub publisher client.
+
+Settings come from a named preset (PUBSUB_BATCH_PRESET) and can be
+overridden one by one with environment variables:
+
+    PUBSUB_BATCH_MAX_MESSAGES       messages per batch
+    PUBSUB_BATCH_MAX_BYTES          bytes per batch (server limit 10 MB)
+    PUBSUB_BATCH_MAX_LATENCY        seconds to wait before sending a batch
+    PUBSUB_FLOW_MAX_MESSAGES        messages awaiting publish
+    PUBSUB_FLOW_MAX_BYTES           bytes awaiting publish
+    PUBSUB_FLOW_LIMIT_BEHAVIOR      ignore, block or error
+
+Clients are expensive to import and build, so entry points hold them in
+a module-level LazyClient that creates them on first use.
+
+This module is shared by data_validator, backup_verifier, the frontend
+and the root event validators; keep the copies in sync.
+"""
+import os
+import threading
+from typing import Any, Callable, Mapping, NamedTuple, Optional
+
+MAX_BATCH_BYTES = 10 * 1000 * 1000  # Pub/Sub server-side request limit
+LIMIT_BEHAVIORS = ('ignore', 'block', 'error')
+
+
+class PublisherSettings(NamedTuple):
+    """Batch and flow-control settings for a PublisherClient."""
+    max_messages: int
+    max_bytes: int
+    max_latency: float
+    flow_max_messages: int = 1000
+    flow_max_bytes: int = 10 * 1000 * 1000
+    limit_behavior: str = 'ignore'
+
+
+PRESETS = {
+    # The client library's own defaults
+    'default': PublisherSettings(max_messages=100, max_bytes=1000 * 1000, max_latency=0.01),
+    # Send almost immediately; best for a synchronous request path
+    'low-latency': PublisherSettings(max_messages=10, max_bytes=1000 * 1000, max_latency=0.001),
+    # Fill large batches; best for bulk and asynchronous publishing
+    'throughput': PublisherSettings(max_messages=1000, max_bytes=9 * 1000 * 1000,
+                                    max_latency=0.05, flow_max_messages=10000,
+                                    flow_max_bytes=100 * 1000 * 1000,
+                                    limit_behavior='block'),
+}
+
+_OVERRIDES = (
+    ('PUBSUB_BATCH_MAX_MESSAGES', 'max_messages', int),
+    ('PUBSUB_BATCH_MAX_BYTES', 'max_bytes', int),
+    ('PUBSUB_BATCH_MAX_LATENCY', 'max_latency', float),
+    ('PUBSUB_FLOW_MAX_MESSAGES', 'flow_max_messages', int),
+    ('PUBSUB_FLOW_MAX_BYTES', 'flow_max_bytes', int),
+    ('PUBSUB_FLOW_LIMIT_BEHAVIOR', 'limit_behavior', str.lower),
+)
+
+
+def load_publisher_settings(environ: Optional[Mapping[str, str]] = None) -> PublisherSettings:
+    """
+    Build publisher settings from a preset plus environment overrides.
+    Raises ValueError for an unknown preset or an out-of-range value.
+    """
+    environ = os.environ if environ is None else environ
+    preset = environ.get('PUBSUB_BATCH_PRESET', 'default')
+    if preset not in PRESETS:
+        raise ValueError(f"Unknown PUBSUB_BATCH_PRESET {preset!r}; "
+                         f"expected one of {sorted(PRESETS)}")
+
+    overrides = {}
+    for variable, field, convert in _OVERRIDES:
+        if environ.get(variable):
+            overrides[field] = convert(environ[variable])
+    settings = PRESETS[preset]._replace(**overrides)
+
+    if settings.limit_behavior not in LIMIT_BEHAVIORS:
+        raise ValueError(f"PUBSUB_FLOW_LIMIT_BEHAVIOR must be one of {LIMIT_BEHAVIORS}")
+    if not 0 < settings.max_bytes <= MAX_BATCH_BYTES:
+        raise ValueError(f"PUBSUB_BATCH_MAX_BYTES must be between 1 and {MAX_BATCH_BYTES}")
+    if settings.max_messages < 1 or settings.max_latency < 0:
+        raise ValueError("Batch max messages must be positive and max latency non-negative")
+    return settings
+
+
+def create_publisher(settings: Optional[PublisherSettings] = None, **options):
+    """
+    Create a PublisherClient configured with the given settings.
+    Extra keyword arguments are passed to PublisherOptions.
+    """
+    from google.cloud import pubsub_v1
+
+    settings = settings or load_publisher_settings()
+    types = pubsub_v1.types
+    batch_settings = types.BatchSettings(
+        max_messages=settings.max_messages,
+        max_bytes=settings.max_bytes,
+        max_latency=settings.max_latency,
+    )
+    flow_control = types.PublishFlowControl(
+        message_limit=settings.flow_max_messages,
+        byte_limit=settings.flow_max_bytes,
+        limit_exceeded_behavior=types.LimitExceededBehavior(settings.limit_behavior),
+    )
+    return pubsub_v1.PublisherClient(
+        batch_settings=batch_settings,
+        publisher_options=types.PublisherOptions(flow_control=flow_control, **options),
+    )
+
+
+class LazyClient:
+    """
+    Module-level handle to a client that is created on first use.
+    The factory runs once even when several threads use the handle at
+    the same time; attribute access is forwarded to the client.
+    Private and special names are not forwarded, so introspection such
+    as mock.patch's does not create the client.
+    """
+
+    def __init__(self, factory: Callable[[], Any]):
+        self._factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def created(self) -> bool:
+        return self._client is not None
+
+    def get(self) -> Any:
+        """Return the client, creating it if this is the first use."""
+        client = self._client
+        if client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._factory()
+                client = self._client
+        return client
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.get(), name)
+
+
+def open_channel(client, timeout: float = 10.0) -> None:
+    """
+    Connect a client's gRPC channel now instead of on the first call.
+    Raises grpc.FutureTimeoutError if it is not ready within timeout.
+    """
+    import grpc
+
+    grpc.channel_ready_future(client.transport.grpc_channel).result(timeout=timeout)
@@ -0,0 +1,308 @@
+"""
+Durable local spill queue for events that could not be published.
+
+SpillLog is an append-only log split into numbered segment files. Each
+record is a 4-byte payload length, the payload's CRC32 and the payload.
+Writes only ever append, and a fresh segment is started on open and
+whenever the current one is full, so a record torn by a crash is always
+the last one in its segment. Segments are read through mmap, stopping at
+the first incomplete or corrupt record. Read progress is kept in a cursor
+file that is replaced atomically, and segments are deleted once drained.
+
+SpillDrainer replays the log from a background thread, backing off
+exponentially while publishing keeps failing.
+"""
+import itertools
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from typing import Callable, Iterator, List, NamedTuple, Optional, Tuple
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct('>II')  # Payload length, CRC32 of the payload
+_SEGMENT_SUFFIX = '.seg'
+_CURSOR_FILE = 'cursor'
+
+
+class SpillFull(Exception):
+    """Raised when an append would take the log over max_bytes."""
+
+
+class SpillRecord(NamedTuple):
+    """A payload read from the log and the position just after it."""
+    data: bytes
+    position: Tuple[int, int]  # (segment number, byte offset)
+
+
+class SpillLog:
+    """Append-only, segment-rotated file log of payloads."""
+
+    def __init__(self, directory: str, segment_bytes: int = 16 * 1024 * 1024,
+                 max_bytes: int = 128 * 1024 * 1024, fsync: bool = False,
+                 on_commit: Optional[Callable[[Tuple[int, int]], None]] = None):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.fsync = fsync
+        self.on_commit = on_commit  # Called with the new cursor after each commit
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._cursor = self._load_cursor()
+        self._segments = [seq for seq in self._list_segments() if seq >= self._cursor[0]]
+        for seq in self._list_segments():
+            if seq < self._cursor[0]:
+                os.remove(self._path(seq))
+        self._writer = None
+        # Never append to an existing segment; its last record may be torn
+        self._write_seq = max(self._segments + [self._cursor[0]]) + 1
+        self._write_offset = 0
+        # Count what an earlier instance left behind, one record at a time
+        self._depth = self._bytes = 0
+        for record in self._records(self._cursor, self._segments, None):
+            self._depth += 1
+            self._bytes += _HEADER.size + len(record.data)
+        self._update_gauges()
+
+    @property
+    def depth(self) -> int:
+        """Number of records not yet committed."""
+        return self._depth
+
+    @property
+    def pending_bytes(self) -> int:
+        """Size of the records not yet committed."""
+        return self._bytes
+
+    def append(self, data: bytes) -> Tuple[int, int]:
+        """
+        Write one payload; raises SpillFull if the log is at max_bytes.
+        Returns the record's position, as read() would report it.
+        """
+        size = _HEADER.size + len(data)
+        with self._lock:
+            if self._bytes + size > self.max_bytes:
+                metrics.increment('spill_full')
+                raise SpillFull(f"Spill log is full ({self._bytes} bytes pending)")
+            segment_full = self._write_offset + size > self.segment_bytes
+            if self._writer is None or (self._write_offset and segment_full):
+                self._rotate()
+            self._writer.write(_HEADER.pack(len(data), zlib.crc32(data)) + data)
+            self._writer.flush()
+            if self.fsync:
+                os.fsync(self._writer.fileno())
+            self._write_offset += size
+            self._depth += 1
+            self._bytes += size
+            metrics.increment('spill_appended')
+            self._update_gauges()
+            self._not_empty.notify_all()
+            return self._write_seq, self._write_offset
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until the log has records or timeout passes; True if not empty."""
+        with self._lock:
+            if not self._depth:
+                self._not_empty.wait(timeout)
+            return self._depth > 0
+
+    def pending(self) -> Iterator[SpillRecord]:
+        """Yield the uncommitted records, oldest first, one at a time."""
+        with self._lock:
+            cursor = self._cursor
+            segments = list(self._segments)
+            active = (self._write_seq, self._write_offset) if self._writer else None
+        return self._records(cursor, segments, active)
+
+    def read(self, max_records: int) -> List[SpillRecord]:
+        """Return up to max_records uncommitted records, oldest first."""
+        with self._lock:
+            cursor = self._cursor
+            segments = list(self._segments)
+            active = (self._write_seq, self._write_offset) if self._writer else None
+        return self._read(cursor, max_records, segments, active)
+
+    def commit(self, records: List[SpillRecord]) -> None:
+        """Mark records returned by read, in order, as done."""
+        if not records:
+            return
+        position = records[-1].position
+        with self._lock:
+            self._cursor = position
+            self._save_cursor(position)
+            while self._segments and self._segments[0] < position[0]:
+                os.remove(self._path(self._segments.pop(0)))
+            self._depth -= len(records)
+            self._bytes -= sum(_HEADER.size + len(record.data) for record in records)
+            self._update_gauges()
+            if self.on_commit is not None:
+                self.on_commit(position)
+
+    def close(self) -> None:
+        """Close the segment being written."""
+        with self._lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+    def _read(self, cursor, max_records, segments, active) -> List[SpillRecord]:
+        records = self._records(cursor, segments, active)
+        try:
+            return list(itertools.islice(records, max_records))
+        finally:
+            records.close()
+
+    def _records(self, cursor, segments, active) -> Iterator[SpillRecord]:
+        """Yield the valid records from cursor on, oldest first."""
+        for seq in segments:
+            if seq < cursor[0]:
+                continue
+            offset = cursor[1] if seq == cursor[0] else 0
+            # The segment being written is read no further than the last append
+            end = active[1] if active and active[0] == seq else None
+            complete = yield from self._segment_records(seq, offset, end)
+            if not complete and end is None:
+                logger.warning(f"Skipping torn tail of spill segment {seq}")
+
+    def _segment_records(self, seq, offset, end):
+        """Yield the segment's valid records; returns False if it ends torn."""
+        with open(self._path(seq), 'rb') as f:
+            size = os.fstat(f.fileno()).st_size if end is None else end
+            if size <= offset:
+                return True
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                while offset < size:
+                    if offset + _HEADER.size > size:
+                        return False
+                    length, checksum = _HEADER.unpack_from(view, offset)
+                    start = offset + _HEADER.size
+                    if start + length > size:
+                        return False
+                    data = view[start:start + length]
+                    if zlib.crc32(data) != checksum:
+                        return False
+                    offset = start + length
+                    yield SpillRecord(data, (seq, offset))
+        return True
+
+    def _rotate(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._write_seq += 1
+        self._writer = open(self._path(self._write_seq), 'ab')
+        self._write_offset = 0
+        self._segments.append(self._write_seq)
+
+    def _path(self, seq: int) -> str:
+        return os.path.join(self.directory, f'{seq:020d}{_SEGMENT_SUFFIX}')
+
+    def _list_segments(self) -> List[int]:
+        return sorted(int(name[:-len(_SEGMENT_SUFFIX)]) for name in os.listdir(self.directory)
+                      if name.endswith(_SEGMENT_SUFFIX))
+
+    def _load_cursor(self) -> Tuple[int, int]:
+        try:
+            with open(os.path.join(self.directory, _CURSOR_FILE)) as f:
+                seq, offset = f.read().split()
+                return int(seq), int(offset)
+        except (OSError, ValueError):
+            return 0, 0
+
+    def _save_cursor(self, position: Tuple[int, int]) -> None:
+        path = os.path.join(self.directory, _CURSOR_FILE)
+        with open(path + '.tmp', 'w') as f:
+            f.write(f'{position[0]} {position[1]}')
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(path + '.tmp', path)
+
+    def _update_gauges(self) -> None:
+        metrics.set_gauge('spill_depth', self._depth)
+        metrics.set_gauge('spill_bytes', self._bytes)
+
+
+class SpillDrainer:
+    """Background thread that republishes spilled payloads."""
+
+    def __init__(self, log: SpillLog, publish: Callable[[bytes], object],
+                 batch_size: int = 100, initial_backoff: float = 1.0,
+                 max_backoff: float = 60.0, publish_timeout: float = 30.0,
+                 poll_interval: float = 1.0):
+        self.log = log
+        self.publish = publish  # Returns a future for one payload
+        self.batch_size = batch_size
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.publish_timeout = publish_timeout
+        self.poll_interval = poll_interval
+        self.backoff = initial_backoff
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        """Start draining in a daemon thread."""
+        self._thread = threading.Thread(target=self._run, name='spill-drainer', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Ask the thread to stop and wait up to timeout for it."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def drain_once(self) -> int:
+        """
+        Publish one batch and commit the records up to the first failure.
+        Returns the number drained; raises the publish error, if any.
+        """
+        records = self.log.read(self.batch_size)
+        if not records:
+            return 0
+        started = time.monotonic()
+        error = None
+        futures = []
+        for record in records:
+            try:
+                futures.append(self.publish(record.data))
+            except Exception as e:
+                error = e
+                break
+        done = 0
+        for future in futures:
+            try:
+                future.result(timeout=self.publish_timeout)
+            except Exception as e:
+                error = e
+                break
+            done += 1
+        # Anything after the first failure is replayed again: at least once
+        self.log.commit(records[:done])
+        if done:
+            metrics.increment('spill_drained', done)
+            metrics.set_gauge('spill_drain_rate',
+                              round(done / max(time.monotonic() - started, 1e-6), 1))
+        if error is not None:
+            raise error
+        return done
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            if not self.log.wait(self.poll_interval):
+                continue
+            try:
+                self.drain_once()
+            except Exception as e:
+                metrics.increment('spill_replay_failures')
+                logger.warning(f"Spill replay failed, retrying in {self.backoff:.1f}s: {str(e)}")
+                self._stop.wait(self.backoff)
+                self.backoff = min(self.backoff * 2, self.max_backoff)
+            else:
+                self.backoff = self.initial_backoff
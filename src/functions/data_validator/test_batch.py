@@ -0,0 +1,89 @@
+import json
+import threading
+from concurrent.futures import Future
+from unittest.mock import patch
+
+import main
+from main import data_validator
+from test_main import make_request
+from test_routing import RecordingPublisher
+
+EVENT = {"name": "Test User", "email": "test@example.com", "age": 25}
+
+
+def make_batch_request(events):
+    request = make_request(json.dumps(events).encode())
+    request.method = 'POST'
+    request.path = '/batch'
+    return request
+
+
+class PendingPublisher:
+    """Fake publisher whose futures complete only when release() is called."""
+
+    def __init__(self):
+        self.futures = []
+
+    def publish(self, topic, data, **attributes):
+        self.futures.append(Future())
+        return self.futures[-1]
+
+    def release(self):
+        for n, future in enumerate(self.futures):
+            future.set_result(str(n))
+
+
+def test_batch_results_in_order():
+    publisher = RecordingPublisher()
+    invalid = dict(EVENT, email='not-an-email')
+    with patch.object(main, 'publisher', publisher), patch.object(main, 'spill', None):
+        response, status_code = data_validator(make_batch_request([EVENT, invalid, {'name': 'x'}]))
+    assert status_code == 200
+    results = json.loads(response)['results']
+    assert [result['status'] for result in results] == [200, 400, 400]
+    assert results[0]['body'] == {
+        'message': 'Data validated and published successfully',
+        'code': 'SUCCESS',
+        'data': EVENT
+    }
+    assert results[1]['body']['code'] == 'INVALID_EMAIL'
+    assert results[2]['body']['missing_fields'] == ['age', 'email']
+    assert len(publisher.messages) == 1
+    assert main.metrics.get('batch_events') >= 3
+
+def test_batch_publishes_before_waiting():
+    publisher = PendingPublisher()
+    with patch.object(main, 'publisher', publisher), patch.object(main, 'spill', None):
+        done = []
+        thread = threading.Thread(target=lambda: done.append(main.validate_batch([EVENT] * 5)))
+        thread.start()
+        for _ in range(500):
+            if len(publisher.futures) == 5:
+                break
+            threading.Event().wait(0.01)
+        # Every publish started while none had completed
+        assert len(publisher.futures) == 5
+        publisher.release()
+        thread.join(5)
+    results = json.loads(done[0][0])['results']
+    assert [result['status'] for result in results] == [200] * 5
+
+def test_batch_headers_and_limits():
+    with patch.object(main, 'publisher', RecordingPublisher()), patch.object(main, 'spill', None), \
+            patch.object(main.publish_limiter, 'try_acquire', return_value=False):
+        results = json.loads(main.validate_batch([EVENT])[0])['results']
+    assert results[0]['status'] == 503
+    assert results[0]['headers'] == {'Retry-After': str(main.LOAD_SHED_RETRY_AFTER)}
+
+    # The whole batch takes one limiter slot
+    with patch.object(main, 'publisher', RecordingPublisher()), patch.object(main, 'spill', None), \
+            patch.object(main.publish_limiter, 'try_acquire', return_value=True) as try_acquire, \
+            patch.object(main.publish_limiter, 'release') as release:
+        results = json.loads(main.validate_batch([EVENT] * 10 + [{}])[0])['results']
+    assert [result['status'] for result in results] == [200] * 10 + [400]
+    assert try_acquire.call_count == 1 and release.call_count == 1
+    assert release.call_args[0][1] is True
+
+    for events in ([EVENT] * (main.MAX_BATCH_EVENTS + 1), EVENT):
+        response, status_code = data_validator(make_batch_request(events))
+        assert status_code == 400 and json.loads(response)['code'] == 'INVALID_BATCH'
@@ -0,0 +1,126 @@
+import hashlib
+import json
+import os
+from unittest.mock import patch
+
+import pytest
+
+import main
+from claim_check import (ClaimCheck, ClaimCheckResolver, FilesystemStore, GCSStore,
+                         open_store)
+from main import data_validator
+from payload_encoding import PayloadDecoder, PayloadEncoder
+from test_main import make_request
+from test_routing import RecordingPublisher
+
+EVENT = {"name": "Test User", "email": "test@example.com", "age": 25}
+LARGE_EVENT = dict(EVENT, name="Test User " * 500)
+
+
+class CountingStore(FilesystemStore):
+    """Filesystem store that counts writes and reads."""
+
+    def __init__(self, root):
+        super().__init__(root)
+        self.puts = 0
+        self.gets = 0
+
+    def put_if_absent(self, key, data):
+        self.puts += 1
+        return super().put_if_absent(key, data)
+
+    def get(self, key):
+        self.gets += 1
+        return super().get(key)
+
+
+def test_open_store(tmp_path):
+    store = open_store('gs://events-archive/claims')
+    assert isinstance(store, GCSStore)
+    assert (store.bucket_name, store.prefix, store.uri) == (
+        'events-archive', 'claims/', 'gs://events-archive/claims/')
+    assert isinstance(open_store(f'file://{tmp_path}'), FilesystemStore)
+    assert open_store(str(tmp_path)).uri == f'file://{tmp_path}'
+    with pytest.raises(ValueError):
+        open_store('gs:///claims')
+
+def test_offload_is_keyed_by_content(tmp_path):
+    store = CountingStore(str(tmp_path))
+    body = b'x' * 1000
+    digest = hashlib.sha256(body).hexdigest()
+    reference, attributes = ClaimCheck(store, threshold=100).offload(body, {'event_type': 'user'})
+    assert attributes == {'event_type': 'user', 'claim_check': digest}
+    assert json.loads(reference) == {'store': store.uri, 'key': f'{digest[:2]}/{digest}',
+                                     'sha256': digest, 'size': 1000}
+    assert (tmp_path / digest[:2] / digest).read_bytes() == body
+
+    # The same body again: a new instance checks the store, the same one skips it
+    claim_check = ClaimCheck(store, threshold=100)
+    mtime = os.path.getmtime(tmp_path / digest[:2] / digest)
+    assert claim_check.offload(body, {})[0] == reference
+    assert os.path.getmtime(tmp_path / digest[:2] / digest) == mtime
+    claim_check.offload(body, {})
+    assert store.puts == 2
+
+def test_resolver_caches_and_verifies(tmp_path):
+    store = CountingStore(str(tmp_path))
+    claim_check = ClaimCheck(store, threshold=0)
+    resolver = ClaimCheckResolver(store, cache_bytes=2500)
+    messages = [claim_check.offload(bytes([i]) * 1000, {'event_type': 'user'}) for i in range(3)]
+
+    for _ in range(2):
+        for i, (data, attributes) in enumerate(messages[:2]):
+            assert resolver.resolve(data, attributes) == (bytes([i]) * 1000, {'event_type': 'user'})
+    assert (resolver.hits, resolver.misses, store.gets) == (2, 2, 2)
+    # A third body evicts the least recently used one
+    resolver.resolve(*messages[2])
+    resolver.resolve(*messages[0])
+    assert store.gets == 4
+
+    # Messages without a claim check pass through
+    assert resolver.resolve(b'{}', {'event_type': 'user'}) == (b'{}', {'event_type': 'user'})
+
+    data, attributes = messages[1]
+    (tmp_path / json.loads(data)['key']).write_bytes(b'tampered')
+    with pytest.raises(ValueError):
+        ClaimCheckResolver(store).resolve(data, attributes)
+    with pytest.raises(ValueError):
+        resolver.resolve(data, dict(attributes, claim_check='0' * 64))
+    os.remove(tmp_path / json.loads(data)['key'])
+    with pytest.raises(KeyError):
+        ClaimCheckResolver(store).resolve(data, attributes)
+
+def test_validator_offloads_large_events(tmp_path):
+    publisher = RecordingPublisher()
+    store = FilesystemStore(str(tmp_path))
+    encoder = PayloadEncoder(compression='gzip', min_bytes=1024)
+    with patch.object(main, 'publisher', publisher), \
+            patch.object(main, 'claim_check', ClaimCheck(store, threshold=1024)), \
+            patch.object(main, 'payload_encoder', PayloadEncoder()):
+        for event in (EVENT, LARGE_EVENT):
+            assert data_validator(make_request(json.dumps(event).encode()))[1] == 200
+        # The threshold applies to the encoded data
+        with patch.object(main, 'payload_encoder', encoder):
+            main.republish(json.dumps(LARGE_EVENT).encode()).result()
+
+    resolver = ClaimCheckResolver(store)
+    decoder = PayloadDecoder()
+    (_, small, small_attributes), (_, large, large_attributes), (_, packed, packed_attributes) = \
+        publisher.messages
+    assert 'claim_check' not in small_attributes
+    assert len(large) < 300 and 'claim_check' in large_attributes
+    assert decoder.decode(*resolver.resolve(large, large_attributes)) == LARGE_EVENT
+    assert 'claim_check' not in packed_attributes
+    assert decoder.decode(packed, packed_attributes) == LARGE_EVENT
+
+def test_store_failure_is_a_publish_failure(tmp_path):
+    class BrokenStore(FilesystemStore):
+        def put_if_absent(self, key, data):
+            raise OSError('bucket unavailable')
+    publisher = RecordingPublisher()
+    with patch.object(main, 'publisher', publisher), patch.object(main, 'spill', None), \
+            patch.object(main, 'claim_check', ClaimCheck(BrokenStore(str(tmp_path)), 1024)):
+        response, status_code = data_validator(make_request(json.dumps(LARGE_EVENT).encode()))
+    assert status_code == 500
+    assert json.loads(response)['code'] == 'PUBLISH_ERROR'
+    assert publisher.messages == []
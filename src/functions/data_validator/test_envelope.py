@@ -0,0 +1,93 @@
+import json
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from unittest.mock import patch
+
+import pytest
+
+import main
+from envelope import EnvelopePacker, envelope_size, is_envelope, pack, unpack
+from main import data_validator
+from test_main import make_request
+from test_routing import RecordingPublisher
+
+
+class FailingPublisher:
+    def publish(self, topic, data, **attributes):
+        future = Future()
+        future.set_exception(Exception('Pub/Sub unavailable'))
+        return future
+
+
+def test_pack_unpack_without_copies():
+    events = [b'{"a":1}', b'', b'x' * 1000]
+    data = pack(events)
+    assert len(data) == envelope_size(3, 1007)
+    views = list(unpack(data))
+    assert [bytes(view) for view in views] == events
+    assert all(view.obj is data for view in views)
+    assert list(unpack(pack([]))) == []
+
+def test_unpack_rejects_corrupt_envelopes():
+    data = pack([b'abc', b'def'])
+    for corrupt in (data[:6], b'JUNK' + data[4:], data[:-1], data[:8] + b'\xff' * 4 + data[12:]):
+        with pytest.raises(ValueError):
+            list(unpack(corrupt))
+
+def test_packer_flushes_on_count_size_and_latency():
+    publisher = RecordingPublisher()
+    packer = EnvelopePacker(publisher.publish, max_events=3,
+                            max_bytes=envelope_size(2, 200), max_latency=0.05)
+    futures = [packer.add('t', b'%d' % i, {'event_type': 'a'}) for i in range(3)]
+    assert [f.result(timeout=1) for f in futures] == ['1'] * 3
+    packer.add('t', b'x' * 100, {'event_type': 'a'})
+    packer.add('t', b'y' * 100, {'event_type': 'a'})
+    assert len(publisher.messages) == 1
+    packer.add('t', b'z', {'event_type': 'a'})  # Would go over max_bytes
+    assert len(publisher.messages) == 2
+    started = time.monotonic()
+    waiting = packer.add('t', b'w', {'event_type': 'b'})
+    assert waiting.result(timeout=1) == '4'
+    assert time.monotonic() - started >= 0.04
+
+    packer.flush()
+    assert [(attributes['event_type'], attributes['event_count'],
+             [bytes(event) for event in unpack(data)])
+            for _, data, attributes in publisher.messages] == [
+        ('a', '3', [b'0', b'1', b'2']),
+        ('a', '2', [b'x' * 100, b'y' * 100]),
+        ('a', '1', [b'z']),
+        ('b', '1', [b'w']),
+    ]
+    assert all(is_envelope(attributes) for _, _, attributes in publisher.messages)
+    assert (packer.envelopes_sent, packer.events_sent) == (4, 7)
+
+def test_large_events_skip_the_envelope():
+    publisher = RecordingPublisher()
+    packer = EnvelopePacker(publisher.publish, max_bytes=100)
+    assert packer.add('t', b'x' * 100, {'event_type': 'a'}).result(timeout=1) == '1'
+    assert publisher.messages == [('t', b'x' * 100, {'event_type': 'a'})]
+
+def test_publish_error_reaches_every_event():
+    packer = EnvelopePacker(FailingPublisher().publish, max_events=2)
+    futures = [packer.add('t', b'{}', {}) for _ in range(2)]
+    for future in futures:
+        with pytest.raises(Exception, match='unavailable'):
+            future.result(timeout=1)
+
+def test_validator_packs_concurrent_events():
+    publisher = RecordingPublisher()
+    packer = EnvelopePacker(lambda topic, data, **attributes:
+                            main.publisher.publish(topic, data, **attributes),
+                            max_events=10, max_latency=0.05)
+    events = [{"name": f"User {i}", "email": f"user{i}@example.com", "age": 20 + i}
+              for i in range(20)]
+    with patch.object(main, 'publisher', publisher), patch.object(main, 'packer', packer):
+        with ThreadPoolExecutor(max_workers=20) as pool:
+            responses = list(pool.map(
+                lambda event: data_validator(make_request(json.dumps(event).encode())), events))
+    assert all(status_code == 200 for _, status_code in responses)
+    assert len(publisher.messages) < len(events)
+    unpacked = [json.loads(bytes(event)) for _, data, _ in publisher.messages
+                for event in unpack(data)]
+    assert sorted(unpacked, key=lambda event: event['age']) == events
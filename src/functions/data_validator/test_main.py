@@ -1,6 +1,10 @@
+import json
 import pytest
+import main
 from main import data_validator, validate_email
-from unittest.mock import Mock
+from jsoncodec import CODECS, get_codec
+from prescan import scan
+from unittest.mock import Mock, patch
 
 def test_validate_email():
     assert validate_email("test@example.com") == True
@@ -10,40 +14,166 @@ def test_validate_email():
 
 def test_data_validator_missing_fields():
     request = Mock()
-    request.get_json = Mock(return_value={"name": "Test"})
+    request.headers = {}
+    request.get_data = Mock(return_value=json.dumps({"name": "Test"}).encode('utf-8'))
     response, status_code = data_validator(request)
     assert status_code == 400
     assert "missing_fields" in response
 
 def test_data_validator_invalid_email():
     request = Mock()
-    request.get_json = Mock(return_value={
+    request.headers = {}
+    request.get_data = Mock(return_value=json.dumps({
         "name": "Test",
         "email": "invalid-email",
         "age": 25
-    })
+    }).encode('utf-8'))
     response, status_code = data_validator(request)
     assert status_code == 400
     assert "INVALID_EMAIL" in response
 
 def test_data_validator_invalid_age():
     request = Mock()
-    request.get_json = Mock(return_value={
+    request.headers = {}
+    request.get_data = Mock(return_value=json.dumps({
         "name": "Test",
         "email": "test@example.com",
         "age": -1
-    })
+    }).encode('utf-8'))
     response, status_code = data_validator(request)
     assert status_code == 400
     assert "INVALID_AGE_VALUE" in response
 
 def test_data_validator_valid_data():
     request = Mock()
-    request.get_json = Mock(return_value={
+    request.headers = {}
+    request.get_data = Mock(return_value=json.dumps({
         "name": "Test User",
         "email": "test@example.com",
         "age": 25
-    })
+    }).encode('utf-8'))
     response, status_code = data_validator(request)
     assert status_code == 200
-    assert "SUCCESS" in response 
\ No newline at end of file
+    assert "SUCCESS" in response 
+
+def test_data_validator_malformed_json():
+    request = Mock()
+    request.headers = {}
+    request.get_data = Mock(return_value=b'{"name": "Test",')
+    response, status_code = data_validator(request)
+    assert status_code == 400
+    assert "INVALID_JSON" in response
+
+def test_published_bytes_are_echoed():
+    payload = {"name": "Zoë", "email": "test@example.com", "age": 25}
+    request = Mock()
+    request.headers = {}
+    request.get_data = Mock(return_value=json.dumps(payload).encode('utf-8'))
+    with patch('main.publisher') as publisher:
+        response, status_code = data_validator(request)
+    published = publisher.publish.call_args[0][1]
+    assert status_code == 200
+    assert json.loads(published) == payload
+    assert json.loads(response)['data'] == payload
+    assert response.endswith(published.decode('utf-8') + '}')
+
+def test_codecs_agree():
+    payload = {"name": "Zoë", "age": 25, "score": 0.1, "tags": ["a", None, True],
+               "address": {"zip": "12345"}}
+    encoded = {name: get_codec(name).dumps(payload) for name in CODECS}
+    assert len(set(encoded.values())) == 1
+    for name in CODECS:
+        assert get_codec(name).loads(encoded[name]) == payload
+        with pytest.raises(ValueError):
+            get_codec(name).loads(b'{bad')
+
+def test_minimal_response():
+    payload = {"name": "Test User", "email": "test@example.com", "age": 25}
+    request = Mock()
+    request.headers = {'Prefer': 'return=minimal'}
+    request.get_data = Mock(return_value=json.dumps(payload).encode('utf-8'))
+    with patch('main.publisher') as publisher:
+        publisher.publish.return_value.result.return_value = 'message-id'
+        response, status_code = data_validator(request)
+        assert status_code == 200
+        assert json.loads(response) == {'code': 'SUCCESS', 'message_id': 'message-id'}
+
+        # The config switch makes minimal the default; Prefer can still override it
+        request.headers = {}
+        with patch.object(main, 'RESPONSE_MODE', 'minimal'):
+            assert 'data' not in json.loads(data_validator(request)[0])
+            request.headers = {'Prefer': 'return=representation'}
+            assert json.loads(data_validator(request)[0])['data'] == payload
+
+def test_pre_encoded_bodies_match_dynamic_encoding():
+    for fields, body in main.MISSING_FIELDS_BODIES.items():
+        assert json.loads(body)['missing_fields'] == list(fields)
+    request = Mock()
+    request.headers = {}
+    request.get_data = Mock(return_value=b'{"age": 5}')
+    response, _ = data_validator(request)
+    assert json.loads(response) == {
+        'error': 'Missing required fields',
+        'code': 'MISSING_FIELDS',
+        'message': 'Required fields missing: name, email',
+        'missing_fields': ['name', 'email']
+    }
+    assert json.loads(main.invalid_field_body(main.codec.dumps('zip "x"'))) == {
+        'error': 'Invalid field', 'code': 'INVALID_FIELD', 'message': 'zip "x"'
+    }
+
+def make_request(body, headers=None):
+    request = Mock()
+    request.headers = headers or {}
+    request.get_data = Mock(return_value=body)
+    return request
+
+def test_oversized_body_rejected_before_reading():
+    request = make_request(b'{}', {'Content-Length': str(main.MAX_BODY_BYTES + 1)})
+    response, status_code = data_validator(request)
+    assert status_code == 413
+    assert json.loads(response)['code'] == 'PAYLOAD_TOO_LARGE'
+    request.get_data.assert_not_called()
+
+    response, status_code = data_validator(make_request(b' ' * (main.MAX_BODY_BYTES + 1)))
+    assert status_code == 413
+
+def test_malformed_content_length_rejected():
+    for value in ('abc', '1.5', '-1'):
+        request = make_request(b'{}', {'Content-Length': value})
+        response, status_code = data_validator(request)
+        assert status_code == 400
+        assert json.loads(response)['code'] == 'INVALID_CONTENT_LENGTH'
+        request.get_data.assert_not_called()
+
+def test_deep_and_key_heavy_bodies_rejected_before_decoding():
+    deep = b'{"name": "Test", "age": 25, "email": "test@example.com", "x": ' \
+        + b'[' * 100000 + b']' * 100000 + b'}'
+    wide = json.dumps({"name": "Test", "age": 25, "email": "test@example.com",
+                       "extra": {f"k{i}": i for i in range(main.MAX_JSON_KEYS)}}).encode()
+    with patch.object(main.codec, 'loads') as loads:
+        response, status_code = data_validator(make_request(deep))
+        assert status_code == 400
+        assert json.loads(response)['code'] == 'PAYLOAD_TOO_DEEP'
+        response, status_code = data_validator(make_request(wide))
+        assert status_code == 400
+        assert json.loads(response)['code'] == 'TOO_MANY_KEYS'
+        response, status_code = data_validator(make_request(b'{"age": 25, "x": {"mail": 1}}'))
+        assert status_code == 400
+        assert json.loads(response)['missing_fields'] == ['name', 'email']
+        loads.assert_not_called()
+
+def test_scan_defers_to_decoder():
+    required = main.EVENT_SCHEMA['required']
+    # String values are not keys; escaped and nested keys are left to the schema
+    assert scan(b'{"name": "age", "email": "x"}', required, 20, 100).missing == ('age',)
+    assert scan(b'{"n\\u0061me": "a", "age": 1, "email": "x"}', required, 20, 100) is None
+    assert scan(b'{"name": "a", "x": {"age": 1}, "email": "x"}', required, 20, 100) is None
+    # Colons and brackets inside strings do not count towards the limits
+    assert scan(b'{"name": "[[[[", "age": 1, "email": "a:b:c:d"}', required, 2, 3) is None
+    assert scan(b'{"name": "\\"[[[[\\"", "age": 1, "email": "a:b:c:d"}', required, 2, 3) is None
+    assert scan(b'{"name": "a", "age": [[1]], "email": "x"}', required, 2, 3).reason == 'depth'
+    assert scan(b'{"name": "a", "age": {"b": 1}, "email": "x"}', required, 2, 3).reason == 'keys'
+    # Bodies that are not complete objects are left to the decoder
+    for body in (b'{"name": "Test",', b'{"name": "Te', b'[1, 2]', b'', b'{]', b'{"a" "b"'):
+        assert scan(body, required, 20, 100) is None
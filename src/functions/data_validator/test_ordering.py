@@ -0,0 +1,191 @@
+import json
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future
+from unittest.mock import patch
+
+import pytest
+
+import main
+from keyed_executor import KeyedExecutor
+from main import data_validator
+from ordering import SpilledKeys, ordering_key_extractor
+from spill import SpillDrainer, SpillLog
+from test_main import make_request
+
+
+class OrderingPublisher:
+    """
+    Fake publisher with the client's ordering-key behaviour: a failed
+    publish pauses its key, and publishes to a paused key fail at once
+    until resume_publish is called.
+    """
+
+    def __init__(self):
+        self.failing = False
+        self.paused = set()
+        self.resumed = []
+        self.published = []
+
+    def publish(self, topic, data, ordering_key='', **attributes):
+        if ordering_key in self.paused:
+            raise Exception(f'Ordering key {ordering_key} is paused')
+        future = Future()
+        if self.failing:
+            if ordering_key:
+                self.paused.add(ordering_key)
+            future.set_exception(Exception('Deadline exceeded'))
+        else:
+            self.published.append((ordering_key, json.loads(data)))
+            future.set_result(str(len(self.published)))
+        return future
+
+    def resume_publish(self, topic, ordering_key):
+        self.paused.discard(ordering_key)
+        self.resumed.append(ordering_key)
+
+
+def event(email, n):
+    return {"name": f"User {n}", "email": email, "age": 20 + n}
+
+
+def test_ordering_key_extractor():
+    by_email = ordering_key_extractor('email')
+    assert by_email({'email': 'a@b.co'}) == 'a@b.co'
+    assert by_email({}) == '' and by_email({'email': 5}) == ''
+    assert by_email({'email': 'x' * 2000}) == ''
+    by_prefix = ordering_key_extractor('event_id:-')
+    assert by_prefix({'event_id': 'u123-0007'}) == 'u123'
+    assert by_prefix({'event_id': 'u123'}) == 'u123'
+    with pytest.raises(ValueError):
+        ordering_key_extractor(':-')
+
+def test_spilled_keys():
+    keys = SpilledKeys()
+    keys.add('a', (1, 10))
+    keys.add('b', (1, 20))
+    keys.add('a', (1, 30))
+    keys.add('', (1, 40))
+    keys.committed((1, 20))
+    # A duplicate replay of a's first event does not release it
+    keys.committed((1, 10))
+    assert 'a' in keys and 'b' not in keys
+    keys.committed((1, 30))
+    assert 'a' not in keys and len(keys) == 0
+    # An event committed before it was added holds nothing back
+    keys.add('c', (1, 25))
+    assert 'c' not in keys
+
+def test_failed_publish_resumes_its_key():
+    publisher = OrderingPublisher()
+    with patch.object(main, 'publisher', publisher), patch.object(main, 'spill', None), \
+            patch.object(main, 'ordering_key_for', ordering_key_extractor('email')):
+        publisher.failing = True
+        assert data_validator(make_request(json.dumps(event('a@b.co', 1)).encode()))[1] == 500
+        assert publisher.resumed == ['a@b.co'] and not publisher.paused
+        publisher.failing = False
+        assert data_validator(make_request(json.dumps(event('a@b.co', 2)).encode()))[1] == 200
+
+        # A publish rejected at once for a paused key resumes it too
+        publisher.paused.add('c@d.co')
+        assert data_validator(make_request(json.dumps(event('c@d.co', 1)).encode()))[1] == 500
+        assert not publisher.paused
+    assert publisher.published == [('a@b.co', event('a@b.co', 2))]
+
+def test_events_follow_spilled_events_of_their_key(tmp_path):
+    publisher = OrderingPublisher()
+    keys = SpilledKeys()
+    log = SpillLog(str(tmp_path), on_commit=keys.committed)
+
+    def request(e):
+        return data_validator(make_request(json.dumps(e).encode()))[1]
+
+    with patch.object(main, 'publisher', publisher), patch.object(main, 'spill', log), \
+            patch.object(main, 'spilled_keys', keys), \
+            patch.object(main, 'ordering_key_for', ordering_key_extractor('email')):
+        publisher.failing = True
+        assert request(event('a@b.co', 1)) == 202
+        publisher.failing = False
+        # Pub/Sub is back, but a@b.co must wait for its spilled event
+        assert request(event('a@b.co', 2)) == 202
+        assert request(event('c@d.co', 1)) == 200
+        assert 'a@b.co' in keys and log.depth == 2
+
+        assert SpillDrainer(log, main.republish).drain_once() == 2
+        assert 'a@b.co' not in keys
+        assert request(event('a@b.co', 3)) == 200
+    assert publisher.published == [('c@d.co', event('c@d.co', 1)),
+                                   ('a@b.co', event('a@b.co', 1)),
+                                   ('a@b.co', event('a@b.co', 2)),
+                                   ('a@b.co', event('a@b.co', 3))]
+
+def test_spilled_keys_are_rebuilt_on_restart(tmp_path):
+    log = SpillLog(str(tmp_path))
+    log.append(json.dumps(event('a@b.co', 1)).encode())
+    log.append(json.dumps(event('c@d.co', 1)).encode())
+    log.commit(log.read(1))
+    log.close()
+    keys = SpilledKeys()
+    with patch.object(main, 'SPILL_DIR', str(tmp_path)), patch.object(main, 'spilled_keys', keys), \
+            patch.object(main, 'ordering_key_for', ordering_key_extractor('email')), \
+            patch.object(main, 'SpillDrainer') as drainer:
+        log = main.create_spill()
+    drainer.return_value.start.assert_called_once_with()
+    # Only the event still in the log holds back its key
+    assert 'c@d.co' in keys and 'a@b.co' not in keys
+    log.commit(log.read(1))
+    assert len(keys) == 0
+
+def test_keyed_executor_keeps_per_key_order():
+    """Harness: many keys, high parallelism; each key must run in order, one at a time."""
+    rng = random.Random(11)
+    executor = KeyedExecutor(max_workers=64)
+    lock = threading.Lock()
+    seen = defaultdict(list)
+    running = defaultdict(int)
+    stats = {'active': 0, 'max_active': 0, 'overlaps': 0}
+
+    def task(key, seq, delay):
+        with lock:
+            running[key] += 1
+            stats['overlaps'] += running[key] > 1
+            stats['active'] += 1
+            stats['max_active'] = max(stats['max_active'], stats['active'])
+        time.sleep(delay)
+        with lock:
+            seen[key].append(seq)
+            running[key] -= 1
+            stats['active'] -= 1
+        return seq
+
+    keys = [f'user-{i}' for i in range(300)]
+    submitted = defaultdict(list)
+    futures = []
+    for _ in range(6000):
+        key = rng.choice(keys)
+        submitted[key].append(len(submitted[key]))
+        futures.append(executor.submit(key, task, key, submitted[key][-1],
+                                       rng.choice((0, 0, 0.0005, 0.001))))
+    executor.shutdown(wait=True)
+
+    assert all(future.done() for future in futures)
+    assert seen == submitted
+    assert stats['overlaps'] == 0
+    assert stats['max_active'] >= 16
+    assert executor.pending() == 0
+
+def test_keyed_executor_failures_and_unkeyed_tasks():
+    executor = KeyedExecutor(max_workers=4)
+
+    def fail():
+        raise ValueError('bad message')
+    failed = executor.submit('k', fail)
+    after = executor.submit('k', lambda: 'next')
+    unkeyed = [executor.submit(None, lambda i=i: i) for i in range(10)]
+    assert after.result(timeout=5) == 'next'
+    with pytest.raises(ValueError):
+        failed.result()
+    assert [future.result(timeout=5) for future in unkeyed] == list(range(10))
+    executor.shutdown()
@@ -0,0 +1,175 @@
+import heapq
+import json
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from unittest.mock import patch
+
+import main
+from main import data_validator
+from overload import AIMDLimiter, CircuitBreaker, CLOSED, HALF_OPEN, OPEN
+from test_main import make_request
+
+EVENT = {"name": "Test User", "email": "test@example.com", "age": 25}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class SlowPublisher:
+    """Fake publisher whose futures complete after an injectable latency."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+
+    def publish(self, topic, data, **attributes):
+        future = Future()
+        timer = threading.Timer(self.latency, future.set_result, ['message-id'])
+        timer.daemon = True
+        timer.start()
+        return future
+
+
+def test_breaker_opens_probes_and_closes():
+    clock = FakeClock()
+    breaker = CircuitBreaker(window=10, minimum_calls=4, open_seconds=5,
+                             half_open_calls=2, clock=clock)
+    for success in (True, False, True, False):
+        assert breaker.allow()
+        breaker.record(success, 0.01)
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert breaker.retry_after() == 5
+
+    # A failed probe opens it again; two good probes close it
+    clock.now = 5
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+    breaker.record(False, 0.01)
+    assert breaker.state == OPEN
+    clock.now = 10
+    assert breaker.allow() and breaker.allow()
+    assert not breaker.allow()  # Only half_open_calls probes at a time
+    breaker.record(True, 0.01)
+    breaker.record(True, 0.01)
+    assert breaker.state == CLOSED
+
+def test_breaker_opens_on_slow_calls():
+    breaker = CircuitBreaker(slow_call_seconds=1, slow_rate=0.5, minimum_calls=4)
+    for seconds in (0.1, 2, 0.1, 2):
+        breaker.allow()
+        breaker.record(True, seconds)
+    assert breaker.state == OPEN
+
+def test_limiter_aimd():
+    limiter = AIMDLimiter(initial_limit=4, min_limit=1, max_limit=5, latency_target=1)
+    assert all(limiter.try_acquire() for _ in range(4))
+    assert not limiter.try_acquire()
+    limiter.release(0.1)  # Fast while busy: additive increase
+    assert limiter.limit == 5
+    limiter.release(2)  # Slow: multiplicative decrease
+    assert limiter.limit == 4
+    for _ in range(2):
+        limiter.release(0.1, success=False)
+    assert limiter.limit == 3 and limiter.in_flight == 0
+    limiter.try_acquire()
+    limiter.release(0.1)  # Idle: the limit does not grow
+    assert limiter.limit == 3
+
+def simulate(protected, rate=200, seconds=40, spike=(10, 20)):
+    """
+    Discrete-event simulation of requests against a publisher whose latency
+    jumps from 50 ms to 3 s during the spike. Returns request counts.
+    """
+    clock = FakeClock()
+    breaker = CircuitBreaker(slow_call_seconds=1, open_seconds=2, clock=clock)
+    limiter = AIMDLimiter(initial_limit=20, latency_target=0.5)
+    completions = []  # (time, seq, started)
+    stats = {'ok': 0, 'shed': 0, 'max_in_flight': 0, 'ok_after_spike': 0}
+    in_flight = 0
+    for i in range(rate * seconds):
+        clock.now = i / rate
+        while completions and completions[0][0] <= clock.now:
+            done_at, _, started = heapq.heappop(completions)
+            in_flight -= 1
+            stats['ok'] += 1
+            stats['ok_after_spike'] += done_at > spike[1] + 5
+            if protected:
+                saved, clock.now = clock.now, done_at
+                limiter.release(done_at - started)
+                breaker.record(True, done_at - started)
+                clock.now = saved
+        if protected:
+            if not limiter.try_acquire():
+                stats['shed'] += 1
+                continue
+            if not breaker.allow():
+                limiter.release()
+                stats['shed'] += 1
+                continue
+        latency = 3.0 if spike[0] <= clock.now < spike[1] else 0.05
+        heapq.heappush(completions, (clock.now + latency, i, clock.now))
+        in_flight += 1
+        stats['max_in_flight'] = max(stats['max_in_flight'], in_flight)
+    return stats
+
+def test_simulated_latency_spike():
+    unprotected = simulate(protected=False)
+    protected = simulate(protected=True)
+    # Without protection the spike piles up rate x latency waiting requests
+    assert unprotected['max_in_flight'] >= 500
+    # With it, waiting requests stay bounded and the excess is shed at once
+    assert protected['max_in_flight'] <= 30
+    assert protected['shed'] > 1000
+    # After the spike the breaker closes and traffic flows again
+    assert protected['ok_after_spike'] >= 0.9 * 200 * 15
+
+def test_validator_sheds_during_spike():
+    publisher = SlowPublisher(latency=0.2)
+    breaker = CircuitBreaker(slow_call_seconds=0.1, window=5, minimum_calls=3,
+                             open_seconds=0.3, half_open_calls=2)
+
+    def request():
+        return data_validator(make_request(json.dumps(EVENT).encode()))
+
+    with patch.object(main, 'publisher', publisher), patch.object(main, 'spill', None), \
+            patch.object(main, 'publish_breaker', breaker), \
+            patch.object(main, 'publish_limiter', AIMDLimiter(latency_target=1)):
+        for _ in range(3):
+            assert request()[1] == 200
+        assert breaker.state == OPEN
+        started = time.monotonic()
+        body, status_code, headers = request()
+        assert time.monotonic() - started < 0.05
+        assert status_code == 503
+        assert json.loads(body)['code'] == 'QUEUE_UNAVAILABLE'
+        assert headers['Retry-After'] == '1'
+
+        # The spike ends; probes succeed and the breaker closes
+        publisher.latency = 0
+        time.sleep(0.3)
+        assert request()[1] == 200 and request()[1] == 200
+        assert breaker.state == CLOSED
+
+def test_validator_sheds_over_concurrency_limit():
+    limiter = AIMDLimiter(initial_limit=2, max_limit=2, latency_target=1)
+
+    def request():
+        return data_validator(make_request(json.dumps(EVENT).encode()))
+
+    with patch.object(main, 'publisher', SlowPublisher(latency=0.3)), \
+            patch.object(main, 'publish_breaker', CircuitBreaker()), \
+            patch.object(main, 'publish_limiter', limiter):
+        with ThreadPoolExecutor(max_workers=6) as pool:
+            responses = list(pool.map(lambda _: request(), range(6)))
+    statuses = sorted(response[1] for response in responses)
+    assert statuses.count(200) >= 2 and statuses.count(503) >= 1
+    for response in responses:
+        if response[1] == 503:
+            assert json.loads(response[0])['code'] == 'OVERLOADED'
+            assert response[2]['Retry-After'] == '1'
@@ -0,0 +1,94 @@
+import gzip
+import json
+from unittest.mock import patch
+
+import pytest
+
+import main
+from main import EVENT_SCHEMA, data_validator
+from payload_encoding import JSON, PROTOBUF, PayloadDecoder, PayloadEncoder
+from test_main import make_request
+from test_routing import RecordingPublisher
+
+EVENT = {"name": "Test User", "email": "test@example.com", "age": 25,
+         "address": {"street": "1 Main St", "zip": "12345"}, "event_type": "user.created"}
+LARGE_EVENT = dict(EVENT, name="Test User " * 200)
+
+
+def encode(encoder, event):
+    return encoder.encode(json.dumps(event).encode(), event)
+
+
+def test_compression_applies_above_threshold():
+    encoder = PayloadEncoder(compression='gzip', min_bytes=1024)
+    decoder = PayloadDecoder()
+    payload = json.dumps(EVENT).encode()
+    assert encoder.encode(payload, EVENT) == (payload, None)
+
+    data, attributes = encode(encoder, LARGE_EVENT)
+    assert attributes == {'content_type': JSON, 'content_encoding': 'gzip'}
+    assert len(data) < len(json.dumps(LARGE_EVENT)) / 10
+    assert decoder.decode(data, attributes) == LARGE_EVENT
+    assert decoder.decode(payload) == EVENT
+
+def test_protobuf_round_trip():
+    pytest.importorskip('proto')
+    decoder = PayloadDecoder(schema=EVENT_SCHEMA)
+    for compression in ('identity', 'gzip'):
+        encoder = PayloadEncoder('protobuf', compression, schema=EVENT_SCHEMA)
+        for event in (EVENT, LARGE_EVENT, {"name": "A", "email": "a@b.co", "age": 0}):
+            data, attributes = encode(encoder, event)
+            assert attributes['content_type'] == PROTOBUF
+            assert len(data) < len(json.dumps(event))
+            assert decoder.decode(data, attributes) == event
+            assert attributes['content_encoding'] == (
+                compression if event is LARGE_EVENT else 'identity')
+
+def test_protobuf_falls_back_to_json():
+    pytest.importorskip('proto')
+    encoder = PayloadEncoder('protobuf', schema=EVENT_SCHEMA)
+    for event in (dict(EVENT, extra=1), dict(EVENT, address={"country": "US"}),
+                  dict(EVENT, age=2 ** 70)):
+        payload = json.dumps(event).encode()
+        assert encoder.encode(payload, event) == (payload, None)
+
+def test_invalid_settings():
+    with pytest.raises(ValueError):
+        PayloadEncoder(content_type='xml')
+    with pytest.raises(ValueError):
+        PayloadEncoder(compression='brotli')
+    with pytest.raises(ValueError):
+        PayloadEncoder(content_type='protobuf')
+
+def test_zstd():
+    try:
+        encoder = PayloadEncoder(compression='zstd', min_bytes=0)
+    except ValueError:
+        pytest.skip('zstandard is not installed')
+    data, attributes = encode(encoder, LARGE_EVENT)
+    assert attributes['content_encoding'] == 'zstd'
+    assert PayloadDecoder().decode(data, attributes) == LARGE_EVENT
+
+def test_decoder_rejects_bad_messages():
+    decoder = PayloadDecoder()
+    for data, attributes in ((b'not gzip', {'content_encoding': 'gzip'}),
+                             (b'{}', {'content_encoding': 'br'}),
+                             (b'{}', {'content_type': 'text/csv'}),
+                             (b'\n\x01a', {'content_type': PROTOBUF})):
+        with pytest.raises(ValueError):
+            decoder.decode(data, attributes)
+
+def test_validator_publishes_encoded_payload():
+    publisher = RecordingPublisher()
+    encoder = PayloadEncoder(compression='gzip', min_bytes=1024)
+    with patch.object(main, 'publisher', publisher), patch.object(main, 'payload_encoder', encoder):
+        response, status_code = data_validator(make_request(json.dumps(LARGE_EVENT).encode()))
+        assert status_code == 200
+        # The response still echoes the event as JSON
+        assert json.loads(response)['data'] == LARGE_EVENT
+        # Spilled events are encoded again when they are replayed
+        main.republish(json.dumps(LARGE_EVENT).encode()).result()
+    for _, data, attributes in publisher.messages:
+        assert attributes == {'event_type': 'user.created', 'schema_version': '1',
+                              'content_type': JSON, 'content_encoding': 'gzip'}
+        assert json.loads(gzip.decompress(data)) == LARGE_EVENT
@@ -0,0 +1,103 @@
+import json
+from concurrent.futures import Future
+from unittest.mock import patch
+
+import pytest
+
+import main
+from main import data_validator
+from routing import RoutingTable, parse_routes
+from spill import SpillDrainer, SpillLog
+from test_main import make_request
+
+EVENT = {"name": "Test User", "email": "test@example.com", "age": 25}
+TOPIC = 'projects/servless-pipeline/topics/'
+
+
+class RecordingPublisher:
+    """Fake publisher that keeps (topic, data, attributes) for each publish."""
+
+    def __init__(self):
+        self.messages = []
+
+    def publish(self, topic, data, **attributes):
+        self.messages.append((topic, data, attributes))
+        future = Future()
+        future.set_result(str(len(self.messages)))
+        return future
+
+
+def make_routes():
+    return RoutingTable('servless-pipeline', 'events-topic', parse_routes(
+        'user.created=users-topic, priority:high=priority-topic,'
+        'audit=projects/other/topics/audit'), schema_version='2', default_event_type='user')
+
+
+def test_parse_routes():
+    assert parse_routes('') == {}
+    assert parse_routes(' a.b = t1 ,priority:high=t2,') == {'a.b': 't1', 'priority:high': 't2'}
+    for spec in ('a.b', '=t1', 'a.b=', 'priority:=t1', 'a=t1,a=t2'):
+        with pytest.raises(ValueError):
+            parse_routes(spec)
+
+def test_routes_and_attributes():
+    routes = make_routes()
+    assert routes.topics == ('projects/other/topics/audit', TOPIC + 'events-topic',
+                             TOPIC + 'priority-topic', TOPIC + 'users-topic')
+    assert routes.route() == (TOPIC + 'events-topic', {
+        'event_type': 'user', 'schema_version': '2', 'content_encoding': 'identity'})
+    assert routes.route('user.created').topic_path == TOPIC + 'users-topic'
+    assert routes.route('audit').topic_path == 'projects/other/topics/audit'
+    # An event_type route wins over a priority route
+    assert routes.route('user.created', 'high').topic_path == TOPIC + 'users-topic'
+    route = routes.route('user.updated', 'high')
+    assert route.topic_path == TOPIC + 'priority-topic'
+    assert route.attributes == {'event_type': 'user.updated', 'schema_version': '2',
+                                'content_encoding': 'identity', 'priority': 'high'}
+    assert routes.route('user.updated', 'low').topic_path == TOPIC + 'events-topic'
+    # Routes are built once and reused
+    assert routes.route_event({'event_type': 'user.created'}) is routes.route('user.created')
+
+def test_route_cache_is_bounded():
+    routes = RoutingTable('p', 'events-topic', max_cached=3)
+    for i in range(10):
+        assert routes.route(f'type-{i}').attributes['event_type'] == f'type-{i}'
+    assert len(routes._routes) == 3
+
+def test_validator_publishes_with_attributes():
+    publisher = RecordingPublisher()
+    events = [EVENT, dict(EVENT, event_type='user.created'),
+              dict(EVENT, event_type='user.updated', priority='high')]
+    with patch.object(main, 'publisher', publisher), patch.object(main, 'routes', make_routes()):
+        for event in events:
+            assert data_validator(make_request(json.dumps(event).encode()))[1] == 200
+    assert [(topic, attributes) for topic, _, attributes in publisher.messages] == [
+        (TOPIC + 'events-topic',
+         {'event_type': 'user', 'schema_version': '2', 'content_encoding': 'identity'}),
+        (TOPIC + 'users-topic',
+         {'event_type': 'user.created', 'schema_version': '2', 'content_encoding': 'identity'}),
+        (TOPIC + 'priority-topic',
+         {'event_type': 'user.updated', 'schema_version': '2', 'content_encoding': 'identity',
+          'priority': 'high'}),
+    ]
+    assert [json.loads(data) for _, data, _ in publisher.messages] == events
+
+def test_invalid_event_type_rejected():
+    publisher = RecordingPublisher()
+    with patch.object(main, 'publisher', publisher):
+        for event_type in ('', 'x' * 200, 'has space', 5):
+            body = json.dumps(dict(EVENT, event_type=event_type)).encode()
+            response, status_code = data_validator(make_request(body))
+            assert status_code == 400
+            assert json.loads(response)['code'] == 'INVALID_FIELD'
+    assert publisher.messages == []
+
+def test_spilled_event_keeps_its_route(tmp_path):
+    log = SpillLog(str(tmp_path))
+    log.append(json.dumps(dict(EVENT, event_type='user.created')).encode())
+    publisher = RecordingPublisher()
+    with patch.object(main, 'publisher', publisher), patch.object(main, 'routes', make_routes()):
+        assert SpillDrainer(log, main.republish).drain_once() == 1
+    (topic, _, attributes), = publisher.messages
+    assert topic == TOPIC + 'users-topic'
+    assert attributes['event_type'] == 'user.created'
@@ -0,0 +1,152 @@
+import json
+import os
+import time
+from concurrent.futures import Future
+from unittest.mock import patch
+
+import pytest
+
+import main
+from main import data_validator
+from metrics import metrics
+from spill import SpillDrainer, SpillFull, SpillLog
+from test_main import make_request
+
+EVENT = {"name": "Test User", "email": "test@example.com", "age": 25}
+
+
+class FaultyPublisher:
+    """Fake publisher that fails while `failing` is set, then records publishes."""
+
+    def __init__(self, failing=True, fail_on_result=False):
+        self.failing = failing
+        self.fail_on_result = fail_on_result
+        self.published = []
+
+    def publish(self, topic, data, **attributes):
+        if self.failing and not self.fail_on_result:
+            raise Exception('Pub/Sub unavailable')
+        future = Future()
+        if self.failing:
+            future.set_exception(Exception('Deadline exceeded'))
+        else:
+            self.published.append(data)
+            future.set_result(str(len(self.published)))
+        return future
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+def test_log_survives_reopen_and_rotates(tmp_path):
+    log = SpillLog(str(tmp_path), segment_bytes=64)
+    payloads = [f'event-{i}'.encode() * 3 for i in range(10)]
+    for payload in payloads:
+        log.append(payload)
+    assert len([name for name in os.listdir(tmp_path) if name.endswith('.seg')]) > 1
+
+    records = log.read(4)
+    assert [r.data for r in records] == payloads[:4]
+    log.commit(records)
+    log.close()
+
+    # A new instance picks up after the committed records
+    log = SpillLog(str(tmp_path), segment_bytes=64)
+    assert log.depth == 6
+    log.append(b'after restart')
+    assert [r.data for r in log.read(100)] == payloads[4:] + [b'after restart']
+    log.commit(log.read(100))
+    assert log.depth == 0 and log.pending_bytes == 0
+    assert metrics.get('spill_depth') == 0
+
+def test_reopen_counts_without_loading_the_log(tmp_path):
+    log = SpillLog(str(tmp_path), segment_bytes=64)
+    for i in range(10):
+        log.append(f'event-{i}'.encode())
+    log.close()
+    # Startup streams through the records instead of reading them all into a list
+    with patch.object(SpillLog, '_read', side_effect=AssertionError('log loaded')):
+        log = SpillLog(str(tmp_path), segment_bytes=64)
+    assert log.depth == 10
+    assert log.pending_bytes == sum(8 + len(f'event-{i}'.encode()) for i in range(10))
+
+def test_torn_record_is_skipped(tmp_path):
+    log = SpillLog(str(tmp_path))
+    log.append(b'first')
+    log.append(b'second')
+    log.close()
+    segment = max(name for name in os.listdir(tmp_path) if name.endswith('.seg'))
+    with open(tmp_path / segment, 'r+b') as f:
+        f.truncate(os.path.getsize(tmp_path / segment) - 2)
+
+    log = SpillLog(str(tmp_path))
+    assert log.depth == 1
+    log.append(b'third')
+    assert [r.data for r in log.read(100)] == [b'first', b'third']
+
+def test_log_is_bounded(tmp_path):
+    log = SpillLog(str(tmp_path), max_bytes=100)
+    log.append(b'x' * 50)
+    with pytest.raises(SpillFull):
+        log.append(b'x' * 50)
+
+def test_drain_commits_only_published_prefix(tmp_path):
+    log = SpillLog(str(tmp_path))
+    for i in range(3):
+        log.append(b'%d' % i)
+    publisher = FaultyPublisher(failing=False)
+    calls = []
+
+    def publish(data):
+        calls.append(data)
+        if len(calls) == 2:
+            raise Exception('Pub/Sub unavailable')
+        return publisher.publish('topic', data)
+    drainer = SpillDrainer(log, publish)
+    with pytest.raises(Exception):
+        drainer.drain_once()
+    assert [r.data for r in log.read(100)] == [b'1', b'2']
+    assert drainer.drain_once() == 2
+    assert publisher.published == [b'0', b'1', b'2']
+
+@pytest.mark.parametrize('fail_on_result', [False, True])
+def test_failed_publish_is_spilled_and_replayed(tmp_path, fail_on_result):
+    publisher = FaultyPublisher(fail_on_result=fail_on_result)
+    log = SpillLog(str(tmp_path))
+    drainer = SpillDrainer(log, lambda data: publisher.publish('topic', data),
+                           initial_backoff=0.01, max_backoff=0.05, poll_interval=0.01)
+    with patch.object(main, 'publisher', publisher), patch.object(main, 'spill', log):
+        drainer.start()
+        try:
+            response, status_code = data_validator(make_request(json.dumps(EVENT).encode()))
+            assert status_code == 202
+            assert json.loads(response)['code'] == 'QUEUED'
+            assert log.depth == 1
+
+            # Replay keeps failing, backing off, until the publisher recovers
+            wait_for(lambda: drainer.backoff == 0.05)
+            assert metrics.get('spill_replay_failures') >= 3
+            publisher.failing = False
+            wait_for(lambda: log.depth == 0)
+        finally:
+            drainer.stop(timeout=5)
+    assert [json.loads(data) for data in publisher.published] == [EVENT]
+    assert drainer.backoff == 0.01
+    assert metrics.get('spill_drain_rate') > 0
+
+def test_publish_error_without_spill():
+    with patch.object(main, 'publisher', FaultyPublisher()), patch.object(main, 'spill', None):
+        response, status_code = data_validator(make_request(json.dumps(EVENT).encode()))
+    assert status_code == 500
+    assert json.loads(response)['code'] == 'PUBLISH_ERROR'
+
+def test_full_spill_reports_publish_error(tmp_path):
+    log = SpillLog(str(tmp_path), max_bytes=10)
+    with patch.object(main, 'publisher', FaultyPublisher()), patch.object(main, 'spill', log):
+        response, status_code = data_validator(make_request(json.dumps(EVENT).encode()))
+    assert status_code == 500
+    assert log.depth == 0
@@ -0,0 +1,100 @@
+import json
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+from unittest.mock import Mock, patch
+
+import pytest
+
+# Add the repository root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+from schema import compile_schema  # noqa: E402
+
+ORDER_SCHEMA = {
+    'type': 'object',
+    'required': ['order_id', 'amount'],
+    'properties': {
+        'order_id': {'type': 'string', 'minLength': 1},
+        'amount': {'type': 'number', 'exclusiveMinimum': 0}
+    }
+}
+
+
+def make_event(**fields):
+    event = {'event_id': 'evt-1', 'timestamp': '2024-05-01T12:30:45Z',
+             'event_type': 'order.placed', 'data': {'order_id': 'o1', 'amount': 9.5}}
+    event.update(fields)
+    return event
+
+
+@pytest.fixture
+def order_schemas(tmp_path):
+    """Register ORDER_SCHEMA for order.placed, as EVENT_SCHEMAS_FILE would."""
+    path = tmp_path / 'schemas.json'
+    path.write_text(json.dumps({'order.placed': ORDER_SCHEMA}))
+    schemas = main.load_event_schemas(str(path))
+    validators = {event_type: compile_schema(schema) for event_type, schema in schemas.items()}
+    with patch.object(main, 'EVENT_VALIDATORS', validators):
+        yield
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('2024-05-01T12:30:45', datetime(2024, 5, 1, 12, 30, 45)),
+    ('2024-05-01T12:30:45Z', datetime(2024, 5, 1, 12, 30, 45, tzinfo=timezone.utc)),
+    ('2024-05-01T12:30:45.1234Z', datetime(2024, 5, 1, 12, 30, 45, 123400, timezone.utc)),
+    ('2024-05-01T12:30:45.123456-05:30',
+     datetime(2024, 5, 1, 12, 30, 45, 123456, timezone(-timedelta(hours=5, minutes=30)))),
+])
+def test_parse_timestamp_valid(value, expected):
+    assert main.parse_timestamp(value) == expected
+
+
+@pytest.mark.parametrize('value', [
+    '2024-05-01', 'yesterday', '2024-13-01T00:00:00Z', '2024-05-01T12:30:45+5',
+    # Out-of-range offsets
+    '2024-05-01T12:30:45+99:00', '2024-05-01T12:30:45+24:00', '2024-05-01T12:30:45-00:60',
+])
+def test_parse_timestamp_invalid(value):
+    assert main.parse_timestamp(value) is None
+
+
+def test_out_of_range_offset_is_a_client_error():
+    request = Mock()
+    request.method = 'POST'
+    request.get_json = Mock(return_value=make_event(timestamp='2024-05-01T12:30:45+99:00'))
+    with patch.object(main, 'publisher') as publisher:
+        response, status_code = main.validate_data(request)
+    assert status_code == 400
+    assert response == 'timestamp must be an ISO 8601 date-time'
+    publisher.publish.assert_not_called()
+
+
+def test_no_event_schemas_by_default():
+    assert main.load_event_schemas('') == {}
+    assert main.check_event(make_event(data={'anything': True})) is None
+
+
+def test_invalid_schemas_file(tmp_path):
+    path = tmp_path / 'schemas.json'
+    path.write_text(json.dumps({'order.placed': 'not a schema'}))
+    with pytest.raises(ValueError):
+        main.load_event_schemas(str(path))
+
+
+def test_data_is_checked_against_its_event_type(order_schemas):
+    assert main.check_event(make_event()) is None
+    error = main.check_event(make_event(data={'order_id': 'o1'}))
+    assert error.startswith('Invalid data for order.placed:')
+    assert 'amount' in error
+    assert main.check_event(make_event(data={'order_id': 'o1', 'amount': 0})) is not None
+    # Types without a schema get envelope checks only
+    assert main.check_event(make_event(event_type='page.viewed', data={})) is None
+
+
+def test_unknown_event_types_can_be_rejected(order_schemas):
+    with patch.object(main, 'REJECT_UNKNOWN_TYPES', True):
+        assert main.check_event(make_event(event_type='page.viewed')) == \
+            'Unknown event_type: page.viewed'
+        assert main.check_event(make_event()) is None